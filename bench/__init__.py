@@ -0,0 +1,45 @@
+"""Micro-benchmarks for maya.  These run on any platform with a C library: foreign functions are taken from libc
+through CFUNCTYPE rather than from the Windows DLLs.
+
+Run a benchmark as a module from the repository root, e.g. ``python -m bench.helperfunc``.  ``python -m bench.suite``
+runs the marshalling cases together, and can save them as a baseline and gate later runs against it.
+"""
+import timeit
+import tracemalloc
+from ctypes import CDLL
+
+
+libc = CDLL(None)
+
+
+def measure(stmt, number=20000, repeat=5):
+    """Best per-call time of `stmt`, in microseconds.  If `number` is None, it is chosen so that each timing takes
+    at least 0.2 seconds.
+    """
+    timer = timeit.Timer(stmt)
+    if number is None:
+        number = timer.autorange()[0]
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def allocated(fn, number=100):
+    """Peak bytes allocated while making one call of fn, as seen by tracemalloc"""
+    fn()
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(number):
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    return min(peaks)
+
+
+def report(title, results, unit="us"):
+    """Print a table of (label, value) results"""
+    print(title)
+    for label, value in results:
+        print("    {0:<40} {1:>10.3f} {2}".format(label, value, unit))
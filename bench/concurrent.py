@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""HelperFunc.call_many against sequential calls, for a foreign function that blocks.  ctypes releases the GIL
+during the call, so N calls on N threads should take about the time of one.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import *
+
+from bench import libc, measure, report
+from maya.ctypeshelper import HelperFunc, InParam, set_executor
+
+
+def make_usleep():
+    func = HelperFunc(CFUNCTYPE, "usleep", libc, c_int)
+    func.params = [
+        InParam(c_uint, "usec")
+    ]
+    return func
+
+
+def bench_concurrent(count=8, usec=10000):
+    func = make_usleep()
+    args = [(usec,)] * count
+    results = [("sequential", measure(lambda: [func(*a) for a in args], number=5) / 1000)]
+    for workers in (2, count):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            set_executor(executor)
+            try:
+                results.append(("call_many, {0} threads".format(workers),
+                                measure(lambda: func.call_many(args), number=5) / 1000))
+            finally:
+                set_executor(None)
+    report("{0} x usleep({1}), wall time".format(count, usec), results, unit="ms")
+    return results
+
+
+if __name__ == "__main__":
+    bench_concurrent()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""dict2struct with compiled per-class plans against the reflective walk it replaced"""
+from ctypes import Structure, Union
+
+from bench import measure, report
+from bench.resolve import FIXED_TOKEN_PRIVILEGES
+from maya.ctypeshelper import RawParam, dict2struct
+from maya.winapi.types import TOKEN_PRIVILEGES
+
+
+def reflective_dict2struct(d, cls):
+    """The original implementation, kept as the baseline"""
+    x = cls()
+    for name, typ in cls._fields_:
+        t = RawParam.get_base_type(typ)
+        if issubclass(t, Union) or issubclass(t, Structure):
+            setattr(x, name, reflective_dict2struct(d[name], t))
+        elif 'Array' in typ.__class__.__name__:
+            if issubclass(typ._type_, Structure):
+                arr = getattr(x, name)
+                for i in range(len(d[name])):
+                    arr[i] = reflective_dict2struct(d[name][i], typ._type_)
+            else:
+                setattr(x, name, typ(*d[name]))
+        else:
+            setattr(x, name, typ(d[name]))
+    return x
+
+
+def privileges(count):
+    return {
+        'PrivilegeCount': count,
+        'Privileges': [{'Luid': bytes([i, 0, 0, 0, 0, 0, 0, 0]), 'Attributes': 2} for i in range(count)]
+    }
+
+
+def bench_dict2struct():
+    results = []
+    for count in (1, 64):
+        d = privileges(count)
+        results.append(("reflective, 64-entry, {0} privileges".format(count),
+                        measure(lambda: reflective_dict2struct(d, FIXED_TOKEN_PRIVILEGES), number=2000)))
+        results.append(("compiled, 64-entry, {0} privileges".format(count),
+                        measure(lambda: dict2struct(d, FIXED_TOKEN_PRIVILEGES), number=2000)))
+        results.append(("compiled, counted, {0} privileges".format(count),
+                        measure(lambda: dict2struct(d, TOKEN_PRIVILEGES), number=2000)))
+    report("dict2struct(TOKEN_PRIVILEGES)", results)
+    return results
+
+
+if __name__ == "__main__":
+    bench_dict2struct()
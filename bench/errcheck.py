@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""HelperFunc.errcheck resolving only the returned parameters against the resolve-everything version it replaced"""
+from ctypes import *
+
+from bench import libc, measure, report
+from maya.ctypeshelper import HelperFunc, InParam, OutParam, RawParam, ReturnOutParam, resolve, view
+
+
+def legacy_errcheck(result, func, args):
+    """The original implementation, kept as the baseline"""
+    obj = func.object
+    ret = []
+    d = dict([(x.name, y) for x, y in zip(obj.params, args)])
+    d['_unions_'] = {}
+    for p, a in zip(obj.params, args):
+        val = a
+        while hasattr(val, "contents"):
+            val = val.contents
+        if issubclass(RawParam.get_base_type(val.__class__), Union):
+            d['_unions_'][p.name] = p.switch_is
+    if not d['_unions_']:
+        del d['_unions_']
+    resolved = view(d) if obj.lazy else resolve(d)
+    for x in obj.params:
+        if 'Return' in x.__class__.__name__:
+            ret.append(resolved[x.name])
+    return ret
+
+
+class LegacyFunc(HelperFunc):
+    errcheck = staticmethod(legacy_errcheck)
+
+
+def make_strtol(cls):
+    func = cls(CFUNCTYPE, "strtol", libc, c_long)
+    func.params = [
+        InParam(c_char_p, "nptr"),
+        ReturnOutParam(POINTER(c_char_p), "endptr", lambda: pointer(c_char_p())),
+        InParam(c_int, "base", lambda: 10)
+    ]
+    return func
+
+
+def make_getresuid(cls):
+    # Two of the three ids are returned
+    func = cls(CFUNCTYPE, "getresuid", libc, c_int)
+    func.params = [
+        ReturnOutParam(POINTER(c_uint), "ruid", lambda: pointer(c_uint())),
+        ReturnOutParam(POINTER(c_uint), "euid", lambda: pointer(c_uint())),
+        OutParam(POINTER(c_uint), "suid", lambda: pointer(c_uint()))
+    ]
+    return func
+
+
+def bench_errcheck():
+    results = []
+    for label, make, args in (("strtol", make_strtol, (b"1234x",)), ("getresuid", make_getresuid, ())):
+        legacy, func = make(LegacyFunc), make(HelperFunc)
+        assert legacy(*args) == func(*args)
+        results.append(("{0}, resolve every parameter".format(label), measure(lambda: legacy(*args))))
+        results.append(("{0}, resolve returned parameters".format(label), measure(lambda: func(*args))))
+    report("HelperFunc call via CFUNCTYPE", results)
+    return results
+
+
+if __name__ == "__main__":
+    bench_errcheck()
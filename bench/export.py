@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Throughput and memory of the streaming inventory export, against building every record before writing.
+
+The host is simulated: osinfo's Kernel32 and Advapi32 are replaced by Python objects serving 2,000 processes with
+20 modules and 4 threads each, 50,000 records in all, so what's measured is the pipeline and the serialization.
+Peak memory is the peak of tracemalloc during the export; the peak RSS of the whole run, which only grows, is
+reported after each case.
+"""
+import json
+import resource
+import time
+import tracemalloc
+from unittest import mock
+
+from bench import report
+from maya.winapi.types import TokenInformationClass
+from maya.winutils import export, osinfo, security
+
+
+class SimulatedHost:
+    """Toolhelp32 and tokens for `processes` processes, each with `modules` modules and `threads` threads"""
+    def __init__(self, processes=2000, modules=20, threads=4):
+        self.pids = [4 * (i + 2) for i in range(processes)]
+        self.modules = modules
+        self.threads = threads
+        self.snapshots = []
+        self.cursors = {}
+
+    def CreateToolhelp32Snapshot(self, flags, pid=0):
+        self.snapshots.append(pid)
+        return len(self.snapshots)
+
+    def CloseHandle(self, handle):
+        self.cursors.pop(handle, None)
+
+    def _process_entries(self, handle):
+        for pid in self.pids:
+            yield {'th32ProcessID': pid, 'th32ParentProcessID': 4, 'szExeFile': b"process%d.exe" % (pid % 97),
+                   'cntThreads': self.threads, 'dwFlags': 0}
+
+    def _thread_entries(self, handle):
+        for pid in self.pids:
+            for i in range(self.threads):
+                yield {'th32ThreadID': pid * 100 + i, 'th32OwnerProcessID': pid, 'dwFlags': 0}
+
+    def _module_entries(self, handle):
+        pid = self.snapshots[handle - 1]
+        for i in range(self.modules):
+            name = b"module%d.dll" % i
+            yield {'szModule': name, 'modBaseAddr': 0x7ff800000000 + 0x100000 * i, 'modBaseSize': 0x80000,
+                   'th32ProcessID': pid, 'szExePath': b"C:\\Windows\\System32\\" + name, 'hModule': i}
+
+    def _first(entries):
+        def first(self, handle, lazy=False):
+            self.cursors[handle] = entries(self, handle)
+            return self._next(handle)
+        return first
+
+    def _next(self, handle, lazy=False):
+        entry = next(self.cursors[handle], None)
+        if entry is None:
+            raise OSError(18, "No more files")
+        return entry
+
+    Process32First, Thread32First, Module32First = (_first(_process_entries), _first(_thread_entries),
+                                                    _first(_module_entries))
+    Process32Next = Thread32Next = Module32Next = _next
+
+    def OpenProcess(self, pid, access):
+        return ("process", pid)
+
+    def GetProcessTimes(self, handle):
+        return handle[1] * 10, 0, 0, 0
+
+    def OpenProcessToken(self, handle, access):
+        return ("token", handle[1])
+
+    def GetTokenInformation(self, handle, info_class, lazy=False):
+        if info_class == TokenInformationClass.TokenUser:
+            return {'User': {'Sid': b"user%d" % (handle[1] % 5), 'Attributes': 0}}
+        return 1
+
+    def ConvertSidToStringSidW(self, sid):
+        return "S-1-5-21-" + sid.decode()
+
+    def LookupAccountSidW(self, sid, system=None):
+        return sid.decode(), "DOMAIN", 1
+
+
+class NullStream:
+    """A text stream that counts what's written to it"""
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, s):
+        self.chars += len(s)
+
+
+def streamed(format):
+    return lambda: export.export(NullStream(), format=format)
+
+
+def materialized():
+    """Collect every record, then serialize them all"""
+    with osinfo.Snapshot() as snap:
+        records = list(export.inventory(snap))
+    text = "".join(json.dumps(r, separators=(',', ':')) + "\n" for r in records)
+    NullStream().write(text)
+    return len(records)
+
+
+def run(fn):
+    """(records, records per second, peak bytes traced, peak RSS in bytes).  The export is traced first, and then
+    timed without tracing, which slows it down.
+    """
+    osinfo.handle_cache.clear()
+    security.accounts.clear()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    osinfo.handle_cache.clear()
+    security.accounts.clear()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    return count, count / elapsed, peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def bench_export():
+    host = SimulatedHost()
+    patches = [mock.patch.object(osinfo, "Kernel32", host), mock.patch.object(osinfo, "Advapi32", host),
+               mock.patch.object(security, "Advapi32", host)]
+    for patch in patches:
+        patch.start()
+    try:
+        # The streaming cases run first, since the peak RSS never goes down
+        cases = [("NDJSON, streamed", streamed("ndjson")), ("CSV, streamed", streamed("csv")),
+                 ("NDJSON, built then written", materialized)]
+        results = [(name, run(fn)) for name, fn in cases]
+    finally:
+        for patch in reversed(patches):
+            patch.stop()
+    count = results[0][1][0]
+    report("Records per second, {0} records".format(count), [(name, r[1]) for name, r in results], "rows/s")
+    report("Peak traced memory", [(name, r[2] / 2 ** 20) for name, r in results], "MiB")
+    report("Peak RSS after each case", [(name, r[3] / 2 ** 20) for name, r in results], "MiB")
+    return results
+
+
+if __name__ == "__main__":
+    bench_export()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Per-call overhead of HelperFunc.__call__ with and without the cached foreign function"""
+from ctypes import *
+
+from bench import libc, measure, report
+from maya.ctypeshelper import HelperFunc, InParam, ReturnOutParam
+
+
+class timeval(Structure):
+    _fields_ = [
+        ("tv_sec", c_long),
+        ("tv_usec", c_long)
+    ]
+
+
+def make_gettimeofday():
+    func = HelperFunc(CFUNCTYPE, "gettimeofday", libc, c_int)
+    func.params = [
+        ReturnOutParam(POINTER(timeval), "tv", lambda: pointer(timeval())),
+        InParam(c_void_p, "tz", lambda: None)
+    ]
+    return func
+
+
+def bench_helperfunc():
+    func = make_gettimeofday()
+    raw = CFUNCTYPE(c_int, POINTER(timeval), c_void_p)(("gettimeofday", libc))
+
+    def uncached():
+        # Reassigning params drops the bound function, which is what every call used to pay for
+        func.params = func.params
+        return func()
+
+    results = [
+        ("raw ctypes call", measure(lambda: raw(pointer(timeval()), None))),
+        ("HelperFunc, rebound every call", measure(uncached)),
+        ("HelperFunc, cached", measure(func)),
+    ]
+    report("gettimeofday via CFUNCTYPE", results)
+    return results
+
+
+if __name__ == "__main__":
+    bench_helperfunc()
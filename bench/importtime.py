@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Import cost of maya.winutils.osinfo, measured with ``python -X importtime`` in fresh interpreters, and the cost
+that binding defers to the first call.
+
+DLLs are replaced by a stub loader, so this runs anywhere.  Importing must not load any DLL.  Bytecode is cached
+in a temporary directory and warmed up first, so compilation isn't counted.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench import report
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import maya.winutils.osinfo
+
+import sys
+import time
+from ctypes import CFUNCTYPE, c_int
+from maya.ctypeshelper import LazyLibrary
+from maya.winapi import advapi32, functions, kernel32, ntdll
+
+libraries = [x for m in (advapi32, kernel32, ntdll) for x in vars(m).values() if isinstance(x, LazyLibrary)]
+assert libraries and all(lib._lib is None for lib in libraries), libraries
+
+# Every function of the stub DLLs succeeds
+succeed = CFUNCTYPE(c_int)(lambda: 1)
+
+
+class StubLibrary:
+    def __getattr__(self, name):
+        return succeed
+
+
+loads = []
+
+
+def loader(name):
+    loads.append(name)
+    return StubLibrary()
+
+
+functions.set_loader(loader)
+for label in ("first", "second"):
+    start = time.perf_counter()
+    kernel32.Kernel32.CloseHandle(1)
+    print("{0} {1}".format(label, (time.perf_counter() - start) * 1e6), file=sys.stderr)
+assert loads == ["kernel32"], loads
+"""
+
+
+def run(prefix):
+    """Run the script once, returning {name: time in us}"""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-X", "pycache_prefix=" + prefix, "-c", SCRIPT],
+                          cwd=ROOT, env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:"):
+            self_us, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+        else:
+            label, value = line.split()
+            times[label] = float(value)
+    return times
+
+
+def bench_importtime(repeat=10):
+    with tempfile.TemporaryDirectory() as prefix:
+        run(prefix)
+        runs = [run(prefix) for _ in range(repeat)]
+    results = [
+        ("import maya.winutils.osinfo", min(r["maya.winutils.osinfo"] for r in runs)),
+        ("  of which ctypes", min(r["ctypes"] for r in runs)),
+        ("first call, loads DLL and binds", min(r["first"] for r in runs)),
+        ("second call", min(r["second"] for r in runs)),
+    ]
+    report("Import time, best of {0}".format(repeat), results)
+    return results
+
+
+if __name__ == "__main__":
+    bench_importtime()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""HelperFunc.map against a Python loop over HelperFunc.__call__"""
+from ctypes import *
+
+from bench import libc, measure, report
+from maya.ctypeshelper import HelperFunc, InParam, ReturnOutParam
+
+
+def make_strtol():
+    func = HelperFunc(CFUNCTYPE, "strtol", libc, c_long)
+    func.params = [
+        InParam(c_char_p, "nptr"),
+        ReturnOutParam(POINTER(c_char_p), "endptr", lambda: pointer(c_char_p())),
+        InParam(c_int, "base", lambda: 10)
+    ]
+    return func
+
+
+def bench_map(count=1000):
+    func = make_strtol()
+    numbers = [str(i).encode() + b"x" for i in range(count)]
+    results = [
+        ("loop over __call__", measure(lambda: [func(x) for x in numbers], number=50) / count),
+        ("map", measure(lambda: list(func.map(numbers)), number=50) / count),
+    ]
+    report("strtol via CFUNCTYPE, per item over {0} items".format(count), results)
+    return results
+
+
+if __name__ == "__main__":
+    bench_map()
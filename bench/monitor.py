@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""The cost of one ProcessMonitor tick against re-enumerating every Process and comparing the sets.
+
+The DLLs are replaced by the recorded snapshot of bench.processes, so each tick pays for the foreign calls of the
+enumeration, and the marshalling around them.  Nothing changes between ticks, which is the common case.  The
+comparison alone is also measured over rows that are already enumerated, since the enumeration costs the same
+either way.
+"""
+from bench import allocated, measure, report
+from bench.processes import RecordedSystem, record
+from maya.winapi import functions
+from maya.winutils.osinfo import Process, ProcessMonitor, Snapshot, snapshot_rows, system_process_rows
+
+
+def rebuild(previous):
+    """What a polling loop did before: every Process made afresh, and the pid sets compared"""
+    with Snapshot() as snap:
+        current = {proc.pid: proc for proc in snap.processes}
+    started = [current[pid] for pid in current.keys() - previous.keys()]
+    exited = [previous[pid] for pid in previous.keys() - current.keys()]
+    return current, started, exited
+
+
+def compare(rows, previous):
+    """The part of rebuild after the enumeration"""
+    current = {row.pid: Process(row.pid, name=row.name, parent_pid=row.parent_pid) for row in rows}
+    started = [current[pid] for pid in current.keys() - previous.keys()]
+    exited = [previous[pid] for pid in previous.keys() - current.keys()]
+    return current, started, exited
+
+
+def bench_monitor(count=5000):
+    system = RecordedSystem(record(count))
+    functions.set_loader(lambda name: system)
+    previous = rebuild({})[0]
+    toolhelp = ProcessMonitor()
+    toolhelp.poll()
+    native = ProcessMonitor(system_process_rows)
+    native.poll()
+    cases = [
+        ("Re-enumerate Process objects", lambda: rebuild(previous)),
+        ("ProcessMonitor, Toolhelp32", toolhelp.poll),
+        ("ProcessMonitor, NtQuerySystemInformation", native.poll),
+    ]
+    rows = snapshot_rows()
+    recorded = ProcessMonitor(lambda: rows)
+    recorded.poll()
+    cases += [
+        ("Compare only, Process objects", lambda: compare(rows, previous)),
+        ("Compare only, ProcessMonitor", recorded.poll),
+    ]
+    report("One tick over {0} processes".format(count), [(name, measure(fn, number=10)) for name, fn in cases])
+    report("Allocated per tick", [(name, allocated(fn, number=5) / 1024) for name, fn in cases], "KiB")
+
+
+if __name__ == "__main__":
+    bench_monitor()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Changing several privileges of a token in one AdjustTokenPrivileges call, against the loop that looked up each
+privilege and adjusted it on its own.
+
+advapi32 is replaced by a stub loader whose functions are ctypes callbacks over a simulated token, so each path pays
+for the foreign calls it makes, and the marshalling around them.
+"""
+from ctypes import *
+from ctypes.wintypes import BOOL, DWORD, HANDLE
+
+from bench import measure, report
+from maya.ctypeshelper import var_sizeof
+from maya.winapi import functions
+from maya.winapi.advapi32 import Advapi32
+from maya.winapi.types import LUID, LUID_AND_ATTRIBUTES, TOKEN_PRIVILEGES
+from maya.winutils import security
+from maya.winutils.osinfo import Token
+
+
+ERROR_INSUFFICIENT_BUFFER = 122
+
+
+class SimulatedToken:
+    """LookupPrivilegeValueW and AdjustTokenPrivileges over a token holding every known privilege"""
+    def __init__(self):
+        self.luids = {name.lower(): i + 2 for i, name in enumerate(security.PRIVILEGE_NAMES)}
+        self.privileges = dict.fromkeys(self.luids.values(), 0)
+        self.CloseHandle = CFUNCTYPE(BOOL, HANDLE)(lambda handle: 1)
+        self.LookupPrivilegeValueW = CFUNCTYPE(BOOL, c_void_p, c_wchar_p, POINTER(LUID))(self.lookup)
+        self.AdjustTokenPrivileges = CFUNCTYPE(BOOL, HANDLE, BOOL, POINTER(TOKEN_PRIVILEGES), DWORD, c_void_p,
+                                               POINTER(DWORD))(self.adjust)
+
+    def lookup(self, system, name, luid):
+        memmove(luid, security.int_to_luid(self.luids[name.lower()]), sizeof(LUID))
+        return 1
+
+    def adjust(self, handle, disable_all, new_state, length, previous, needed):
+        count = new_state[0].PrivilegeCount
+        entries = (LUID_AND_ATTRIBUTES * count).from_address(addressof(new_state[0].Privileges))
+        needed[0] = var_sizeof(TOKEN_PRIVILEGES, count)
+        if length < needed[0]:
+            set_errno(ERROR_INSUFFICIENT_BUFFER)
+            return 0
+        out = TOKEN_PRIVILEGES.from_address(previous)
+        out.PrivilegeCount = count
+        old = (LUID_AND_ATTRIBUTES * count).from_address(addressof(out.Privileges))
+        for i, entry in enumerate(entries):
+            key = security.luid_to_int(bytes(entry.Luid))
+            old[i].Luid = entry.Luid
+            old[i].Attributes = self.privileges[key]
+            self.privileges[key] = entry.Attributes
+        return 1
+
+
+def one_at_a_time(token, names):
+    """How enable_privilege used to work: a lookup and an adjustment for each privilege"""
+    for name in names:
+        Advapi32.AdjustTokenPrivileges(token, {
+            'PrivilegeCount': 1,
+            'Privileges': [{'Luid': Advapi32.LookupPrivilegeValueW(name), 'Attributes': 2}]
+        })
+
+
+def bench_privileges():
+    results = []
+    system = SimulatedToken()
+    functions.set_loader(lambda name: system)
+    token = Token(1)
+    for count in (1, 4, 16):
+        names = security.PRIVILEGE_NAMES[:count]
+        results.append(("One call per privilege, {0} privileges".format(count),
+                        measure(lambda: one_at_a_time(1, names), number=2000)))
+        results.append(("adjust_privileges, {0} privileges".format(count),
+                        measure(lambda: token.adjust_privileges(enable=names), number=2000)))
+    report("Enabling privileges", results)
+    return results
+
+
+if __name__ == "__main__":
+    bench_privileges()
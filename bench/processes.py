@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Process enumeration with one NtQuerySystemInformation call against a Toolhelp32 call per process.
+
+Both paths run over the same recorded snapshot: the DLLs are replaced by a stub loader whose functions are ctypes
+callbacks, so each path pays for the foreign calls it makes, and the marshalling around them.
+"""
+from ctypes import *
+
+from bench import measure, report
+from maya.winapi import functions
+from maya.winapi.ntdll import SYSTEM_PROCESS_INFORMATION
+from maya.winapi.types import PROCESSENTRY32
+from maya.winutils.osinfo import ERROR_NO_MORE_FILES, Snapshot, system_processes
+
+
+STATUS_INFO_LENGTH_MISMATCH = c_long(functions.STATUS_INFO_LENGTH_MISMATCH).value
+
+
+def record(count):
+    """A snapshot of `count` processes: [(pid, name, parent pid, threads)]"""
+    names = ["svchost.exe", "explorer.exe", "RuntimeBroker.exe", "conhost.exe", "a much longer process name.exe"]
+    return [(4 * i, names[i % len(names)], 4 * (i // 2), i % 40 + 1) for i in range(1, count + 1)]
+
+
+class RecordedSystem:
+    """The functions of kernel32 and ntdll that enumerate processes, over a recorded snapshot"""
+    def __init__(self, processes):
+        self.entries = []
+        for pid, name, parent, threads in processes:
+            entry = PROCESSENTRY32(dwSize=sizeof(PROCESSENTRY32), th32ProcessID=pid, th32ParentProcessID=parent,
+                                   cntThreads=threads, szExeFile=name.encode())
+            self.entries.append(bytes(entry))
+        # The list NtQuerySystemInformation fills in, with each name pointer kept as an offset until it's copied
+        self.names = []
+        blob = bytearray()
+        for i, (pid, name, parent, threads) in enumerate(processes):
+            text = bytes(create_unicode_buffer(name))
+            size = (sizeof(SYSTEM_PROCESS_INFORMATION) + len(text) + 7) & ~7
+            info = SYSTEM_PROCESS_INFORMATION(NextEntryOffset=size if i < len(processes) - 1 else 0,
+                                              NumberOfThreads=threads, UniqueProcessId=pid,
+                                              InheritedFromUniqueProcessId=parent, HandleCount=threads * 10)
+            info.ImageName.Length = len(text) - sizeof(c_wchar)
+            info.ImageName.MaximumLength = len(text)
+            name_pointer = SYSTEM_PROCESS_INFORMATION.ImageName.offset + type(info.ImageName).Buffer.offset
+            self.names.append((len(blob) + name_pointer, len(blob) + sizeof(info)))
+            blob += bytes(info) + text
+            blob += bytes(size - sizeof(info) - len(text))
+        self.blob = bytes(blob)
+        self.position = 0
+
+        self.CreateToolhelp32Snapshot = CFUNCTYPE(c_void_p, c_ulong, c_ulong)(lambda flags, pid: 1)
+        self.CloseHandle = CFUNCTYPE(c_int, c_void_p)(lambda handle: 1)
+        self.Process32First = CFUNCTYPE(c_int, c_void_p, c_void_p)(self.process32first)
+        self.Process32Next = CFUNCTYPE(c_int, c_void_p, c_void_p)(self.process32next)
+        self.ZwQuerySystemInformation = CFUNCTYPE(c_long, c_ulong, c_void_p, c_ulong, POINTER(c_ulong))(self.query)
+
+    def process32first(self, snapshot, entry):
+        self.position = 0
+        return self.process32next(snapshot, entry)
+
+    def process32next(self, snapshot, entry):
+        if self.position == len(self.entries):
+            # Read back by WinError
+            set_errno(ERROR_NO_MORE_FILES)
+            return 0
+        memmove(entry, self.entries[self.position], sizeof(PROCESSENTRY32))
+        self.position += 1
+        return 1
+
+    def query(self, info_class, buffer, length, needed):
+        needed[0] = len(self.blob)
+        if length < len(self.blob):
+            return STATUS_INFO_LENGTH_MISMATCH
+        memmove(buffer, self.blob, len(self.blob))
+        for pointer_offset, text_offset in self.names:
+            c_void_p.from_address(buffer + pointer_offset).value = buffer + text_offset
+        return 0
+
+
+def toolhelp():
+    with Snapshot() as snap:
+        return list(snap.processes)
+
+
+def bench_processes():
+    results = []
+    for count in (50, 300, 1000):
+        # The declarations are bound to the callbacks of the system they load, so each count gets a new one
+        system = RecordedSystem(record(count))
+        functions.set_loader(lambda name: system)
+        assert [p.pid for p in toolhelp()] == [p.pid for p in system_processes()]
+        results.append(("Toolhelp32, {0} processes".format(count), measure(toolhelp, number=20)))
+        results.append(("NtQuerySystemInformation, {0} processes".format(count),
+                        measure(lambda: list(system_processes()), number=20)))
+    report("Enumerating every process", results)
+    return results
+
+
+if __name__ == "__main__":
+    bench_processes()
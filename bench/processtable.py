@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""The memory held by a ProcessTable against a list of Process objects, and the cost of queries on each.
+
+The rows are synthetic: 100,000 processes with a few hundred distinct image names, each started by an earlier one.
+Memory is what tracemalloc sees still allocated once the structure is built, with every index of the table built.
+"""
+import gc
+import tracemalloc
+
+from bench import measure, report
+from maya.winutils.osinfo import Process, ProcessRow, ProcessTable
+
+
+def synthetic(count):
+    return [ProcessRow(4 * i, 4 * (i // 3), b"image%d.exe" % (i % 300), i % 40 + 1, 132000000000000000 + i, None)
+            for i in range(1, count + 1)]
+
+
+def retained(fn):
+    """Bytes still allocated by fn() once it returns, and its result"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        return tracemalloc.get_traced_memory()[0] - before, result
+    finally:
+        tracemalloc.stop()
+
+
+def build_table(rows):
+    table = ProcessTable(rows)
+    table.index(4)
+    table.by_name("image1.exe")
+    table.children(0)
+    return table
+
+
+def bench_processtable(count=100000):
+    rows = synthetic(count)
+    objects_size, processes = retained(lambda: [Process(row.pid, name=row.name, parent_pid=row.parent_pid,
+                                                        creation_time=row.creation_time) for row in rows])
+    table_size, table = retained(lambda: build_table(rows))
+    report("Memory held for {0} processes".format(count), [
+        ("list of Process", objects_size / 2 ** 20),
+        ("ProcessTable, with its indexes", table_size / 2 ** 20),
+    ], "MiB")
+
+    pid = 4 * (count // 2)
+
+    def scan_children():
+        return [p for p in processes if p.parent_pid == pid]
+
+    def scan_name():
+        return [p for p in processes if p.name.lower() == "image7.exe"]
+
+    assert [p.pid for p in scan_children()] == [table.pid[i] for i in table.children(table.index(pid))]
+    assert len(scan_name()) == len(table.by_name("image7.exe"))
+    report("Queries over {0} processes".format(count), [
+        ("Build ProcessTable", measure(lambda: build_table(rows), number=1, repeat=3)),
+        ("Children of a pid, scanning Process objects", measure(scan_children, number=5)),
+        ("Children of a pid, ProcessTable", measure(lambda: table.children(table.index(pid)), number=20000)),
+        ("Processes of an image, scanning Process objects", measure(scan_name, number=5)),
+        ("Processes of an image, ProcessTable", measure(lambda: table.by_name("image7.exe"), number=2000)),
+        ("Process tree, ProcessTable", measure(lambda: sum(1 for _ in table.walk()), number=1, repeat=3)),
+    ])
+
+
+if __name__ == "__main__":
+    bench_processtable()
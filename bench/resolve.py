@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""resolve() through the per-type resolver registry against the recursive hasattr chain it replaced"""
+from ctypes import Array, Structure, Union, pointer
+
+from bench import measure, report
+from maya.ctypeshelper import RawParam, dict2struct, resolve, struct2dict
+from maya.winapi.types import DWORD, LUID_AND_ATTRIBUTES, TOKEN_PRIVILEGES, TokenInformationClass
+
+
+class FIXED_TOKEN_PRIVILEGES(Structure):
+    """TOKEN_PRIVILEGES as it was declared before it became variable-length"""
+    _fields_ = [
+        ("PrivilegeCount", DWORD),
+        ("Privileges", LUID_AND_ATTRIBUTES * 64)
+    ]
+
+
+class FixedTokenInformation(Union):
+    _map_ = {TokenInformationClass.TokenPrivileges: "TokenPrivileges"}
+    _fields_ = [("TokenPrivileges", FIXED_TOKEN_PRIVILEGES)]
+
+
+def recursive_resolve(cval):
+    """The original implementation, kept as the baseline"""
+    def resolve_union(cval, switch):
+        if hasattr(cval.__class__, "_map_"):
+            which = cval._map_[switch]
+            return recursive_resolve(getattr(cval, which))
+        else:
+            return cval
+
+    if hasattr(cval, "value"):
+        return cval.value
+    elif hasattr(cval, "contents"):
+        return recursive_resolve(cval.contents)
+    elif isinstance(cval, Array):
+        if issubclass(cval._type_, Structure):
+            return list(map(recursive_resolve, cval[:]))
+        else:
+            return bytes(cval[:])
+    elif isinstance(cval, dict) or isinstance(cval, Structure):
+        if isinstance(cval, Structure):
+            cval = struct2dict(cval)
+        f = {}
+        for name, value in cval.items():
+            if name == '_unions_':
+                continue
+            val = value
+            while hasattr(val, "contents"):
+                val = val.contents
+            cls = RawParam.get_base_type(val.__class__)
+            if issubclass(cls, Union):
+                if '_unions_' in cval:
+                    f[cval['_unions_'][name]] = recursive_resolve(cval[cval['_unions_'][name]])
+                    f[name] = resolve_union(val, f[cval['_unions_'][name]])
+                else:
+                    f[name] = cval[name]
+            else:
+                f[name] = recursive_resolve(cval[name])
+        return f
+    else:
+        return cval
+
+
+def token_privileges():
+    info = FixedTokenInformation()
+    privileges = info.TokenPrivileges
+    privileges.PrivilegeCount = 3
+    for i in range(3):
+        privileges.Privileges[i].Luid[0] = i + 1
+        privileges.Privileges[i].Attributes = 2
+    return info
+
+
+def bench_resolve():
+    info = token_privileges()
+    params = {
+        'TokenInformationClass': TokenInformationClass.TokenPrivileges,
+        'TokenInformation': pointer(info),
+        '_unions_': {'TokenInformation': 'TokenInformationClass'}
+    }
+    assert recursive_resolve(params) == resolve(params)
+    privileges = info.TokenPrivileges
+    # The same three privileges in the variable-length declaration, which only decodes the entries in use
+    counted = dict2struct({'Privileges': resolve(privileges)['Privileges'][:3]}, TOKEN_PRIVILEGES)
+    assert resolve(counted)['Privileges'] == resolve(privileges)['Privileges'][:3]
+    results = [
+        ("recursive, 64-entry TOKEN_PRIVILEGES", measure(lambda: recursive_resolve(privileges), number=1000)),
+        ("registry, 64-entry TOKEN_PRIVILEGES", measure(lambda: resolve(privileges), number=1000)),
+        ("registry, counted TOKEN_PRIVILEGES", measure(lambda: resolve(counted), number=1000)),
+        ("recursive, GetTokenInformation params", measure(lambda: recursive_resolve(params), number=1000)),
+        ("registry, GetTokenInformation params", measure(lambda: resolve(params), number=1000)),
+    ]
+    report("resolve(TOKEN_PRIVILEGES holding 3 privileges)", results)
+    return results
+
+
+if __name__ == "__main__":
+    bench_resolve()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""The marshalling benchmark suite, with a regression gate.
+
+Each case is timed (per-call latency) and traced for allocations (peak bytes per call).  The cases are timed in
+turn over several rounds, and each keeps the median of its rounds, so that a burst of load on the machine during
+one round doesn't move the result.  Results can be saved as a JSON baseline, and later runs compared against it:
+the run fails if any case got slower, or allocates more, than the thresholds allow.  Timings are only comparable on
+the same machine, so record the baseline there::
+
+    python -m bench.suite --save baseline.json          # on the reference tree
+    python -m bench.suite --compare baseline.json       # on the change; exits with 1 on a regression
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import timeit
+from ctypes import pointer, sizeof
+
+from bench import allocated, measure, report
+from bench.errcheck import make_getresuid, make_strtol
+from bench.helperfunc import make_gettimeofday
+from bench.resolve import token_privileges
+from maya.ctypeshelper import HelperFunc, dict2struct, resolve, struct2dict, view
+from maya.winapi.types import PROCESSENTRY32, TOKEN_PRIVILEGES, TokenInformationClass
+
+
+def cases():
+    """Return [(name, fn)]"""
+    fixed = token_privileges()
+    privileges = {
+        'PrivilegeCount': 3,
+        'Privileges': [{'Luid': bytes([i, 0, 0, 0, 0, 0, 0, 0]), 'Attributes': 2} for i in range(3)]
+    }
+    counted = dict2struct(privileges, TOKEN_PRIVILEGES)
+    process = {
+        'dwSize': sizeof(PROCESSENTRY32), 'cntUsage': 0, 'th32ProcessID': 4, 'th32DefaultHeapID': None,
+        'th32ModuleID': 0, 'cntThreads': 120, 'th32ParentProcessID': 0, 'pcPriClassBase': 8, 'dwFlags': 0,
+        'szExeFile': b"System"
+    }
+    entry = dict2struct(process, PROCESSENTRY32)
+    params = {
+        'TokenInformationClass': TokenInformationClass.TokenPrivileges,
+        'TokenInformation': pointer(fixed),
+        '_unions_': {'TokenInformation': 'TokenInformationClass'}
+    }
+
+    def read_view():
+        proc = view(entry)
+        return proc['th32ProcessID'], proc['szExeFile']
+
+    gettimeofday = make_gettimeofday()
+    strtol = make_strtol(HelperFunc)
+    getresuid = make_getresuid(HelperFunc)
+    numbers = [str(i).encode() + b"x" for i in range(100)]
+    return [
+        ("dict2struct, TOKEN_PRIVILEGES", lambda: dict2struct(privileges, TOKEN_PRIVILEGES)),
+        ("dict2struct, PROCESSENTRY32", lambda: dict2struct(process, PROCESSENTRY32)),
+        ("struct2dict, PROCESSENTRY32", lambda: struct2dict(entry)),
+        ("resolve, PROCESSENTRY32", lambda: resolve(entry)),
+        ("resolve, TOKEN_PRIVILEGES", lambda: resolve(counted)),
+        ("resolve, 64 nested structures", lambda: resolve(fixed.TokenPrivileges)),
+        ("resolve, union parameters", lambda: resolve(params)),
+        ("view, PROCESSENTRY32, 2 fields", read_view),
+        ("call, gettimeofday", gettimeofday),
+        ("call, strtol", lambda: strtol(b"1234x")),
+        ("call, getresuid", getresuid),
+        ("map, strtol x100", lambda: list(strtol.map(numbers))),
+    ]
+
+
+def run(rounds=7):
+    """Run every case, returning {name: {"us": latency, "bytes": peak allocation}}.  The latency is the median of
+    `rounds` timings, each of enough calls to take at least 0.2 seconds.
+    """
+    all_cases = cases()
+    numbers = dict((name, timeit.Timer(fn).autorange()[0]) for name, fn in all_cases)
+    timings = dict((name, []) for name, fn in all_cases)
+    # Round by round rather than case by case, so that a slow spell is shared out instead of landing on one case
+    for _ in range(rounds):
+        for name, fn in all_cases:
+            timings[name].append(measure(fn, number=numbers[name], repeat=1))
+    return dict((name, {"us": statistics.median(timings[name]), "bytes": allocated(fn)}) for name, fn in all_cases)
+
+
+def compare(baseline, results, threshold, alloc_threshold, alloc_slack=64):
+    """Return the names of the cases that regressed against the baseline, and print the comparison"""
+    regressions = []
+    print("{0:<36} {1:>10} {2:>10} {3:>8} {4:>10} {5:>10}".format("", "base us", "us", "", "base B", "B"))
+    for name, new in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print("{0:<36} {1:>10} {2:>10.3f} {3:>8} {4:>10} {5:>10}".format(name, "-", new["us"], "new", "-",
+                                                                             new["bytes"]))
+            continue
+        slower = new["us"] > old["us"] * (1 + threshold)
+        # Small absolute changes in allocations are noise from the interpreter's own bookkeeping
+        bigger = new["bytes"] > old["bytes"] * (1 + alloc_threshold) and new["bytes"] - old["bytes"] > alloc_slack
+        change = (new["us"] - old["us"]) / old["us"] if old["us"] else 0
+        flag = " SLOWER" if slower else ""
+        flag += " ALLOCATES MORE" if bigger else ""
+        print("{0:<36} {1:>10.3f} {2:>10.3f} {3:>+7.0%} {4:>10} {5:>10}{6}".format(name, old["us"], new["us"],
+                                                                                  change, old["bytes"],
+                                                                                  new["bytes"], flag))
+        if slower or bigger:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Marshalling micro-benchmarks for maya.ctypeshelper")
+    parser.add_argument("--save", metavar="FILE", help="write the results to FILE as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="fail if the results regress against the baseline FILE")
+    parser.add_argument("--threshold", type=float, default=0.30,
+                        help="allowed increase in latency, as a fraction (default: 0.30)")
+    parser.add_argument("--alloc-threshold", type=float, default=0.10,
+                        help="allowed increase in allocated bytes, as a fraction (default: 0.10)")
+    parser.add_argument("--rounds", type=int, default=7,
+                        help="timings per case; the median is kept (default: 7)")
+    args = parser.parse_args(argv)
+
+    results = run(args.rounds)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version, "platform": platform.platform(), "results": results}, f, indent=2,
+                      sort_keys=True)
+    if not args.compare:
+        report("Latency per call", [(name, r["us"]) for name, r in results.items()])
+        report("Peak allocation per call", [(name, r["bytes"]) for name, r in results.items()], unit="bytes")
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(baseline, results, args.threshold, args.alloc_threshold)
+    if regressions:
+        print("{0} regression(s): {1}".format(len(regressions), ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""How many GetTokenInformation calls a token inspection makes, with the Token information cache and without it.
+
+advapi32 is replaced by a stub loader whose GetTokenInformation is a ctypes callback counting its calls, and filling
+in the structures as Windows does, so the calls that remain also pay for the marshalling.  The workload is what a
+process inventory does with each token: compare the user, read the session, check a few privileges and list the
+groups.
+"""
+from collections import Counter
+from ctypes import *
+from ctypes.wintypes import BOOL, DWORD, HANDLE
+
+from bench import measure, report
+from maya.winapi import functions
+from maya.winapi.advapi32 import Advapi32
+from maya.winapi.types import (SID_AND_ATTRIBUTES, TOKEN_GROUPS, TOKEN_PRIVILEGES, TOKEN_USER, LUID_AND_ATTRIBUTES,
+                               TokenInformationClass)
+from maya.winutils import osinfo, security
+
+
+ERROR_INSUFFICIENT_BUFFER = 122
+SIDS = [bytes([1, 2, 0, 0, 0, 0, 0, 5, 32, 0, 0, 0]) + rid.to_bytes(4, 'little') for rid in (1001, 545, 513)]
+PRIVILEGES = ["SeShutdownPrivilege", "SeChangeNotifyPrivilege", "SeUndockPrivilege", "SeTimeZonePrivilege"]
+
+
+class CountingAdvapi32:
+    """GetTokenInformation over one token, counting the calls for each information class"""
+    def __init__(self):
+        self.calls = Counter()
+        self.GetTokenInformation = CFUNCTYPE(BOOL, HANDLE, DWORD, c_void_p, DWORD, POINTER(DWORD))(self.query)
+        self.CloseHandle = CFUNCTYPE(BOOL, HANDLE)(lambda handle: 1)
+
+    def query(self, handle, info_class, buffer, length, needed):
+        self.calls[info_class] += 1
+        sids = []
+        if info_class == TokenInformationClass.TokenUser:
+            header, sids = sizeof(TOKEN_USER), SIDS[:1]
+        elif info_class == TokenInformationClass.TokenGroups:
+            sids = SIDS[1:]
+            header = sizeof(TOKEN_GROUPS) + sizeof(SID_AND_ATTRIBUTES) * (len(sids) - 1)
+        elif info_class == TokenInformationClass.TokenPrivileges:
+            header = sizeof(TOKEN_PRIVILEGES) + sizeof(LUID_AND_ATTRIBUTES) * (len(PRIVILEGES) - 1)
+        else:
+            header = sizeof(DWORD)
+        # The SIDs follow the structure
+        needed[0] = header + sum(len(sid) for sid in sids)
+        if length < needed[0]:
+            set_errno(ERROR_INSUFFICIENT_BUFFER)
+            return 0
+        memset(buffer, 0, needed[0])
+        if info_class == TokenInformationClass.TokenUser:
+            user = TOKEN_USER.from_address(buffer)
+            memmove(buffer + header, SIDS[0], len(SIDS[0]))
+            c_void_p.from_address(addressof(user.User)).value = buffer + header
+        elif info_class == TokenInformationClass.TokenGroups:
+            groups = TOKEN_GROUPS.from_address(buffer)
+            groups.GroupCount = len(sids)
+            entries = (SID_AND_ATTRIBUTES * len(sids)).from_address(addressof(groups.Groups))
+            offset = header
+            for entry, sid in zip(entries, sids):
+                memmove(buffer + offset, sid, len(sid))
+                c_void_p.from_address(addressof(entry)).value = buffer + offset
+                entry.Attributes = 7
+                offset += len(sid)
+        elif info_class == TokenInformationClass.TokenPrivileges:
+            privileges = TOKEN_PRIVILEGES.from_address(buffer)
+            privileges.PrivilegeCount = len(PRIVILEGES)
+            entries = (LUID_AND_ATTRIBUTES * len(PRIVILEGES)).from_address(addressof(privileges.Privileges))
+            for i, entry in enumerate(entries):
+                memmove(entry.Luid, security.int_to_luid(19 + i), sizeof(entry.Luid))
+        return 1
+
+
+class UncachedToken(osinfo.Token):
+    """Token as it was before the cache: only the user and groups were kept, and the session unless it was 0"""
+    def __init__(self, hToken):
+        super().__init__(hToken)
+        self._user = self._groups = self._session_id = None
+
+    @property
+    def user(self):
+        if not self._user:
+            user = Advapi32.GetTokenInformation(self._hToken, TokenInformationClass.TokenUser)
+            self._user = osinfo.Principal(sid=user['User']['Sid'])
+        return self._user
+
+    @property
+    def session_id(self):
+        if not self._session_id:
+            self._session_id = Advapi32.GetTokenInformation(self._hToken, TokenInformationClass.TokenSessionId)
+        return self._session_id
+
+    @property
+    def groups(self):
+        if self._groups is None:
+            groups = Advapi32.GetTokenInformation(self._hToken, TokenInformationClass.TokenGroups)
+            self._groups = [osinfo.Group(osinfo.Principal(sid=g['Sid']), g['Attributes']) for g in groups['Groups']]
+        return self._groups
+
+    @property
+    def privileges(self):
+        privileges = Advapi32.GetTokenInformation(self._hToken, TokenInformationClass.TokenPrivileges)
+        return osinfo._privileges(privileges)
+
+
+def inspect(token):
+    token.user.binary_sid
+    token.session_id
+    for name in PRIVILEGES[1:]:
+        any(p.name == name for p in token.privileges)
+    [g.principal.binary_sid for g in token.groups]
+    token.session_id
+
+
+def prefetched(token):
+    token.prefetch(TokenInformationClass.TokenUser, TokenInformationClass.TokenSessionId,
+                   TokenInformationClass.TokenPrivileges, TokenInformationClass.TokenGroups)
+    inspect(token)
+
+
+def bench_token(tokens=100):
+    stub = CountingAdvapi32()
+    functions.set_loader(lambda name: stub)
+    for i, name in enumerate(PRIVILEGES):
+        security.privileges._add(name, 19 + i)
+    cases = [
+        ("Without the cache", lambda: inspect(UncachedToken(1))),
+        ("Token", lambda: inspect(osinfo.Token(1))),
+        ("Token, prefetched", lambda: prefetched(osinfo.Token(1))),
+    ]
+    counts = []
+    for name, fn in cases:
+        stub.calls.clear()
+        for _ in range(tokens):
+            fn()
+        counts.append((name, sum(stub.calls.values()) / tokens))
+    report("GetTokenInformation calls per token", counts, "calls")
+    report("Inspecting a token", [(name, measure(fn, number=2000)) for name, fn in cases])
+
+
+if __name__ == "__main__":
+    bench_token()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Reading a few fields of a result through StructView against resolving the whole structure"""
+from ctypes import pointer, sizeof
+
+from bench import allocated, measure, report
+from maya.ctypeshelper import resolve, view
+from maya.winapi.types import PROCESSENTRY32, TokenInformation, TokenInformationClass
+
+
+def bench_views():
+    entry = pointer(PROCESSENTRY32(dwSize=sizeof(PROCESSENTRY32), th32ProcessID=4, szExeFile=b"System"))
+
+    def read(resolver):
+        def fn():
+            proc = resolver(entry)
+            return proc['th32ProcessID'], proc['szExeFile'], proc['th32ParentProcessID'], proc['dwFlags']
+        return fn
+
+    info = pointer(TokenInformation())
+    params = {
+        'TokenInformationClass': TokenInformationClass.TokenUser,
+        'TokenInformation': info,
+        '_unions_': {'TokenInformation': 'TokenInformationClass'}
+    }
+
+    def user(resolver):
+        return lambda: resolver(params)['TokenInformation']['User']['Sid']
+
+    cases = (("PROCESSENTRY32, 4 fields, resolve", read(resolve)),
+             ("PROCESSENTRY32, 4 fields, view", read(view)),
+             ("TOKEN_USER Sid, resolve", user(resolve)),
+             ("TOKEN_USER Sid, view", user(view)))
+    times = [(label, measure(fn, number=5000)) for label, fn in cases]
+    sizes = [(label, allocated(fn)) for label, fn in cases]
+    report("Eager and lazy results, time per call", times)
+    report("Eager and lazy results, peak allocation per call", sizes, unit="bytes")
+    return times + sizes
+
+
+if __name__ == "__main__":
+    bench_views()
@@ -2,30 +2,194 @@
 
 """
 
-from _ctypes import Array
-from ctypes import Structure, Union
+from _ctypes import Array, _Pointer, _SimpleCData
+from collections.abc import Mapping, Sequence
+from ctypes import CDLL, Structure, Union, addressof, alignment, c_char, c_char_p, c_ubyte, c_void_p, c_wchar, \
+    c_wchar_p, cast, create_string_buffer, create_unicode_buffer, pointer, sizeof
+from operator import attrgetter
+from time import perf_counter
+import threading
+import weakref
 
 
 def dict2struct(d, cls):
-    x = cls()
-    for name, typ in cls._fields_:
-        t = RawParam.get_base_type(typ)
-        if issubclass(t, Union) or issubclass(t, Structure):
-            setattr(x, name, dict2struct(d[name], t))
-        elif 'Array' in typ.__class__.__name__:
-            if issubclass(typ._type_, Structure):
-                lst = []
-                arr = getattr(x, name)
-                for i in range(len(d[name])):
-                    arr[i] = dict2struct(d[name][i], typ._type_)
-                #setattr(x, name, *lst)
-            else:
-                setattr(x, name, typ(*d[name]))
-        else:
-            setattr(x, name, typ(d[name]))
+    """Convert a dictionary into a new instance of the structure (or union) `cls`.  Nested dictionaries and lists
+    are converted to the nested structures and arrays described by `cls._fields_`.
+    """
+    if hasattr(cls, '_count_'):
+        # Make room for every entry given for the counted array
+        name, count_name = _counted_field(cls)
+        x = var_struct(cls, len(d[name]))
+    else:
+        x = cls()
+    _filler(cls)(x, d)
     return x
 
 
+#
+# Variable-length structures end in an array declared with a single element (ANYSIZE_ARRAY) whose real length
+# is held in a header field.  They name the array and its count field in `_count_`, as in
+#
+#   _count_ = {"Privileges": "PrivilegeCount"}
+#
+# and are then decoded and filled at their real length, reading the entries past the declared end of the
+# structure.
+#
+def _counted_field(cls):
+    """Return (array name, count name) for the variable-length structure `cls`"""
+    counts = getattr(cls, '_count_', None)
+    if not counts or len(counts) != 1:
+        raise ValueError("{0} must declare exactly one counted array in _count_".format(cls.__name__))
+    return next(iter(counts.items()))
+
+
+def var_sizeof(cls, count):
+    """Return the size in bytes of the variable-length structure `cls` when its counted array holds `count`
+    entries.
+    """
+    name, count_name = _counted_field(cls)
+    elem = dict(cls._fields_)[name]._type_
+    size = getattr(cls, name).offset + count * sizeof(elem)
+    align = alignment(cls)
+    return max(sizeof(cls), (size + align - 1) // align * align)
+
+
+def var_struct(cls, count):
+    """Return a zeroed instance of the variable-length structure `cls` with room for `count` entries.  The count
+    field is not set.
+    """
+    return cls.from_buffer((c_ubyte * var_sizeof(cls, count))())
+
+
+def _counted_array(typ, name):
+    """Return a function that reads the counted array field `name` from an instance of `typ` at its real length"""
+    count_name = typ._count_[name]
+    elem = dict(typ._fields_)[name]._type_
+    offset = getattr(typ, name).offset
+
+    def get(cval, count=None):
+        if count is None:
+            count = getattr(cval, count_name)
+        arr = (elem * count).from_address(addressof(cval) + offset)
+        # The array is built over the structure's memory, so it must keep the structure alive
+        arr._owner = cval
+        return arr
+    return get
+
+
+_fillers = {}
+
+
+def _filler(cls):
+    """Return the function that copies a dictionary into an existing instance of `cls`.
+
+    The function is compiled from `cls._fields_` the first time `cls` is seen, so the reflection over field types
+    happens once per class rather than once per conversion.
+    """
+    try:
+        return _fillers[cls]
+    except KeyError:
+        pass
+    counts = getattr(cls, '_count_', {})
+    count_names = dict((v, k) for k, v in counts.items())
+    setters = tuple(_compile_counted_setter(cls, name, typ) if name in counts else
+                    _compile_count_setter(name, count_names[name]) if name in count_names else
+                    _compile_setter(name, typ) for name, typ in cls._fields_)
+    if issubclass(cls, Union):
+        # Only one member of a union is meaningful, so only set the members we were given
+        def fill(x, d):
+            for name, setter in setters:
+                if name in d:
+                    setter(x, d)
+    else:
+        def fill(x, d):
+            for name, setter in setters:
+                setter(x, d)
+    _fillers[cls] = fill
+    return fill
+
+
+def _compile_setter(name, typ):
+    """Build the (name, setter) pair that copies d[name] into the field `name` of a structure"""
+    base = RawParam.get_base_type(typ)
+    if base is not typ:
+        # Pointer field.  The filler is looked up at call time, as a structure may point to its own type
+        def set_pointer(x, d):
+            v = d[name]
+            if isinstance(v, dict) and issubclass(base, (Structure, Union)):
+                v = pointer(dict2struct(v, base))
+            elif isinstance(v, base):
+                v = pointer(v)
+            setattr(x, name, v)
+        return name, set_pointer
+    if issubclass(typ, (Structure, Union)):
+        fill = _filler(typ)
+
+        # Nested structures are filled in place
+        def set_struct(x, d):
+            fill(getattr(x, name), d[name])
+        return name, set_struct
+    if issubclass(typ, Array):
+        elem = typ._type_
+        if issubclass(elem, (Structure, Union)):
+            fill_elem = _filler(elem)
+
+            def set_struct_array(x, d):
+                arr = getattr(x, name)
+                for i, item in enumerate(d[name]):
+                    fill_elem(arr[i], item)
+            return name, set_struct_array
+        if elem in (c_char, c_wchar):
+            # Character array fields take bytes and str directly
+            def set_string(x, d):
+                setattr(x, name, d[name])
+            return name, set_string
+
+        # Primitive arrays are copied into the existing field rather than through a temporary array
+        def set_array(x, d):
+            v = d[name]
+            getattr(x, name)[:len(v)] = v
+        return name, set_array
+
+    def set_value(x, d):
+        setattr(x, name, d[name])
+    return name, set_value
+
+
+def _compile_counted_setter(cls, name, typ):
+    """Build the (name, setter) pair that copies d[name] into the counted array `name`, past the declared end of
+    the structure if needed.
+    """
+    get_array = _counted_array(cls, name)
+    elem = typ._type_
+    if issubclass(elem, (Structure, Union)):
+        fill_elem = _filler(elem)
+
+        def set_struct_array(x, d):
+            v = d[name]
+            arr = get_array(x, len(v))
+            for i, item in enumerate(v):
+                fill_elem(arr[i], item)
+        return name, set_struct_array
+
+    def set_array(x, d):
+        v = d[name]
+        get_array(x, len(v))[:] = v
+    return name, set_array
+
+
+def _compile_count_setter(name, array_name):
+    """Build the (name, setter) pair for the count of a counted array, which is the array's length.  A count given
+    along with the array must agree with it, as the structure only has room for the entries given.
+    """
+    def set_count(x, d):
+        count = len(d[array_name])
+        if name in d and d[name] != count:
+            raise ValueError("{0} is {1}, but {2} has {3} entries".format(name, d[name], array_name, count))
+        setattr(x, name, count)
+    return name, set_count
+
+
 def struct2dict(cval):
     if not isinstance(cval, Structure):
         raise ValueError("Must be a structure")
@@ -37,59 +201,342 @@ def struct2dict(cval):
     return d
 
 
+_CDATA_TYPES = (_SimpleCData, _Pointer, Array, Structure, Union)
+
+
 def resolve(cval):
     """Given a ctypes value (cval), convert all values into types and values
     meaningful to Python.
     :param cval: Ctypes value to resolve
     :return: python type
     """
-    def resolve_union(cval, switch):
-        if hasattr(cval.__class__, "_map_"):
-            which = cval._map_[switch]
-            return resolve(getattr(cval, which))
+    if isinstance(cval, dict):
+        # If it's a dict, we got this from an errcheck call using parameters instead of a structure
+        return _resolve_params(cval, False)
+    return get_resolver(cval.__class__)(cval)
+
+
+def view(cval):
+    """Like :func:`resolve`, but structures are returned as read-only :class:`StructView` mappings that decode
+    each field from the underlying buffer only when it is read.  The views keep `cval` alive.
+    :param cval: Ctypes value to resolve
+    :return: python type, or a view
+    """
+    if isinstance(cval, dict):
+        return _resolve_params(cval, True)
+    return get_resolver(cval.__class__, lazy=True)(cval)
+
+
+def _resolve_params(d, lazy):
+    unions = d.get('_unions_', {})
+    f = {}
+    for name, value in d.items():
+        if name == '_unions_':
+            continue
+        if name in unions:
+            switch = resolve(d[unions[name]])
+            f[unions[name]] = switch
+            f[name] = get_union_resolver(value.__class__, lazy)(value, switch)
         else:
+            f[name] = get_resolver(value.__class__, lazy)(value)
+    return f
+
+
+#
+# Resolvers are built once per ctypes type and cached, so resolving a value is a straight pass over
+# precomputed field accessors instead of probing every value for "value", "contents", and so on.
+#
+_resolvers = {}
+_view_resolvers = {}
+_union_resolvers = {}
+
+
+def register_resolver(typ, fn):
+    """Use fn(cval) to resolve and view instances of the ctypes type `typ`, instead of the generated resolver"""
+    _resolvers[typ] = _view_resolvers[typ] = fn
+
+
+def get_resolver(typ, lazy=False):
+    """Return the function that converts an instance of `typ` into native Python types.  If `lazy` is set,
+    structures are converted to :class:`StructView` instead of dictionaries.
+    """
+    cache = _view_resolvers if lazy else _resolvers
+    try:
+        return cache[typ]
+    except KeyError:
+        pass
+    fn = _compile_view(typ) if lazy else _compile_resolver(typ)
+    cache[typ] = fn
+    return fn
+
+
+def get_union_resolver(typ, lazy=False):
+    """Return the function fn(cval, switch) that resolves the member of a union selected by `switch` through the
+    union's `_map_`.  `typ` may be the union itself or a pointer to it.
+    """
+    try:
+        return _union_resolvers[typ, lazy]
+    except KeyError:
+        pass
+    if issubclass(typ, _Pointer):
+        target = get_union_resolver(typ._type_, lazy)
+
+        def fn(cval, switch):
+            return target(cval.contents, switch)
+    elif hasattr(typ, "_map_"):
+        fields = dict(typ._fields_)
+        members = dict((switch, _field_getter(name, fields[name], lazy)) for switch, name in typ._map_.items())
+
+        def fn(cval, switch):
+            get = members.get(switch)
+            if get is None:
+                # Not a member we know how to interpret
+                return cval
+            return get(cval)
+    else:
+        def fn(cval, switch):
             return cval
+    _union_resolvers[typ, lazy] = fn
+    return fn
 
-    if hasattr(cval, "value"):             # basic type
-        return cval.value
-    elif hasattr(cval, "contents"):        # pointer type
-        ret = resolve(cval.contents)
-        return ret
-    elif isinstance(cval, Array):
-        if issubclass(cval._type_, Structure):
-            return list(map(resolve, cval[:]))
+
+def _identity(cval):
+    return cval
+
+
+def _value(cval):
+    return cval.value
+
+
+def _is_fundamental(typ):
+    """ctypes converts fundamental types (but not subclasses of them) to Python values on attribute access"""
+    return issubclass(typ, _SimpleCData) and _SimpleCData in typ.__bases__
+
+
+def _pointer_resolver(typ, lazy):
+    target = typ._type_
+    resolve_target = None
+
+    def resolve_pointer(cval):
+        nonlocal resolve_target
+        if not cval:
+            return None
+        if resolve_target is None:
+            # Looked up late, since a structure may point to its own type
+            resolve_target = get_resolver(target, lazy)
+        return resolve_target(cval.contents)
+    return resolve_pointer
+
+
+def _compile_resolver(typ):
+    if not issubclass(typ, _CDATA_TYPES):
+        # Already a native Python value
+        return _identity
+    if issubclass(typ, _SimpleCData):
+        return _value
+    if issubclass(typ, _Pointer):
+        return _pointer_resolver(typ, False)
+    if issubclass(typ, Array):
+        elem = typ._type_
+        if elem in (c_char, c_wchar):
+            # Strings, up to the terminating NUL
+            return _value
+        if sizeof(elem) == 1 and issubclass(elem, _SimpleCData):
+            return bytes
+        if _is_fundamental(elem):
+            return list
+        resolve_elem = get_resolver(elem)
+        return lambda cval: [resolve_elem(x) for x in cval]
+    if issubclass(typ, Structure):
+        getters = _struct_getters(typ, False)
+
+        def resolve_struct(cval):
+            return {name: get(cval) for name, get in getters}
+        return resolve_struct
+    # Unions can't be resolved without knowing which member is valid
+    return _identity
+
+
+def _compile_view(typ):
+    if issubclass(typ, _Pointer):
+        return _pointer_resolver(typ, True)
+    if issubclass(typ, Structure):
+        return StructView
+    if issubclass(typ, Array) and issubclass(typ._type_, (Structure, Union, Array, _Pointer)):
+        return ArrayView
+    # Everything else is cheap enough to decode right away
+    return get_resolver(typ)
+
+
+def _struct_getters(typ, lazy):
+    """Return ((name, getter), ...) for the fields of the structure `typ`"""
+    unions = getattr(typ, '_unions_', {})
+    counts = getattr(typ, '_count_', {})
+    fields = dict(typ._fields_)
+    getters = []
+    for name, ftyp in typ._fields_:
+        if name in counts:
+            getters.append((name, _counted_getter(typ, name, lazy)))
+        elif name in unions and issubclass(RawParam.get_base_type(ftyp), Union):
+            switch = unions[name]
+            getters.append((name, _union_getter(name, ftyp, _field_getter(switch, fields[switch]), lazy)))
         else:
-            return bytes(cval[:])
-    elif isinstance(cval, dict) or isinstance(cval, Structure):
-        # If it's a dict, we got this from an errcheck call using parameters instead of a structure
-        if isinstance(cval, Structure):
-            # Map structure to dict just to ease maintenance
-            cval = struct2dict(cval)
-        f = {}
-        for name, value in cval.items():
-            if name == '_unions_':
-                continue
-            val = value
-            while hasattr(val, "contents"):
-                val = val.contents
-            cls = RawParam.get_base_type(val.__class__)
-            if issubclass(cls, Union):
-                if '_unions_' in cval:
-                    f[cval['_unions_'][name]] = resolve(cval[cval['_unions_'][name]])
-                    f[name] = resolve_union(val, f[cval['_unions_'][name]])
-                else:
-                    f[name] = cval[name]
-            else:
-                f[name] = resolve(cval[name])
-        return f
-    else:
-        return cval
+            getters.append((name, _field_getter(name, ftyp, lazy)))
+    return tuple(getters)
+
+
+def _field_getter(name, typ, lazy=False):
+    """Return a function that reads and resolves the field `name`, of type `typ`, from a structure"""
+    if _is_fundamental(typ):
+        return attrgetter(name)
+    if issubclass(typ, Array) and typ._type_ in (c_char, c_wchar):
+        # Character arrays come back from attribute access as bytes or str
+        return attrgetter(name)
+    if issubclass(RawParam.get_base_type(typ), Union):
+        # A union without a switch is returned as is
+        return attrgetter(name)
+    r = get_resolver(typ, lazy)
+
+    def get(cval):
+        return r(getattr(cval, name))
+    return get
+
+
+def _counted_getter(typ, name, lazy=False):
+    """Return a function that reads and resolves the counted array `name` at its real length"""
+    get_array = _counted_array(typ, name)
+    # Array resolvers don't depend on the length, so the one for the declared array will do
+    r = get_resolver(dict(typ._fields_)[name], lazy)
+
+    def get(cval):
+        return r(get_array(cval))
+    return get
+
+
+def _union_getter(name, typ, get_switch, lazy=False):
+    r = get_union_resolver(typ, lazy)
+
+    def get(cval):
+        return r(getattr(cval, name), get_switch(cval))
+    return get
+
+
+_view_getters = {}
+_missing = object()
+
+
+class StructView(Mapping):
+    """A read-only mapping over a ctypes structure.  Fields are decoded straight from the structure's buffer the
+    first time they are read, and cached.  Nested structures and arrays of structures are views themselves.
+
+    The view holds a reference to the structure, so the buffer stays valid for as long as the view is in use.
+    """
+    __slots__ = ('_cval', '_getters', '_cache')
+
+    def __init__(self, cval):
+        typ = cval.__class__
+        try:
+            getters = _view_getters[typ]
+        except KeyError:
+            getters = _view_getters[typ] = dict(_struct_getters(typ, True))
+        self._cval = cval
+        self._getters = getters
+        self._cache = {}
+
+    def __getitem__(self, name):
+        # Most fields are read once, so a miss is the common case and mustn't cost an exception
+        value = self._cache.get(name, _missing)
+        if value is _missing:
+            value = self._cache[name] = self._getters[name](self._cval)
+        return value
+
+    def __iter__(self):
+        return iter(self._getters)
+
+    def __len__(self):
+        return len(self._getters)
+
+    def __repr__(self):
+        return "{0}({1})".format(self.__class__.__name__, self._cval.__class__.__name__)
+
+    @property
+    def buffer(self):
+        """A read-only memoryview over the raw bytes of the structure"""
+        return memoryview(self._cval).cast('B').toreadonly()
+
+    def materialize(self):
+        """Fully resolve the structure into dictionaries and lists, as :func:`resolve` does"""
+        return resolve(self._cval)
+
+
+class ArrayView(Sequence):
+    """A read-only sequence over a ctypes array whose elements are decoded on first access, and cached"""
+    __slots__ = ('_cval', '_resolve', '_cache')
+
+    _missing = object()
+
+    def __init__(self, cval):
+        self._cval = cval
+        self._resolve = get_resolver(cval._type_, lazy=True)
+        self._cache = [self._missing] * len(cval)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[x] for x in range(*i.indices(len(self._cache)))]
+        if i < 0:
+            i += len(self._cache)
+        value = self._cache[i]
+        if value is self._missing:
+            value = self._cache[i] = self._resolve(self._cval[i])
+        return value
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __repr__(self):
+        return "{0}({1})".format(self.__class__.__name__, self._cval.__class__.__name__)
+
+    def materialize(self):
+        """Fully resolve the array into a list, as :func:`resolve` does"""
+        return resolve(self._cval)
 
 
 class AutoStructure(Structure):
     pass
 
 
+class LazyLibrary:
+    """A shared library that is loaded the first time a function is looked up in it.  Declaring functions on a
+    lazy library is free, and a program that never calls them never loads the library.
+
+    :param name: Name of the library, as given to `loader`
+    :param loader: loader(name) returning the loaded library.  Defaults to :class:`ctypes.CDLL`.
+    """
+    def __init__(self, name, loader=None):
+        self._name = name
+        self._loader = loader or CDLL
+        self._lib = None
+        # The functions bound to the loaded library
+        self._bound = weakref.WeakSet()
+
+    def __getattr__(self, attr):
+        lib = self._lib
+        if lib is None:
+            lib = self._lib = self._loader(self._name)
+        return getattr(lib, attr)
+
+    def unload(self):
+        """Forget the loaded library, so that it's loaded again, and its functions bound again, on the next call"""
+        self._lib = None
+        for func in list(self._bound):
+            func._fn = None
+        self._bound.clear()
+
+    def __repr__(self):
+        return "<{0} {1!r}, {2}>".format(self.__class__.__name__, self._name,
+                                          "loaded" if self._lib is not None else "not loaded")
+
+
 class RawParam:
     """A raw parameter that resolves to itself.  Useful for debugging
     and for one-off cases only.
@@ -102,6 +549,7 @@ class RawParam:
         self._param_type = ctype
         self._generate = generator
         self._should_return = should_return
+        self._switch_is = None
 
         if switch_is:
             typ = RawParam.get_base_type(ctype)
@@ -204,40 +652,219 @@ class ReturnInOutParam(ResolvedParam):
         super(self.__class__, self).__init__(name, 3, ctype, generator, True, switch_is=switch_is)
 
 
+class Histogram:
+    """Latencies counted in power-of-two buckets of nanoseconds: bucket n holds the samples under 2**n ns.  Not
+    synchronized: :class:`FunctionMetrics` adds to its histograms under its lock.
+    """
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * 48
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[min(int(seconds * 1e9).bit_length(), 47)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Upper bound, in seconds, of the bucket holding the `p` th percentile (0-100)"""
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100.0
+        seen = 0
+        for n, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(2 ** n / 1e9, self.max)
+        return self.max
+
+
+class FunctionMetrics:
+    """Call counts, errors by code, and the latency of each phase of the calls to one function:
+
+    * marshal: building the arguments, from the call until the foreign function is entered
+    * native: the foreign function itself
+    * resolve: checking the result, and converting the returned parameters to Python values
+
+    Calls may be made on several threads at once (see :meth:`HelperFunc.call_many`), so every update is made
+    holding :attr:`lock`.
+    """
+    __slots__ = ('name', 'calls', 'errors', 'marshal', 'native', 'resolve', 'lock')
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = {}        # winerror, errno, or exception class name -> count
+        self.marshal = Histogram()
+        self.native = Histogram()
+        self.resolve = Histogram()
+
+    def error(self, e):
+        code = getattr(e, "winerror", None)
+        if code is None:
+            code = getattr(e, "errno", None)
+        if code is None:
+            code = e.__class__.__name__
+        with self.lock:
+            self.errors[code] = self.errors.get(code, 0) + 1
+
+
+class Metrics:
+    """Per-function metrics of :class:`HelperFunc` calls, keyed by function name.  Collected while assigned to
+    :attr:`HelperFunc.metrics`, see :func:`enable_metrics`.
+    """
+    def __init__(self):
+        self._functions = {}
+
+    def function(self, name):
+        try:
+            return self._functions[name]
+        except KeyError:
+            # Another thread may be adding it too, and only one of them must be kept
+            return self._functions.setdefault(name, FunctionMetrics(name))
+
+    def __getitem__(self, name):
+        return self._functions[name]
+
+    def __iter__(self):
+        return iter(list(self._functions.values()))
+
+    def reset(self):
+        self._functions = {}
+
+    def table(self):
+        """Format the metrics as a text table, slowest functions first.  Times are in microseconds."""
+        lines = ["{0:<32} {1:>8} {2:>7} {3:>18} {4:>18} {5:>18}".format(
+            "function", "calls", "errors", "marshal mean/p99", "native mean/p99", "resolve mean/p99")]
+        for m in sorted(self, key=lambda m: m.marshal.total + m.native.total + m.resolve.total, reverse=True):
+            phases = ["{0:>8.1f}/{1:<9.1f}".format(h.mean * 1e6, h.percentile(99) * 1e6)
+                      for h in (m.marshal, m.native, m.resolve)]
+            lines.append("{0:<32} {1:>8} {2:>7} {3} {4} {5}".format(m.name, m.calls, sum(m.errors.values()),
+                                                                    *phases))
+        return "\n".join(lines)
+
+
+def enable_metrics(metrics=None):
+    """Start collecting metrics for every :class:`HelperFunc`, into `metrics` or a new :class:`Metrics`, which is
+    returned.
+    """
+    HelperFunc.metrics = metrics if metrics is not None else Metrics()
+    return HelperFunc.metrics
+
+
+def disable_metrics():
+    HelperFunc.metrics = None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def set_executor(executor):
+    """Run :meth:`HelperFunc.submit` and :meth:`HelperFunc.call_many` on `executor`, a
+    :class:`concurrent.futures.Executor`.  None goes back to the default thread pool.
+    """
+    global _executor
+    _executor = executor
+
+
+def get_executor():
+    """Return the executor for concurrent calls, creating the default thread pool on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Imported here, as concurrent.futures is slow to import and most programs never need it
+                from concurrent.futures import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(thread_name_prefix="maya")
+    return _executor
+
+
+class _Measured:
+    """Stands in for a bound function while metrics are collected, timing each phase of the calls made to it"""
+    __slots__ = ('fn', 'raw', 'stats', 'start')
+
+    def __init__(self, fn, raw, stats):
+        self.fn = fn
+        self.raw = raw
+        self.stats = stats
+        self.start = 0.0
+
+    def begin(self):
+        stats = self.stats
+        with stats.lock:
+            stats.calls += 1
+        self.start = perf_counter()
+
+    def __call__(self, *args):
+        stats = self.stats
+        t1 = perf_counter()
+        with stats.lock:
+            stats.marshal.add(t1 - self.start)
+        try:
+            result = self.raw(*args)
+        except Exception as e:
+            stats.error(e)
+            raise
+        t2 = perf_counter()
+        with stats.lock:
+            stats.native.add(t2 - t1)
+        try:
+            return self.fn.errcheck(result, self.fn, args)
+        except Exception as e:
+            stats.error(e)
+            raise
+        finally:
+            # A retry with bigger buffers marshals again from here
+            self.start = perf_counter()
+            with stats.lock:
+                stats.resolve.add(self.start - t2)
+
+
 class HelperFunc:
+    # Metrics collected for calls to every function.  None disables them.  See enable_metrics.
+    metrics = None
+    # Error codes (winerror, or errno) meaning a buffer given to the function was too small.  See sized_buffer.
+    insufficient_buffer = frozenset()
+    # How many times a call is retried with bigger buffers before giving up
+    max_resizes = 4
+
     def __init__(self, generator, name, module, ret):
         self._gen = generator
         self._name = name
         self._module = module
         self._rettype = ret
         self._params = ()       # These MUST not store any actual instance information
+        self._plan = ()
+        self._returns = ()
+        self._sizes = ()
+        self._fn = None
+        self._raw = None
+        self.lazy = False       # Return structures as StructView instead of dictionaries
 
     @staticmethod
     def errcheck(result, func, args):
         obj = func.object
+        lazy = obj.lazy
         ret = []
-        # Create dictionary of {name: cval}
-        d = dict([(x.name, y) for x, y in zip(obj.params, args)])
-        d['_unions_'] = {}
-        # For the return values to be meaningful, we have a few things to do:
-        # * drill down through pointers
-        # * resolve unions so that we return the right dictionary
-        for p, a in zip(obj.params, args):
-            val = a
-            while hasattr(val, "contents"):
-                val = val.contents
-            if issubclass(RawParam.get_base_type(val.__class__), Union):
-                d['_unions_'][p.name] = p.switch_is
-        if not d['_unions_']:
-            del d['_unions_']
-        # convert all return values to native python types
-        resolved = resolve(d)
-        # Return a list of values of the parameters with 'Return' in the class name
-        for x in obj.params:
-            if 'Return' in x.__class__.__name__:
-                # This becomes the dict
-                ret.append(resolved[x.name])
-        # Return only the parameters specified by the user
+        # Only the parameters the caller gets back are converted to native python types.  Unions are resolved
+        # to the member selected by their switch parameter.
+        for i, switch in obj._returns:
+            a = args[i]
+            if switch is None:
+                ret.append(get_resolver(a.__class__, lazy)(a))
+            else:
+                ret.append(get_union_resolver(a.__class__, lazy)(a, resolve(args[switch])))
         return ret
 
     @property
@@ -250,51 +877,341 @@ class HelperFunc:
         if not valid:
             raise ValueError("Only params are supported")
         self._params = tuple(value)
+        self._sizes = ()
+        # The bound function and call plan depend on the parameters, so they are rebuilt on the next call
+        self._fn = None
 
-    def __call__(self, *args, **kwargs):
+    def sized_buffer(self, buffer, length, needed=None, initial=None, allocate=None, key=None, fixed=None):
+        """Declare that the parameter `buffer` is a variable-length buffer whose size is passed in `length`.
+
+        Calls then allocate the buffer at the size that last worked, and if the function fails with one of the
+        :attr:`insufficient_buffer` errors, allocate exactly the size it reported and retry, even if that is
+        smaller.  The reported size is read from `needed`, or from `length` itself when it is an in/out pointer;
+        if neither holds a different size, the buffer is doubled.  Must be called after :attr:`params` is set.
+
+        When the buffer holds a union selected by a switch parameter (see `switch_is`), each value of the switch
+        keeps its own size, since information classes have nothing to do with each other's sizes.  Classes that
+        only accept one exact length are listed in `fixed`: they are always called with that length, and never
+        retried.
+
+        Sizes are in the natural unit of the buffer: characters for LPWSTR and LPSTR, bytes otherwise.
+
+        :param buffer: Name of the buffer parameter
+        :param length: Name of the parameter that carries the size of the buffer
+        :param needed: Name of the output parameter that receives the required size, if any
+        :param initial: Size of the first allocation.  Defaults to the size of the buffer's type if it points to
+            one; 0 probes with a NULL buffer.
+        :param allocate: allocate(size) returning the value to pass for `buffer`.  Defaults to a zeroed buffer of
+            the right type.
+        :param key: Name of the parameter whose value selects the size kept between calls.  Defaults to the
+            switch of the buffer, if it has one.
+        :param fixed: {value of `key`: the only length accepted} for the classes that aren't negotiated
+        """
+        names = [p.name for p in self._params]
+        i = names.index(buffer)
+        typ = self._params[i].param_type
+        if initial is None:
+            base = RawParam.get_base_type(typ)
+            initial = sizeof(base) if base is not typ else 0
+        if allocate is None:
+            allocate = _buffer_allocator(typ)
+        if key is None:
+            key = self._params[i].switch_is
+        if fixed and key is None:
+            raise ValueError("fixed sizes need a key parameter")
+        sizing = _SizedBuffer(i, names.index(length), self._params[names.index(length)].param_type,
+                              names.index(needed) if needed else None, allocate, initial,
+                              names.index(key) if key else None, fixed)
+        self._sizes += (sizing,)
+        self._fn = None
+
+    def _compile(self):
+        """Precompute everything a call needs from the parameter list.  This is done on the first call rather than
+        when the parameters are assigned, so declaring functions costs next to nothing at import.
+        """
+        plan = [self._compile_param(p) for p in self._params]
+        for sizing in self._sizes:
+            # The buffer and its length are always generated by the sizing, so skip their generators
+            for j in (sizing.buffer, sizing.length):
+                name, flags, generate, struct = plan[j]
+                plan[j] = (name, flags, _none, None)
+        self._plan = tuple(plan)
+        # (index, index of the union switch or None) for each parameter returned to the caller
+        names = [p.name for p in self._params]
+        self._returns = tuple((i, names.index(p.switch_is) if p.switch_is else None)
+                              for i, p in enumerate(self._params) if p.should_return)
+
+    @staticmethod
+    def _compile_param(p):
+        """Reduce a parameter to the (name, flags, generator, structure) tuple used on every call"""
+        generate = p.generate if p.has_generator else None
+        if p.flags & 3 == 2 and generate is None:
+            # Mirror ctypes, which creates an instance of the pointed-to type for bare output parameters
+            generate = p.param_type._type_
+        struct = RawParam.get_base_type(p.param_type)
+        if not issubclass(struct, Structure):
+            struct = None
+        return p.name, p.flags, generate, struct
+
+    def _bind(self):
+        """Build the prototype and bind the foreign function.  No paramflags are given to ctypes: defaults are
+        generated by :meth:`_map_args` on every call, so the bound function can be reused safely.
+
+        The module is anything that has the function as an attribute, such as a ctypes library, or an object
+        holding ctypes callbacks that stand in for the real functions.  Libraries are only loaded here, so a
+        :class:`LazyLibrary` is not loaded until one of its functions is first called.
+        """
+        self._compile()
         prototype = self._gen(self._rettype, *[x.param_type for x in self._params])
-        paramflags = []
-        for p in self._params:
-            if p.has_generator:
-                paramflags.append((p.flags, p.name, p.generate()))
-            else:
-                paramflags.append((p.flags, p.name))
-        fn = prototype((self._name, self._module), tuple(paramflags))
+        # Any object exposing the function as an attribute will do as the module, not only a loaded library
+        address = cast(getattr(self._module, self._name), c_void_p).value
+        fn = prototype(address)
+        # Without errcheck, so that metrics can time the foreign function apart from resolving its results
+        self._raw = prototype(address)
         # Link the object to the function so we can intelligently reason about
         # the output parameters post-execution
         fn.object = self
         retfunc = getattr(self, "errcheck", None)
         if retfunc:
             fn.errcheck = retfunc
+        if isinstance(self._module, LazyLibrary):
+            self._module._bound.add(self)
+        self._fn = fn
+        return fn
 
-        #
-        # Dictionaries must be converted to their associated structures.  Unfortunately,
-        # this is mildly irritating
-        #
-        def map_args(params, *args, **kwargs):
-            a = []
-            kw = {}
-            params = [(x.name, x) for x in params]
-            # Remove the number of params from args
-            for i in range(len(args)):
-                typ = RawParam.get_base_type(params[i][1].param_type)
-                if issubclass(typ, Structure):
-                    a.append(dict2struct(args[i], typ))
-                else:
-                    a.append(args[i])
-            params = dict(params[len(args):])
-            for k, v in kwargs.items():
-                typ = RawParam.get_base_type(params[k].param_type)
-                if issubclass(typ, Structure):
-                    kw[k] = dict2struct(v, typ)
-                else:
-                    kw[k] = v
-            return a, kw
+    def _map_args(self, args, kwargs):
+        """Build the full argument list for the foreign function, following the same rules as ctypes paramflags:
+        input parameters are taken positionally, then by name, then from their generator; output parameters
+        always come from their generator.  Dictionaries are converted to their associated structures.  Unknown
+        keyword arguments, and keywords repeating a positional argument, raise TypeError.
+        """
+        a = []
+        i = 0
+        used = 0
+        for name, flags, generate, struct in self._plan:
+            if flags & 3 == 2:
+                a.append(generate())
+                continue
+            if i < len(args):
+                value = args[i]
+                i += 1
+            elif name in kwargs:
+                value = kwargs[name]
+                used += 1
+            elif generate is not None:
+                value = generate()
+            else:
+                raise TypeError("{0}() missing required argument '{1}'".format(self._name, name))
+            if struct is not None and isinstance(value, dict):
+                value = dict2struct(value, struct)
+            a.append(value)
+        if i < len(args):
+            raise TypeError("{0}() takes {1} positional arguments but {2} were given".format(self._name, i,
+                                                                                           len(args)))
+        if used < len(kwargs):
+            self._unexpected(args, kwargs)
+        return a
 
-        a, kw = map_args(self._params, *args, **kwargs)
-        ret = fn(*a, **kw)
+    def _unexpected(self, args, kwargs):
+        """Raise TypeError for the keyword arguments that :meth:`_map_args` didn't take"""
+        inputs = [name for name, flags, generate, struct in self._plan if flags & 3 != 2]
+        for name in kwargs:
+            if name in inputs[:len(args)]:
+                raise TypeError("{0}() got multiple values for argument '{1}'".format(self._name, name))
+            if name not in inputs:
+                raise TypeError("{0}() got an unexpected keyword argument '{1}'".format(self._name, name))
+
+    @staticmethod
+    def _unwrap(ret):
         # TODO What happens when there are no output parameters???
         if (isinstance(ret, list) or isinstance(ret, tuple)) and len(ret) == 1:
             return ret[0]
         else:
             return ret
+
+    def _insufficient(self, e):
+        code = getattr(e, "winerror", None)
+        if code is None:
+            code = e.errno
+        return code is not None and code & 0xFFFFFFFF in self.insufficient_buffer
+
+    def _call_sized(self, fn, args, kwargs):
+        """Call a function with sized buffers, resizing them until the function accepts them"""
+        a = self._map_args(args, kwargs)
+        sizes = [s.size(a) for s in self._sizes]
+        # Exact lengths are not negotiated
+        retries = 0 if any(s.is_fixed(a) for s in self._sizes) else self.max_resizes
+        for attempt in range(retries + 1):
+            if attempt:
+                a = self._map_args(args, kwargs)
+            for s, size in zip(self._sizes, sizes):
+                s.apply(a, size)
+            try:
+                ret = fn(*a)
+            except OSError as e:
+                if attempt == retries or not self._insufficient(e):
+                    raise
+                resized = False
+                for i, s in enumerate(self._sizes):
+                    needed = s.needed(a)
+                    if needed and needed != sizes[i]:
+                        sizes[i] = needed
+                        resized = True
+                if not resized:
+                    sizes = [max(1, x) * 2 for x in sizes]
+                continue
+            for s, size in zip(self._sizes, sizes):
+                s.remember(a, max(size, s.needed(a)))
+            return self._unwrap(ret)
+
+    def __call__(self, *args, **kwargs):
+        fn = self._fn
+        if fn is None:
+            fn = self._bind()
+        if self.metrics is not None:
+            fn = _Measured(fn, self._raw, self.metrics.function(self._name))
+            fn.begin()
+        if self._sizes:
+            return self._call_sized(fn, args, kwargs)
+        return self._unwrap(fn(*self._map_args(args, kwargs)))
+
+    def submit(self, *args, **kwargs):
+        """Schedule a call of the function on the executor (see :func:`set_executor`), and return a
+        :class:`concurrent.futures.Future` for its result.
+
+        ctypes releases the GIL while the foreign function runs, so independent calls run concurrently.  Each call
+        generates its own arguments in the thread that makes it, so no buffer is shared between threads.
+        """
+        return get_executor().submit(self, *args, **kwargs)
+
+    def call_many(self, iterable, return_exceptions=False):
+        """Call the function once for each tuple of positional arguments in `iterable`, concurrently on the executor,
+        and return the list of results in the same order.
+
+        :param iterable: Tuples of positional arguments
+        :param return_exceptions: If set, an exception raised by one call is put in its place in the results.
+            Otherwise the first exception, in argument order, is raised once all the calls are done.
+        """
+        executor = get_executor()
+        futures = [executor.submit(self, *args) for args in iterable]
+        results = []
+        error = None
+        for future in futures:
+            e = future.exception()
+            if e is None:
+                results.append(future.result())
+            elif return_exceptions:
+                results.append(e)
+            elif error is None:
+                error = e
+        if error is not None:
+            raise error
+        return results
+
+    def map(self, *iterables, return_exceptions=False):
+        """Call the function with arguments taken from each of the iterables, like the builtin :func:`map`.
+        See :meth:`starmap`.
+        """
+        return self.starmap(zip(*iterables), return_exceptions=return_exceptions)
+
+    def starmap(self, iterable, return_exceptions=False):
+        """Call the function once for each tuple of positional arguments in `iterable`, yielding the results in
+        order as they are produced.
+
+        The function is bound once for the whole batch.  Each call generates its own buffers, so results don't
+        share memory with each other.
+
+        :param iterable: Tuples of positional arguments
+        :param return_exceptions: If set, an exception raised by one call is yielded in place of its result and
+            the batch continues.  Otherwise the exception is raised and the batch stops.
+        """
+        fn = self._fn
+        if fn is None:
+            fn = self._bind()
+        measured = self.metrics is not None
+        if measured:
+            fn = _Measured(fn, self._raw, self.metrics.function(self._name))
+        for args in iterable:
+            if measured:
+                fn.begin()
+            try:
+                if self._sizes:
+                    # Each call negotiates its buffers, starting from the sizes the previous ones needed
+                    ret = self._call_sized(fn, args, {})
+                else:
+                    ret = self._unwrap(fn(*self._map_args(args, {})))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                yield e
+                continue
+            yield ret
+
+
+def _none():
+    return None
+
+
+class _SizedBuffer:
+    """A buffer parameter whose allocation size is negotiated with the foreign function"""
+    def __init__(self, buffer, length, length_type, needed, allocate, initial, key=None, fixed=None):
+        self.buffer = buffer
+        self.length = length
+        self.needed_index = needed
+        self.allocate = allocate
+        self.initial = initial
+        self.key = key
+        self.fixed = dict(fixed or {})
+        # The size that last worked, for each value of the key parameter
+        self.hints = {}
+        # An in/out length is passed by reference, and receives the required size
+        self.length_type = length_type._type_ if issubclass(length_type, _Pointer) else None
+
+    def _key(self, args):
+        if self.key is None:
+            return None
+        k = args[self.key]
+        return getattr(k, "value", k)
+
+    def is_fixed(self, args):
+        return self.key is not None and self._key(args) in self.fixed
+
+    def size(self, args):
+        """The size to try first for the call with the arguments `args`"""
+        k = self._key(args)
+        if k in self.fixed:
+            return self.fixed[k]
+        return self.hints.get(k, self.initial)
+
+    def apply(self, args, size):
+        args[self.buffer] = self.allocate(size) if size else None
+        args[self.length] = pointer(self.length_type(size)) if self.length_type else size
+
+    def needed(self, args):
+        """The size the function asked for, or 0 if it didn't say"""
+        sizes = []
+        if self.needed_index is not None:
+            sizes.append(args[self.needed_index])
+        if self.length_type:
+            sizes.append(args[self.length])
+        sizes = [x.contents.value if isinstance(x, _Pointer) else getattr(x, "value", 0) for x in sizes]
+        return max(sizes + [0])
+
+    def remember(self, args, size):
+        # Start the next call for the same key at the size that worked, so it usually succeeds the first time
+        k = self._key(args)
+        if k not in self.fixed:
+            self.hints[k] = size
+
+
+def _buffer_allocator(typ):
+    """Return allocate(size) making a zeroed buffer of `size` units for a parameter of type `typ`"""
+    if typ is c_wchar_p:
+        return create_unicode_buffer
+    if typ is c_char_p:
+        return create_string_buffer
+    if issubclass(typ, _Pointer):
+        target = typ._type_
+        return lambda size: cast((c_ubyte * max(size, sizeof(target)))(), typ)
+    # c_void_p, and anything else that takes a buffer: plain bytes of exactly the size asked for
+    return lambda size: (c_ubyte * size)()
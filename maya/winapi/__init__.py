@@ -4,6 +4,16 @@ as many Windows calls as are completed, focusing initially on the Security APIs
 the Windows system calls (ntdll).  The module should make Windows experimentation significantly
 faster, and contains a variety of routines that wrap up common use cases on top of the ctypes
 Windows API functions.
+
+Submodules are imported on first access, and DLLs are only loaded once one of their functions is
+called, so importing is cheap and works on any platform.
 """
+import importlib
+
+__all__ = ['advapi32', 'functions', 'kernel32', 'ntdll', 'types']
+
 
-__all__ = ['kernel32', 'security', 'registry']
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
@@ -1,23 +1,26 @@
 #!/usr/bin/env python3
 from maya.ctypeshelper import *
-from maya.winapi.functions import BoolWinFunc, WinapiWinFunc, trace
+from maya.winapi.functions import BoolWinFunc, WinapiWinFunc, dll, trace
 from .types import *
 
 
 __all__ = ['Advapi32']
 
 
-advapi32 = ctypes.windll.advapi32
+advapi32 = dll("advapi32")
 
 _AdjustTokenPrivileges = BoolWinFunc("AdjustTokenPrivileges", advapi32)
 _AdjustTokenPrivileges.params = [
     InParam(HANDLE, "TokenHandle"),
     InParam(BOOL, "DisableAllPrivileges", lambda: False),
     InParam(POINTER(TOKEN_PRIVILEGES), "NewState"),
-    InParam(DWORD, "BufferLength", lambda: sizeof(TOKEN_PRIVILEGES())),
-    ReturnOutParam(POINTER(TOKEN_PRIVILEGES), "PreviousState", lambda: pointer(TOKEN_PRIVILEGES())),
+    InParam(DWORD, "BufferLength"),
+    ReturnOutParam(POINTER(TOKEN_PRIVILEGES), "PreviousState"),
     OutParam(PDWORD, "ReturnLength", lambda: pointer(DWORD(0)))
 ]
+# Room for the previous state of more privileges than a token has, so that the first call succeeds
+_AdjustTokenPrivileges.sized_buffer("PreviousState", "BufferLength", "ReturnLength",
+                                    initial=var_sizeof(TOKEN_PRIVILEGES, 64))
 
 # First param must be c_void_p to be received from output of SID producing functions
 # as a bytes string and marshaled properly when passed to other functions
@@ -45,10 +48,11 @@ _GetFileSecurityW = BoolWinFunc("GetFileSecurityW", advapi32)
 _GetFileSecurityW.params = [
     InParam(LPWSTR, "lpFileName"),
     InParam(DWORD, "RequestedInformation"),
-    ReturnOutParam(POINTER(SECURITY_DESCRIPTOR), "pSecurityDescriptor", lambda: pointer(SECURITY_DESCRIPTOR())),
-    InParam(DWORD, "nLength", lambda: DWORD(sizeof(SECURITY_DESCRIPTOR))),
+    ReturnOutParam(c_void_p, "pSecurityDescriptor"),
+    InParam(DWORD, "nLength"),
     OutParam(POINTER(DWORD), "lpnLengthNeeded", lambda: pointer(DWORD(0)))
 ]
+_GetFileSecurityW.sized_buffer("pSecurityDescriptor", "nLength", "lpnLengthNeeded")
 
 # XP and later
 _GetSecurityInfo = WinapiWinFunc("GetSecurityInfo", advapi32)
@@ -68,11 +72,17 @@ _GetTokenInformation.params = [
     InParam(HANDLE, "TokenHandle"),
     InParam(DWORD, "TokenInformationClass"),
     ReturnOutParam(POINTER(TokenInformation), "TokenInformation",
-                   lambda: pointer(TokenInformation()),
                    switch_is="TokenInformationClass"),
-    InParam(DWORD, "TokenInformationLength", lambda: sizeof(TokenInformation)),
+    InParam(DWORD, "TokenInformationLength"),
     OutParam(PDWORD, "ReturnLength", lambda: pointer(DWORD(0)))
 ]
+_GetTokenInformation.sized_buffer("TokenInformation", "TokenInformationLength", "ReturnLength")
+
+# The same function returning views, for callers that only read a few fields of a large union
+_GetTokenInformationView = BoolWinFunc("GetTokenInformation", advapi32)
+_GetTokenInformationView.params = _GetTokenInformation.params
+_GetTokenInformationView.sized_buffer("TokenInformation", "TokenInformationLength", "ReturnLength")
+_GetTokenInformationView.lazy = True
 
 _ImpersonateSelf = BoolWinFunc("ImpersonateSelf", advapi32)
 _ImpersonateSelf.params = [
@@ -82,33 +92,38 @@ _ImpersonateSelf.params = [
 _LookupAccountNameW = BoolWinFunc("LookupAccountNameW", advapi32)
 _LookupAccountNameW.params = [
     InParam(c_void_p, "system", lambda: None),
-    InParam(LPCSTR, "lpAccountName"),
-    ReturnOutParam(PSID, "sid", lambda: pointer(SID())),
-    InOutParam(LPDWORD, "cbSid", lambda: pointer(sizeof(SID))),
-    ReturnOutParam(LPWSTR, "domain", lambda: create_unicode_buffer(512)),
-    InOutParam(LPDWORD, "cchDomain", lambda: pointer(DWORD(512))),
+    InParam(LPCWSTR, "lpAccountName"),
+    ReturnOutParam(c_void_p, "sid"),
+    InOutParam(LPDWORD, "cbSid"),
+    ReturnOutParam(LPWSTR, "domain"),
+    InOutParam(LPDWORD, "cchDomain"),
     ReturnOutParam(LPDWORD, "peUse", lambda: pointer(DWORD(0)))
 ]
+_LookupAccountNameW.sized_buffer("sid", "cbSid", initial=SECURITY_MAX_SID_SIZE)
+_LookupAccountNameW.sized_buffer("domain", "cchDomain", initial=MAX_PATH)
 
 _LookupAccountSidW = BoolWinFunc("LookupAccountSidW", advapi32)
 _LookupAccountSidW.params = [
     InParam(c_void_p, "system", lambda: None),
     InParam(c_void_p, "sid"),
-    ReturnOutParam(LPWSTR, "name", lambda: create_unicode_buffer(512)),
-    InOutParam(LPDWORD, "cchName", lambda: pointer(DWORD(512))),
-    ReturnOutParam(LPWSTR, "domain", lambda: create_unicode_buffer(512)),
-    InOutParam(LPDWORD, "cchDomain", lambda: pointer(DWORD(512))),
+    ReturnOutParam(LPWSTR, "name"),
+    InOutParam(LPDWORD, "cchName"),
+    ReturnOutParam(LPWSTR, "domain"),
+    InOutParam(LPDWORD, "cchDomain"),
     ReturnOutParam(LPDWORD, "peUse", lambda: pointer(DWORD(0)))
 ]
+_LookupAccountSidW.sized_buffer("name", "cchName", initial=MAX_PATH)
+_LookupAccountSidW.sized_buffer("domain", "cchDomain", initial=MAX_PATH)
 
 # lpLuid must be a c_void_p to take a byte array representing a LUID
 _LookupPrivilegeNameW = BoolWinFunc("LookupPrivilegeNameW", advapi32)
 _LookupPrivilegeNameW.params = [
     InParam(LPWSTR, "lpSystemName", lambda: None),
     InParam(c_void_p, "lpLuid"),
-    ReturnOutParam(LPWSTR, "lpName", lambda: create_unicode_buffer(MAX_PATH)),
-    InOutParam(LPDWORD, "cchName", lambda: pointer(DWORD(MAX_PATH)))
+    ReturnOutParam(LPWSTR, "lpName"),
+    InOutParam(LPDWORD, "cchName")
 ]
+_LookupPrivilegeNameW.sized_buffer("lpName", "cchName", initial=MAX_PATH)
 
 _LookupPrivilegeValueW = BoolWinFunc("LookupPrivilegeValueW", advapi32)
 _LookupPrivilegeValueW.params = [
@@ -117,20 +132,26 @@ _LookupPrivilegeValueW.params = [
     ReturnOutParam(POINTER(LUID), "lpLuid", lambda: pointer(LUID()))
 ]
 
-_MakeAbsoluteSD = BoolWinFunc("MakeAbsoluteSD", advapi32)
+# Called with every buffer empty first: the sizes it reports fill in the hints for later calls
+_MakeAbsoluteSD = BoolWinFunc("MakeAbsoluteSD", advapi32, double=True)
 _MakeAbsoluteSD.params = [
     InParam(c_void_p, "pSelfRelativeSD"),
-    ReturnOutParam(c_void_p, "pAbsoluteSD", lambda: create_string_buffer(1024)),
-    InOutParam(LPDWORD, "lpdwAbsoluteSDSize", lambda: DWORD(1024)),
-    ReturnOutParam(c_void_p, "pDacl", lambda: create_string_buffer(1024)),
-    InOutParam(LPDWORD, "lpdwDaclSize", lambda: DWORD(1024)),
-    ReturnOutParam(c_void_p, "pSacl", lambda: create_string_buffer(1024)),
-    InOutParam(LPDWORD, "lpdwSaclSize", lambda: DWORD(1024)),
-    ReturnOutParam(c_void_p, "pOwner", lambda: create_string_buffer(256)),
-    InOutParam(LPDWORD, "lpdwOwnerSize", lambda: DWORD(256)),
-    ReturnOutParam(c_void_p, "pPrimaryGroup", lambda: create_string_buffer(256)),
-    InOutParam(LPDWORD, "lpdwPrimaryGroupSize", lambda: DWORD(256)),
+    ReturnOutParam(c_void_p, "pAbsoluteSD"),
+    InOutParam(LPDWORD, "lpdwAbsoluteSDSize"),
+    ReturnOutParam(c_void_p, "pDacl"),
+    InOutParam(LPDWORD, "lpdwDaclSize"),
+    ReturnOutParam(c_void_p, "pSacl"),
+    InOutParam(LPDWORD, "lpdwSaclSize"),
+    ReturnOutParam(c_void_p, "pOwner"),
+    InOutParam(LPDWORD, "lpdwOwnerSize"),
+    ReturnOutParam(c_void_p, "pPrimaryGroup"),
+    InOutParam(LPDWORD, "lpdwPrimaryGroupSize"),
 ]
+_MakeAbsoluteSD.sized_buffer("pAbsoluteSD", "lpdwAbsoluteSDSize")
+_MakeAbsoluteSD.sized_buffer("pDacl", "lpdwDaclSize")
+_MakeAbsoluteSD.sized_buffer("pSacl", "lpdwSaclSize")
+_MakeAbsoluteSD.sized_buffer("pOwner", "lpdwOwnerSize")
+_MakeAbsoluteSD.sized_buffer("pPrimaryGroup", "lpdwPrimaryGroupSize")
 
 _OpenProcessToken = BoolWinFunc("OpenProcessToken", advapi32)
 _OpenProcessToken.params = [
@@ -156,8 +177,14 @@ class Advapi32:
     def AdjustTokenPrivileges(handle,
                               new_state: TOKEN_PRIVILEGES,
                               disable_all: bool=False):
-        # What happens if I just pass the structure?
-        # TODO Have to marshall the parameter
+        """Enables or disables privileges in the specified access token
+
+        :param handle: Handle to the token, with TOKEN_ADJUST_PRIVILEGES access
+        :param new_state: TOKEN_PRIVILEGES structure, or a dictionary of one, with the privileges and their new
+            attributes.  Privileges the token doesn't have are left out.
+        :param disable_all: Disable every privilege, ignoring new_state
+        :return: The previous state of the privileges that were changed, as a TOKEN_PRIVILEGES dictionary
+        """
         return _AdjustTokenPrivileges(handle, disable_all, new_state)
 
     @staticmethod
@@ -212,8 +239,21 @@ class Advapi32:
 
     @staticmethod
     @trace
-    def GetTokenInformation(handle, TokenInformationClass):
-        return _GetTokenInformation(handle, TokenInformationClass)
+    def GetTokenInformation(handle, TokenInformationClass, lazy=False):
+        return (_GetTokenInformationView if lazy else _GetTokenInformation)(handle, TokenInformationClass)
+
+    @staticmethod
+    def GetTokenInformationBatch(handle, info_classes, lazy=False):
+        """GetTokenInformation for each of several information classes of a token, as one batch
+
+        :param handle: Handle to the token, with TOKEN_QUERY access
+        :param info_classes: The TokenInformationClass values
+        :param lazy: Return structures as read-only mappings that decode each field when it is read, rather than
+            as dictionaries
+        :return: The information of each class, in order
+        """
+        fn = _GetTokenInformationView if lazy else _GetTokenInformation
+        return list(fn.starmap((handle, c) for c in info_classes))
 
     @staticmethod
     def ImpersonateSelf():
@@ -228,9 +268,9 @@ class Advapi32:
         security identifier (SID) for the account and the name of the domain on which the account was found.
 
         :param name:  the account name.  A fully qualified (domain\\name) name will yield best results
-        :return: The sid for the corresponding name
+        :return: (sid, domain, sid_name_use)
         """
-        return _LookupAccountSidW(system, name)
+        return _LookupAccountNameW(system, name)
 
     @staticmethod
     def LookupAccountSidW(sid, system=None):
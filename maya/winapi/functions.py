@@ -1,17 +1,75 @@
-from ctypes import WINFUNCTYPE, WinError, HRESULT
 from ctypes.wintypes import BOOL, HANDLE
-from maya.ctypeshelper import HelperFunc
+from maya.ctypeshelper import HelperFunc, LazyLibrary
 from functools import wraps
-import logging
 
+try:
+    from ctypes import WINFUNCTYPE, WinDLL, WinError, HRESULT
+except ImportError:
+    # Not Windows.  Functions can still be declared, and called through a loader that stands in for the DLLs
+    from ctypes import CFUNCTYPE as WINFUNCTYPE, CDLL as WinDLL, c_long as HRESULT, get_errno
+    import os
 
-__all__ = ['WinFunc', 'HresultWinFunc', 'WinapiWinFunc', 'BoolWinFunc']
+    def WinError(code=None, descr=None):
+        code = get_errno() if code is None else code
+        if descr is None:
+            try:
+                descr = os.strerror(code)
+            except (OverflowError, ValueError):
+                # An NTSTATUS or HRESULT, which os doesn't know
+                descr = "Error {0:#x}".format(code)
+        return OSError(code, descr)
+
+
+__all__ = ['WinFunc', 'HresultWinFunc', 'WinapiWinFunc', 'BoolWinFunc', 'dll', 'set_loader']
+
+# Errors meaning that a buffer was too small for the result
+ERROR_BAD_LENGTH = 24
+ERROR_INSUFFICIENT_BUFFER = 122
+ERROR_MORE_DATA = 234
+STATUS_BUFFER_OVERFLOW = 0x80000005
+STATUS_INFO_LENGTH_MISMATCH = 0xC0000004
+STATUS_BUFFER_TOO_SMALL = 0xC0000023
+
+
+def HRESULT_FROM_WIN32(x):
+    return 0x80070000 | x if x else 0
+
+
+_loader = WinDLL
+_libraries = []
+
+
+def _load(name):
+    return _loader(name)
+
+
+def set_loader(loader=None):
+    """Load DLLs with loader(name) from now on, instead of :class:`ctypes.WinDLL`.  Any object exposing the
+    functions as attributes can be returned, which allows the API to be exercised where the DLLs don't exist.
+    DLLs that have already been loaded are loaded again through `loader` on their next call.
+
+    :param loader: The loader, or None to go back to :class:`ctypes.WinDLL`
+    """
+    global _loader
+    _loader = loader or WinDLL
+    for lib in _libraries:
+        lib.unload()
+
+
+def dll(name):
+    """Return the DLL `name`, loaded when one of its functions is first called"""
+    lib = LazyLibrary(name, _load)
+    _libraries.append(lib)
+    return lib
 
 
 def trace(fn):
     @wraps(fn)
     def inner(*args, **kwargs):
-        logging.debug("{0}({1}{2})".format(fn.__name__, args, kwargs))
+        # logging is slow to import, and only needed once something is traced
+        import logging
+        # The message is only formatted if debug logging is enabled
+        logging.debug("%s(%s%s)", fn.__name__, args, kwargs)
         return fn(*args, **kwargs)
     return inner
 
@@ -19,13 +77,22 @@ def trace(fn):
 class WinFunc(HelperFunc):
     def __init__(self, name, module, ret, double=False):
         # Double indicates whether the function returns allocation size information
-        # on the first call
+        # on the first call.  If so, sized buffers start out by probing for their size.
         super().__init__(WINFUNCTYPE, name, module, ret)
+        self._double = double
+
+    def sized_buffer(self, buffer, length, needed=None, initial=None, allocate=None, key=None, fixed=None):
+        if initial is None and self._double:
+            initial = 0
+        super().sized_buffer(buffer, length, needed, initial, allocate, key, fixed)
 
 
 class HresultWinFunc(WinFunc):
-    def __init__(self, name, module):
-        super().__init__(name, module, HRESULT)
+    insufficient_buffer = frozenset([HRESULT_FROM_WIN32(ERROR_INSUFFICIENT_BUFFER),
+                                     HRESULT_FROM_WIN32(ERROR_MORE_DATA)])
+
+    def __init__(self, name, module, double=False):
+        super().__init__(name, module, HRESULT, double)
 
     @staticmethod
     def errcheck(result, func, args):
@@ -35,19 +102,24 @@ class HresultWinFunc(WinFunc):
 
 
 class WinapiWinFunc(WinFunc):
-    def __init__(self, name, module):
-        super().__init__(name, module, HRESULT)
+    insufficient_buffer = frozenset([STATUS_BUFFER_OVERFLOW, STATUS_INFO_LENGTH_MISMATCH, STATUS_BUFFER_TOO_SMALL])
+
+    def __init__(self, name, module, double=False):
+        super().__init__(name, module, HRESULT, double)
 
     @staticmethod
     def errcheck(result, func, args):
         if 0 != result:
-            raise WinError()
+            # The NTSTATUS is the error; these functions don't set the last error
+            raise WinError(result & 0xFFFFFFFF)
         return WinFunc.errcheck(result, func, args)
 
 
 class BoolWinFunc(WinFunc):
-    def __init__(self, name, module):
-        super().__init__(name, module, BOOL)
+    insufficient_buffer = frozenset([ERROR_BAD_LENGTH, ERROR_INSUFFICIENT_BUFFER, ERROR_MORE_DATA])
+
+    def __init__(self, name, module, double=False):
+        super().__init__(name, module, BOOL, double)
 
     @staticmethod
     def errcheck(result, func, args):
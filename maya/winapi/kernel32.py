@@ -1,11 +1,11 @@
 from maya.ctypeshelper import *
-from maya.winapi.functions import BoolWinFunc, HandleWinFunc, WinapiWinFunc, trace
+from maya.winapi.functions import BoolWinFunc, HandleWinFunc, dll, trace
 from .types import *
 
 __all__ = ['Kernel32']
 
-kernel32 = ctypes.windll.kernel32
-psapi = ctypes.windll.psapi
+kernel32 = dll("kernel32")
+psapi = dll("psapi")
 
 _CloseHandle = BoolWinFunc("CloseHandle", kernel32)
 _CloseHandle.params = [
@@ -19,15 +19,25 @@ _OpenProcess.params = [
     InParam(DWORD, "dwProcessId")
 ]
 
-# This can sometimes be in psapi.dll instead of kernel32
-try:
-    _GetProcessImageFileNameW = WinapiWinFunc("GetProcessImageFileNameW", kernel32)
-except AttributeError:
-    _GetProcessImageFileNameW = WinapiWinFunc("GetProcessImageFileNameW", psapi)
+# kernel32 only exports this as K32GetProcessImageFileNameW, and only from Windows 7.  psapi.dll exports it on
+# every version, forwarding to kernel32 where it can.
+_GetProcessImageFileNameW = BoolWinFunc("GetProcessImageFileNameW", psapi)
 _GetProcessImageFileNameW.params = [
     InParam(HANDLE, "hProcess"),
-    ReturnOutParam(LPWSTR, "lpImageFileName", lambda: pointer(max_path_wstr())),
-    InParam(DWORD, "nSize",  sizeof(max_path_wstr()))
+    ReturnOutParam(LPWSTR, "lpImageFileName"),
+    InParam(DWORD, "nSize")
+]
+# Device paths can be longer than MAX_PATH; those fail with ERROR_INSUFFICIENT_BUFFER and are retried doubled
+_GetProcessImageFileNameW.sized_buffer("lpImageFileName", "nSize", initial=MAX_PATH)
+
+# The FILETIMEs are read as 64-bit integers
+_GetProcessTimes = BoolWinFunc("GetProcessTimes", kernel32)
+_GetProcessTimes.params = [
+    InParam(HANDLE, "hProcess"),
+    ReturnOutParam(POINTER(c_ulonglong), "lpCreationTime", lambda: pointer(c_ulonglong())),
+    ReturnOutParam(POINTER(c_ulonglong), "lpExitTime", lambda: pointer(c_ulonglong())),
+    ReturnOutParam(POINTER(c_ulonglong), "lpKernelTime", lambda: pointer(c_ulonglong())),
+    ReturnOutParam(POINTER(c_ulonglong), "lpUserTime", lambda: pointer(c_ulonglong()))
 ]
 
 #
@@ -75,6 +85,32 @@ _Thread32Next.params = [
     ReturnInOutParam(POINTER(THREADENTRY32), "lpte", lambda: pointer(THREADENTRY32(dwSize=sizeof(THREADENTRY32))))
 ]
 
+# The same functions returning views over each entry, for callers that only read a few of its fields.  A
+# declaration decides whether its results are views for all its callers, so these are separate.
+_Module32FirstView = BoolWinFunc("Module32First", kernel32)
+_Module32FirstView.params = _Module32First.params
+_Module32FirstView.lazy = True
+
+_Module32NextView = BoolWinFunc("Module32Next", kernel32)
+_Module32NextView.params = _Module32Next.params
+_Module32NextView.lazy = True
+
+_Process32FirstView = BoolWinFunc("Process32First", kernel32)
+_Process32FirstView.params = _Process32First.params
+_Process32FirstView.lazy = True
+
+_Process32NextView = BoolWinFunc("Process32Next", kernel32)
+_Process32NextView.params = _Process32Next.params
+_Process32NextView.lazy = True
+
+_Thread32FirstView = BoolWinFunc("Thread32First", kernel32)
+_Thread32FirstView.params = _Thread32First.params
+_Thread32FirstView.lazy = True
+
+_Thread32NextView = BoolWinFunc("Thread32Next", kernel32)
+_Thread32NextView.params = _Thread32Next.params
+_Thread32NextView.lazy = True
+
 
 class Kernel32:
     @staticmethod
@@ -100,6 +136,15 @@ class Kernel32:
     def GetProcessImageFileNameW(handle):
         return _GetProcessImageFileNameW(handle)
 
+    @staticmethod
+    def GetProcessTimes(handle):
+        """Retrieves timing information for the specified process.
+
+        :param handle: Handle to the process, with PROCESS_QUERY_LIMITED_INFORMATION access
+        :return: (creation, exit, kernel, user) times, in 100ns units.  Creation and exit are since January 1, 1601
+        """
+        return _GetProcessTimes(handle)
+
     @staticmethod
     def CreateToolhelp32Snapshot(flags, pid=0):
         """Takes a snapshot of the specified processes, as well as the heaps, modules, and
@@ -113,57 +158,69 @@ class Kernel32:
         return _CreateToolhelp32Snapshot(flags, pid)
 
     @staticmethod
-    def Module32First(hSnapshot):
+    def Module32First(hSnapshot, lazy=False):
         """Retrieves information about the first module associated with a process.
 
         :param hSnapshot: The handle obtained by CreateToolhelp32Snapshot
-        :return: MODULEENTRY32 structure, as a dictionary
+        :param lazy: Return the entry as a read-only mapping that decodes each field when it is read, rather
+            than as a dictionary
+        :return: MODULEENTRY32 structure
         """
-        return _Module32First(hSnapshot)
+        return (_Module32FirstView if lazy else _Module32First)(hSnapshot)
 
     @staticmethod
-    def Module32Next(hSnapshot):
+    def Module32Next(hSnapshot, lazy=False):
         """Retrieves information about the next module associated with a process or thread.
 
         :param hSnapshot: A handle to the snapshot returned from a previous call to the CreateToolhelp32Snapshot
             function.
-        :return: MODULEENTRY32 structure, as a dictionary
+        :param lazy: Return the entry as a read-only mapping that decodes each field when it is read, rather
+            than as a dictionary
+        :return: MODULEENTRY32 structure
         """
-        return _Module32Next(hSnapshot)
+        return (_Module32NextView if lazy else _Module32Next)(hSnapshot)
 
     @staticmethod
-    def Process32First(hSnapshot):
+    def Process32First(hSnapshot, lazy=False):
         """Retrieves information about the first process encountered in a system snapshot.
 
         :param hSnapshot: A handle to the snapshot returned from a previous call to the CreateToolhelp32Snapshot function.
-        :return: PROCESSENTRY32 structure, as a dictionary
+        :param lazy: Return the entry as a read-only mapping that decodes each field when it is read, rather
+            than as a dictionary
+        :return: PROCESSENTRY32 structure
         """
-        return _Process32First(hSnapshot)
+        return (_Process32FirstView if lazy else _Process32First)(hSnapshot)
 
     @staticmethod
-    def Process32Next(hSnapshot):
+    def Process32Next(hSnapshot, lazy=False):
         """Retrieves information about the next process recorded in a system snapshot
 
         :param hSnapshot: A handle to the snapshot returned from a previous call to the CreateToolhelp32Snapshot function.
-        :return: PROCESSENTRY32 structure, as a dictionary
+        :param lazy: Return the entry as a read-only mapping that decodes each field when it is read, rather
+            than as a dictionary
+        :return: PROCESSENTRY32 structure
         """
-        return _Process32Next(hSnapshot)
+        return (_Process32NextView if lazy else _Process32Next)(hSnapshot)
 
     @staticmethod
-    def Thread32First(hSnapshot):
+    def Thread32First(hSnapshot, lazy=False):
         """Retrieves information about the first thread of any process encountered in a system snapshot.
 
         :param hSnapshot: A handle to the snapshot returned from a previous call to the CreateToolhelp32Snapshot function.
-        :return: THREADENTRY32 structure, as a dictionary
+        :param lazy: Return the entry as a read-only mapping that decodes each field when it is read, rather
+            than as a dictionary
+        :return: THREADENTRY32 structure
         """
-        return _Thread32First(hSnapshot)
+        return (_Thread32FirstView if lazy else _Thread32First)(hSnapshot)
 
     @staticmethod
-    def Thread32Next(hSnapshot):
+    def Thread32Next(hSnapshot, lazy=False):
         """Retrieves information about the next thread of any process encountered in a system snapshot.
 
         :param hSnapshot: A handle to the snapshot returned from a previous call to the CreateToolhelp32Snapshot function.
-        :return: THREADENTRY32 structure, as a dictionary
+        :param lazy: Return the entry as a read-only mapping that decodes each field when it is read, rather
+            than as a dictionary
+        :return: THREADENTRY32 structure
         """
-        return _Thread32Next(hSnapshot)
+        return (_Thread32NextView if lazy else _Thread32Next)(hSnapshot)
 
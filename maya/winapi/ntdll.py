@@ -1,8 +1,8 @@
 from maya.ctypeshelper import *
-from maya.winapi.functions import WinapiWinFunc
+from maya.winapi.functions import WinapiWinFunc, dll
 from .types import *
 
-ntdll = windll.ntdll
+ntdll = dll("ntdll")
 
 #
 # NtQueryInformationProcess
@@ -20,8 +20,8 @@ class PROCESS_BASIC_INFORMATION(Structure):
         ("Reservd1", LPVOID),
         ("PebBaseAddress", LPVOID),
         ("Reserved2", LPVOID * 2),
-        ("UniqueProcessId", ULONG),
-        ("Reserved3", LPVOID)
+        ("UniqueProcessId", HANDLE),
+        ("InheritedFromUniqueProcessId", HANDLE)
     ]
 
 
@@ -46,9 +46,14 @@ _NtQueryInformationProcess.params = [
     ReturnOutParam(POINTER(ProcessInformation), "ProcessInformation",
                    lambda: pointer(ProcessInformation()),
                    switch_is="ProcessInformationClass"),
-    InParam(DWORD, "ProcessInformationLength", lambda: sizeof(ProcessInformation)),
-    OutParam(DWORD, "ReturnLength", lambda: pointer(DWORD(0)))
+    InParam(DWORD, "ProcessInformationLength"),
+    OutParam(PULONG, "ReturnLength", lambda: pointer(ULONG(0)))
 ]
+# Most classes are a structure that must be passed at exactly its size; only the image name varies
+_NtQueryInformationProcess.sized_buffer("ProcessInformation", "ProcessInformationLength", "ReturnLength", fixed={
+    ProcessInformationClass.ProcessBasicInformation: sizeof(PROCESS_BASIC_INFORMATION),
+    ProcessInformationClass.ProcessWow64Information: sizeof(c_void_p)
+})
 
 
 #
@@ -69,16 +74,32 @@ class SYSTEM_BASIC_INFORMATION(Structure):
     ]
 
 
+class SYSTEM_TIMEOFDAY_INFORMATION(Structure):
+    _fields_ = [
+        ("BootTime", LARGE_INTEGER),
+        ("CurrentTime", LARGE_INTEGER),
+        ("TimeZoneBias", LARGE_INTEGER),
+        ("TimeZoneId", ULONG),
+        ("Reserved", ULONG),
+        ("BootTimeBias", c_ulonglong),
+        ("SleepTimeBias", c_ulonglong)
+    ]
+
+
 class SYSTEM_PROCESS_INFORMATION(Structure):
     _fields_ = [
         ("NextEntryOffset", ULONG),
         ("NumberOfThreads", ULONG),
-        ("Reserved1", BYTE * 48),
-        ("Reserved2", LPVOID * 3),
+        ("Reserved1", BYTE * 24),
+        ("CreateTime", LARGE_INTEGER),
+        ("UserTime", LARGE_INTEGER),
+        ("KernelTime", LARGE_INTEGER),
+        ("ImageName", UNICODE_STRING),
+        ("BasePriority", LONG),
         ("UniqueProcessId", HANDLE),
-        ("Reserved3", LPVOID),
+        ("InheritedFromUniqueProcessId", HANDLE),
         ("HandleCount", ULONG),
-        ("Reserved4", BYTE * 4),
+        ("SessionId", ULONG),
         ("Reserved5", LPVOID * 11),
         ("PeakPagefileUsage", c_size_t),
         ("PrivatePageCount", c_size_t),
@@ -86,14 +107,45 @@ class SYSTEM_PROCESS_INFORMATION(Structure):
     ]
 
 
+def walk_process_information(first, size):
+    """Yield each SYSTEM_PROCESS_INFORMATION of the list starting at `first`, following NextEntryOffset.  The
+    entries are read in place, and keep the buffer holding `first` alive.
+
+    :param size: The number of bytes filled in from `first`
+    :raises ValueError: If an entry would run past the end of the buffer
+    """
+    end = addressof(first) + size
+    entry = first
+    while True:
+        if addressof(entry) + sizeof(SYSTEM_PROCESS_INFORMATION) > end:
+            raise ValueError("process information entry at offset {0} runs past the {1} bytes filled in".format(
+                addressof(entry) - addressof(first), size))
+        yield entry
+        offset = entry.NextEntryOffset
+        if not offset:
+            break
+        entry = SYSTEM_PROCESS_INFORMATION.from_address(addressof(entry) + offset)
+        entry._owner = first
+
+
+class _ProcessInformationList(SYSTEM_PROCESS_INFORMATION):
+    """The first entry of the list filled in by NtQuerySystemInformation(SystemProcessInformation)"""
+
+
+# Walked by the caller, which knows how much of the buffer was filled in
+register_resolver(_ProcessInformationList, lambda first: first)
+
+
 class SystemInformation(Union):
     _map_ = {
         SystemInformationClass.SystemBasicInformation: "BasicInformation",
+        SystemInformationClass.SystemTimeInformation: "TimeOfDayInformation",
         SystemInformationClass.SystemProcessInformation: "ProcessInformation"
     }
 
     _fields_ = [
         ("BasicInformation", SYSTEM_BASIC_INFORMATION),
+        ("TimeOfDayInformation", SYSTEM_TIMEOFDAY_INFORMATION),
         ("ProcessInformation", SYSTEM_PROCESS_INFORMATION)
     ]
 
@@ -103,10 +155,37 @@ _NtQuerySystemInformation.params = [
     ReturnInOutParam(POINTER(SystemInformation), "SystemInformation",
                      lambda: pointer(SystemInformation()),
                      switch_is="SystemInformationClass"),
-    InParam(ULONG, "SystemInformationLength", lambda: sizeof(SystemInformation)),
+    InParam(ULONG, "SystemInformationLength"),
+    OutParam(PULONG, "ReturnLength", lambda: pointer(ULONG(0)))
+]
+# The process list grows and shrinks between calls, so the size that worked last time is usually close.  The
+# other classes only accept their exact size.
+_NtQuerySystemInformation.sized_buffer("SystemInformation", "SystemInformationLength", "ReturnLength", fixed={
+    SystemInformationClass.SystemBasicInformation: sizeof(SYSTEM_BASIC_INFORMATION),
+    SystemInformationClass.SystemTimeInformation: sizeof(SYSTEM_TIMEOFDAY_INFORMATION)
+})
+
+# The boot and current times.  NT only accepts the exact size of the structure for this class, so the length is
+# fixed rather than negotiated.
+_NtQuerySystemTimeOfDayInformation = WinapiWinFunc("ZwQuerySystemInformation", ntdll)
+_NtQuerySystemTimeOfDayInformation.params = [
+    InParam(DWORD, "SystemInformationClass", lambda: SystemInformationClass.SystemTimeInformation),
+    ReturnOutParam(POINTER(SYSTEM_TIMEOFDAY_INFORMATION), "SystemInformation",
+                   lambda: pointer(SYSTEM_TIMEOFDAY_INFORMATION())),
+    InParam(ULONG, "SystemInformationLength", lambda: sizeof(SYSTEM_TIMEOFDAY_INFORMATION)),
     OutParam(PULONG, "ReturnLength", lambda: pointer(ULONG(0)))
 ]
 
+# The whole process list in one call
+_NtQuerySystemProcessInformation = WinapiWinFunc("ZwQuerySystemInformation", ntdll)
+_NtQuerySystemProcessInformation.params = [
+    InParam(DWORD, "SystemInformationClass", lambda: SystemInformationClass.SystemProcessInformation),
+    ReturnOutParam(POINTER(_ProcessInformationList), "SystemInformation"),
+    InParam(ULONG, "SystemInformationLength"),
+    ReturnOutParam(PULONG, "ReturnLength", lambda: pointer(ULONG(0)))
+]
+_NtQuerySystemProcessInformation.sized_buffer("SystemInformation", "SystemInformationLength", "ReturnLength")
+
 
 class Ntdll:
     @staticmethod
@@ -115,4 +194,18 @@ class Ntdll:
 
     @staticmethod
     def NtQuerySystemInformation(info_class):
-        return _NtQuerySystemInformation(info_class)
\ No newline at end of file
+        return _NtQuerySystemInformation(info_class)
+
+    @staticmethod
+    def NtQuerySystemTimeOfDayInformation():
+        """Retrieves the SYSTEM_TIMEOFDAY_INFORMATION, which holds the time the system started"""
+        return _NtQuerySystemTimeOfDayInformation()
+
+    @staticmethod
+    def NtQuerySystemProcessInformation():
+        """Retrieves the SYSTEM_PROCESS_INFORMATION of every process on the system, in one call.
+
+        :return: A list of SYSTEM_PROCESS_INFORMATION structures, as read-only mappings over a single buffer
+        """
+        first, size = _NtQuerySystemProcessInformation()
+        return [StructView(e) for e in walk_process_information(first, size)]
\ No newline at end of file
@@ -1,6 +1,6 @@
 from ctypes import *
 from ctypes.wintypes import *
-from maya.ctypeshelper import AutoStructure
+from maya.ctypeshelper import AutoStructure, register_resolver
 
 
 class UNICODE_STRING(Structure):
@@ -16,7 +16,10 @@ max_path_str = CHAR * MAX_PATH
 
 
 class ProcessAccessRights:
+    PROCESS_TERMINATE = 0x0001
+    PROCESS_VM_READ = 0x0010
     PROCESS_QUERY_INFORMATION = 0x0400
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
 
 
 class PROCESSENTRY32(Structure):
@@ -64,10 +67,24 @@ class THREADENTRY32(Structure):
 
 # Constants
 SECURITY_MAX_SID_SIZE = 68
+ANYSIZE_ARRAY = 1
 
 # Types
 SID = c_ubyte * SECURITY_MAX_SID_SIZE
 PSID = POINTER(SID)
+
+
+def _resolve_psid(cval):
+    """The bytes of the SID pointed to, which is often shorter than SECURITY_MAX_SID_SIZE and may end a buffer"""
+    if not cval:
+        return None
+    address = addressof(cval.contents)
+    # Revision, SubAuthorityCount, a 6 byte IdentifierAuthority, then the sub-authorities
+    return string_at(address, 8 + 4 * c_ubyte.from_address(address + 1).value)
+
+
+register_resolver(PSID, _resolve_psid)
+
 ACL = c_ubyte * 1024
 PACL = POINTER(ACL)
 SECURITY_DESCRIPTOR = c_ubyte * 1024
@@ -97,16 +114,20 @@ class LUID_AND_ATTRIBUTES(AutoStructure):
 
 
 class TOKEN_GROUPS(AutoStructure):
+    _count_ = {"Groups": "GroupCount"}
+
     _fields_ = [
-        ("GropuCount", DWORD),
-        ("Groups", SID_AND_ATTRIBUTES * 64)             # Arbitrarily chose a size.  Should be ANYSIZE_ARRAY
+        ("GroupCount", DWORD),
+        ("Groups", SID_AND_ATTRIBUTES * ANYSIZE_ARRAY)
     ]
 
 
 class TOKEN_PRIVILEGES(AutoStructure):
+    _count_ = {"Privileges": "PrivilegeCount"}
+
     _fields_ = [
         ("PrivilegeCount", DWORD),
-        ("Privileges", LUID_AND_ATTRIBUTES * 64)        # Arbitrarily chose a size.  Should be ANYSIZE_ARRAY
+        ("Privileges", LUID_AND_ATTRIBUTES * ANYSIZE_ARRAY)
     ]
 
 
@@ -194,6 +215,13 @@ class TokenPrivileges:
     TOKEN_ADJUST_SESSIONID = 0x0100
 
 
+class PrivilegeAttributes:
+    SE_PRIVILEGE_ENABLED_BY_DEFAULT = 0x00000001
+    SE_PRIVILEGE_ENABLED = 0x00000002
+    SE_PRIVILEGE_REMOVED = 0x00000004
+    SE_PRIVILEGE_USED_FOR_ACCESS = 0x80000000
+
+
 class SecurityInformation:
     OWNER_SECURITY_INFORMATION = 0x00000001
     GROUP_SECURITY_INFORMATION = 0x00000002
@@ -0,0 +1,10 @@
+import importlib
+
+__all__ = ['export', 'osinfo', 'registry', 'security']
+
+
+def __getattr__(name):
+    # Submodules are imported on first access
+    if name in __all__:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
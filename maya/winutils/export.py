@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Export an inventory of the host's processes, with their owners, modules and threads, as NDJSON or CSV.
+
+The records are made by a chain of generators over one :class:`~maya.winutils.osinfo.Snapshot`, and written as
+they come, a batch at a time, so memory use doesn't grow with the size of the inventory.
+"""
+import csv
+import io
+import json
+import os
+from maya.winutils import osinfo
+
+__all__ = ['FIELDS', 'inventory', 'write_ndjson', 'write_csv', 'export']
+
+# Every field of a record.  Each record has a type and a pid, and the fields that apply to its type.
+FIELDS = ('type', 'pid', 'parent_pid', 'name', 'owner', 'owner_sid', 'session_id', 'error', 'module', 'path',
+          'base', 'size', 'tid')
+
+
+def _owner(record, pid):
+    """Add the owner of the process `pid` to its record"""
+    token = osinfo.Process(pid).get_token()
+    try:
+        record['owner_sid'] = token.user.sid
+        record['session_id'] = token.session_id
+        record['owner'] = token.user.name
+    finally:
+        # Rather than when it's collected, so that a token handle isn't held for every process exported
+        token.close()
+
+
+def inventory(snapshot, owners=True, modules=True, threads=True):
+    """Yield a record, as a dictionary, for each process in `snapshot` followed by its modules, then for every
+    thread.  What can't be read about a process is described in the 'error' field of its record.
+
+    :param snapshot: An open :class:`~maya.winutils.osinfo.Snapshot`
+    :param owners: Include the owner and session of each process
+    :param modules: Include the modules of each process
+    :param threads: Include the threads
+    """
+    for row in snapshot.rows():
+        name = row.name.decode('utf-8', 'replace') if isinstance(row.name, bytes) else row.name
+        record = {'type': 'process', 'pid': row.pid, 'parent_pid': row.parent_pid, 'name': name}
+        errors = []
+        loaded = ()
+        if not osinfo.is_system_pid(row.pid):
+            if owners:
+                try:
+                    _owner(record, row.pid)
+                except OSError as e:
+                    errors.append("owner: {0}".format(e))
+            if modules:
+                try:
+                    loaded = snapshot.modules_of(row.pid, keep=False)
+                except OSError as e:
+                    errors.append("modules: {0}".format(e))
+        if errors:
+            record['error'] = "; ".join(errors)
+        yield record
+        for module in loaded:
+            yield {'type': 'module', 'pid': row.pid, 'module': module.name, 'path': module.path,
+                   'base': module.base, 'size': module.size}
+    if threads:
+        for thread in snapshot.threads:
+            yield {'type': 'thread', 'pid': thread.pid, 'tid': thread.tid}
+
+
+def _write(records, stream, buffer, write_record, flush_rows):
+    """Write records to `buffer` with write_record, moving the buffer to `stream` every `flush_rows` records"""
+    count = 0
+    for record in records:
+        write_record(record)
+        count += 1
+        if count % flush_rows == 0:
+            _flush(buffer, stream)
+    _flush(buffer, stream)
+    return count
+
+
+def _flush(buffer, stream):
+    stream.write(buffer.getvalue())
+    buffer.seek(0)
+    buffer.truncate()
+    if hasattr(stream, "flush"):
+        stream.flush()
+
+
+def write_ndjson(records, stream, flush_rows=1000):
+    """Write each record as a line of JSON to the text stream `stream`, `flush_rows` at a time
+
+    :return: The number of records written
+    """
+    buffer = io.StringIO()
+    return _write(records, stream, buffer, lambda r: buffer.write(json.dumps(r, separators=(',', ':')) + "\n"),
+                  flush_rows)
+
+
+def write_csv(records, stream, flush_rows=1000):
+    """Write the records as CSV with a column for each of :data:`FIELDS` to the text stream `stream`, which should
+    be opened with newline='', `flush_rows` at a time
+
+    :return: The number of records written
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS)
+    writer.writeheader()
+    return _write(records, stream, buffer, writer.writerow, flush_rows)
+
+
+_writers = {'ndjson': write_ndjson, 'csv': write_csv}
+
+
+def export(target, format='ndjson', flush_rows=1000, owners=True, modules=True, threads=True):
+    """Take a snapshot and write its :func:`inventory`
+
+    :param target: A path, or a text stream
+    :param format: 'ndjson' or 'csv'
+    :param flush_rows: How many records to write to the target at a time
+    :return: The number of records written
+    """
+    try:
+        write = _writers[format]
+    except KeyError:
+        raise ValueError("Unknown format {0!r}".format(format))
+    with osinfo.Snapshot() as snap:
+        records = inventory(snap, owners, modules, threads)
+        if isinstance(target, (str, os.PathLike)):
+            with open(target, "w", encoding="utf-8", newline="") as f:
+                return write(records, f, flush_rows)
+        return write(records, target, flush_rows)
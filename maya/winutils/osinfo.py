@@ -1,12 +1,52 @@
-from collections import namedtuple
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from itertools import islice
+from maya.ctypeshelper import dict2struct, get_executor
 from maya.winapi.kernel32 import *
 from maya.winapi.advapi32 import *
+from maya.winapi.ntdll import Ntdll, ProcessInformationClass
 from maya.winapi.types import *
+from maya.winutils import security
 
 
 Privilege = namedtuple('Privilege', ['name', 'luid', 'attributes'])
+ProcessFailure = namedtuple('ProcessFailure', ['process', 'error'])
 Module = namedtuple('Module', ['name', 'base', 'size', 'pid', 'path', 'handle'])
 Thread = namedtuple('Thread', ['tid', 'pid', 'flags'])
+Group = namedtuple('Group', ['principal', 'attributes'])
+HandleCacheStats = namedtuple('HandleCacheStats', ['hits', 'misses', 'upgrades', 'evictions', 'open'])
+ProcessCounters = namedtuple('ProcessCounters', ['handle_count', 'thread_count', 'peak_pagefile_usage',
+                                                 'private_page_count'])
+ProcessRow = namedtuple('ProcessRow', ['pid', 'parent_pid', 'name', 'thread_count', 'creation_time', 'counters'])
+ProcessDelta = namedtuple('ProcessDelta', ['started', 'exited', 'changed'])
+
+
+def _run(fn, *args):
+    """Call fn(*args) on the executor of :mod:`maya.ctypeshelper`, so that the event loop isn't blocked, and
+    return an awaitable for the result
+    """
+    # asyncio is slow to import, and only needed by the coroutines
+    import asyncio
+    return asyncio.get_running_loop().run_in_executor(get_executor(), fn, *args)
+
+
+async def _aiterate(iterable, batch=64):
+    """Iterate over a blocking iterable on the executor, yielding each batch of items as it arrives
+
+    :param iterable: The iterable, or a function returning it, which is called on the executor too
+    """
+    if callable(iterable):
+        it = await _run(lambda: iter(iterable()))
+    else:
+        it = iter(iterable)
+    while True:
+        items = await _run(list, islice(it, batch))
+        for item in items:
+            yield item
+        if len(items) < batch:
+            break
 
 
 class Principal:
@@ -14,10 +54,12 @@ class Principal:
     def __init__(self, name=None, sid=None):
         if name and sid:
             raise ValueError("name and sid parameters are mutually exclusive")
+        self._sid = None
+        self._binary_sid = None
         if sid:
             if not isinstance(sid, str):
+                # Converted to a string when it's asked for
                 self._binary_sid = sid
-                self._sid = Advapi32.ConvertSidToStringSidW(sid)
             else:
                 self._sid = sid
                 self._binary_sid = Advapi32.ConvertStringSidToSidW(sid)
@@ -36,117 +78,386 @@ class Principal:
     @property
     def name(self):
         if not self._name:
-            self._name, self._domain, snu = Advapi32.LookupAccountSidW(self._binary_sid)
+            self._name, self._domain, snu = security.accounts.lookup_sid(self._binary_sid)
         return self._name
 
     @property
     def sid(self):
+        if not self._sid:
+            self._sid = Advapi32.ConvertSidToStringSidW(self.binary_sid)
+        return self._sid
+
+    @property
+    def binary_sid(self) -> bytes:
+        """The SID, as bytes that compare equal for equal SIDs"""
         if not self._binary_sid:
             # Get the sid
-            self._binary_sid, domain, snu = Advapi32.LookupAccountNameW(self._name)
-            self._sid = Advapi32.ConvertSidToStringSidW(self._binary_sid)
-        return self._sid
+            self._binary_sid, domain, snu = security.accounts.lookup_name(self._name)
+        return security.sid_bytes(self._binary_sid)
 
     @property
     def domain(self):
         if not self._domain:
-            self._name, self._domain, snu = Advapi32.LookupAccountSidW(self._binary_sid)
+            self._name, self._domain, snu = security.accounts.lookup_sid(self._binary_sid)
         return self._domain
 
 
+def _privileges(info):
+    result = []
+    for p in info['Privileges']:
+        luid = security.luid_to_int(p['Luid'])
+        result.append(Privilege(security.privileges.name(luid), luid, p['Attributes']))
+    return result
+
+
+# How the information classes that Token has properties for are kept: anything else is kept as returned
+_token_converters = {
+    TokenInformationClass.TokenUser: lambda info: Principal(sid=info['User']['Sid']),
+    TokenInformationClass.TokenGroups: lambda info: [Group(Principal(sid=g['Sid']), g['Attributes'])
+                                                     for g in info['Groups']],
+    TokenInformationClass.TokenPrivileges: _privileges,
+}
+
+
 class Token:
-    """A principal's Windows security token"""
+    """A principal's Windows security token.
+
+    Each information class is fetched at most once, and kept converted to its type: :attr:`user` as a
+    :class:`Principal`, :attr:`privileges` as a list of :class:`Privilege`, and so on.  :meth:`prefetch` fetches
+    several classes with one batch of calls, and :meth:`refresh` forgets them, so that they're fetched again.
+    :meth:`adjust_privileges` forgets the privileges it changed by itself.
+    """
     def __init__(self, hToken):
         self._hToken = hToken
-        self._user = None
-        self._session_id = None
-        self._groups = None
+        self._info = {}     # TokenInformationClass: converted information
+
+    def information(self, info_class):
+        """GetTokenInformation for `info_class`, fetched the first time it's asked for
+
+        :param info_class: A :class:`TokenInformationClass`
+        """
+        try:
+            return self._info[info_class]
+        except KeyError:
+            pass
+        return self._store(info_class, Advapi32.GetTokenInformation(self._hToken, info_class, lazy=True))
+
+    def _store(self, info_class, info):
+        convert = _token_converters.get(info_class)
+        value = self._info[info_class] = convert(info) if convert is not None else info
+        return value
+
+    def prefetch(self, *info_classes):
+        """Fetch the information classes that aren't already, with one batch of calls"""
+        missing = [c for c in dict.fromkeys(info_classes) if c not in self._info]
+        if missing:
+            batch = Advapi32.GetTokenInformationBatch(self._hToken, missing, lazy=True)
+            for info_class, info in zip(missing, batch):
+                self._store(info_class, info)
+
+    def refresh(self, *info_classes):
+        """Forget the information classes given, or every one, so that they're fetched again when asked for"""
+        if not info_classes:
+            self._info.clear()
+        for info_class in info_classes:
+            self._info.pop(info_class, None)
 
     @property
     def user(self) -> Principal:
-        if not self._user:
-            self._user = Advapi32.GetTokenInformation(self._hToken,
-                TokenInformationClass.TokenUser)
-        u = Principal(sid=self._user['User']['Sid'])
-        return u
+        return self.information(TokenInformationClass.TokenUser)
 
     @property
     def session_id(self) -> int:
-        if not self._session_id:
-            self._session_id = Advapi32.GetTokenInformation(self._hToken, TokenInformationClass.TokenSessionId)
-        return self._session_id
+        return self.information(TokenInformationClass.TokenSessionId)
 
     @property
     def groups(self):
-        # TODO Groups causes access violation
-        #if not self._groups:
-        #    self._groups = Advapi32.GetTokenInformation(self._hToken, TokenInformationClass.TokenGroups)
-        #return self._groups
-        return None
+        return self.information(TokenInformationClass.TokenGroups)
 
     def close(self):
-        Kernel32.CloseHandle(self._hToken)
+        # Closed at most once, since the handle's value may be given to another object afterwards
+        hToken, self._hToken = self._hToken, None
+        if hToken:
+            Kernel32.CloseHandle(hToken)
 
     def __str__(self):
+        self.prefetch(TokenInformationClass.TokenUser, TokenInformationClass.TokenSessionId,
+                      TokenInformationClass.TokenGroups, TokenInformationClass.TokenPrivileges)
         t = namedtuple('Token', ['user', 'session_id', 'groups', 'privileges'])
-        #return str(t(str(self.user), self.session_id, self.groups, list(self.privileges)))
-        return str(t(str(self.user), self.session_id, None, list(self.privileges)))
+        return str(t(str(self.user), self.session_id, [g.principal.sid for g in self.groups], self.privileges))
 
     def __del__(self):
         self.close()
 
     @property
     def privileges(self):
-        privileges = Advapi32.GetTokenInformation(self._hToken, TokenInformationClass.TokenPrivileges)
-        # logging.debug("Count: {0}".format(privileges['PrivilegeCount']))
-        for i in range(0, privileges['PrivilegeCount']):
-            p = privileges['Privileges'][i]
-            name = Advapi32.LookupPrivilegeNameW(p['Luid'])
-            yield Privilege(name, p['Luid'], p['Attributes'])
+        """The privileges of the token, as a list of :class:`Privilege`"""
+        return self.information(TokenInformationClass.TokenPrivileges)
 
-    def enable_privilege(self, priv):
-        if isinstance(priv, Privilege):
-            priv = priv.name
-        luid = Advapi32.LookupPrivilegeValueW(priv)
-        p = {
-            'PrivilegeCount': 1,
+    def adjust_privileges(self, enable=(), disable=()):
+        """Enable and disable privileges of the token, all in one call.  Privileges the token doesn't have are left
+        alone.
+
+        :param enable: Privileges to enable, as names or :class:`Privilege`
+        :param disable: Privileges to disable, as names or :class:`Privilege`
+        :return: The previous state of the privileges that changed, as a list of :class:`Privilege`
+        """
+        changes = [(p, PrivilegeAttributes.SE_PRIVILEGE_ENABLED) for p in enable] + [(p, 0) for p in disable]
+        if not changes:
+            return []
+        state = dict2struct({
+            'PrivilegeCount': len(changes),
             'Privileges': [{
-                'Luid': luid,
-                'Attributes': 2     # SE_PRIVILEGE_ENABLED
-            }]
-        }
-        Advapi32.AdjustTokenPrivileges(self._hToken, p)
+                'Luid': security.int_to_luid(security.privileges.luid(_privilege_name(p))),
+                'Attributes': attributes
+            } for p, attributes in changes]
+        }, TOKEN_PRIVILEGES)
+        previous = Advapi32.AdjustTokenPrivileges(self._hToken, state)
+        self.refresh(TokenInformationClass.TokenPrivileges)
+        return _privileges(previous)
+
+    def enable_privilege(self, priv):
+        return self.adjust_privileges(enable=[priv])
 
     def disable_privilege(self, priv):
-        if isinstance(priv, Privilege):
-            priv = priv.name
-        luid = Advapi32.LookupPrivilegeValueW(priv)
-        p = {
-            'PrivilegeCount': 1,
-            'Privileges': [{
-                'Luid': luid,
-                'Attributes': 0
-            }]
-        }
-        Advapi32.AdjustTokenPrivileges(self._hToken, p)
+        return self.adjust_privileges(disable=[priv])
+
+
+def _privilege_name(priv):
+    return priv.name if isinstance(priv, Privilege) else priv
+
+
+class _CachedHandle:
+    """A process handle held by :class:`HandleCache`, and how many users have it pinned"""
+    __slots__ = ('pid', 'handle', 'access', 'created', 'pins', 'cached')
+
+    def __init__(self, pid, handle, access, created):
+        self.pid = pid
+        self.handle = handle
+        self.access = access
+        self.created = created
+        self.pins = 1
+        self.cached = False
+
+
+class HandleCache:
+    """Process handles shared by every :class:`Process`, keyed by process ID and creation time.
+
+    :meth:`acquire` pins the handle it returns, and :meth:`release` unpins it; :meth:`pinned` does both around a
+    block.  At most `budget` handles are kept open; past that, the least recently used one that isn't pinned is
+    closed.  Asking for more access than a cached handle has reopens the process with both, and replaces the
+    handle.  A handle that's evicted, replaced or discarded while pinned is closed when it's released, so it's
+    never closed while another thread is using it.  The handles belong to the cache, so don't close them.
+
+    Windows doesn't reuse the ID of a process while a handle to it is open, so a cached handle always refers to
+    the process that has its ID now.  When the creation time of the process being asked for is known, it is checked
+    against the process that's opened, so a newer process that reused the ID is never returned in its place.
+
+    Processes are opened without holding the cache's lock, so threads opening different processes don't wait for
+    each other.
+    """
+    def __init__(self, budget=64):
+        self.budget = budget
+        self._entries = OrderedDict()       # pid: _CachedHandle
+        self._handles = {}                  # handle: _CachedHandle, for every handle still open
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._upgrades = self._evictions = 0
+
+    def acquire(self, pid, access=ProcessAccessRights.PROCESS_QUERY_INFORMATION, creation_time=None):
+        """Return a handle to the process `pid` with at least `access`, pinned until it's given to :meth:`release`
+
+        :param pid: Process ID
+        :param access: The access needed to the process
+        :param creation_time: The creation time of the process, as from :meth:`Kernel32.GetProcessTimes`, if known
+        :raises ProcessLookupError: The process with that creation time has exited
+        """
+        with self._lock:
+            entry = self._entries.get(pid)
+            if entry is None:
+                self._misses += 1
+            else:
+                self._entries.move_to_end(pid)
+                entry.pins += 1
+        if entry is None:
+            entry = self._open(pid, access, creation_time)
+            self._store(entry)
+            return entry.handle
+        try:
+            self._check(entry, creation_time)
+            if entry.access & access == access:
+                with self._lock:
+                    self._hits += 1
+                return entry.handle
+            # The process can't have been replaced while we hold it, so there's nothing to check
+            wider = entry.access | access
+            upgraded = _CachedHandle(pid, Kernel32.OpenProcess(pid, wider), wider, entry.created)
+        except:
+            self.release(entry.handle)
+            raise
+        self._store(upgraded)
+        self.release(entry.handle)
+        with self._lock:
+            self._upgrades += 1
+        return upgraded.handle
+
+    def release(self, handle):
+        """Unpin a handle returned by :meth:`acquire`"""
+        with self._lock:
+            entry = self._handles[handle]
+            entry.pins -= 1
+            if entry.pins or entry.cached:
+                closing = self._evict()
+            else:
+                # It was taken out of the cache while in use
+                del self._handles[handle]
+                closing = [handle]
+        for h in closing:
+            Kernel32.CloseHandle(h)
+
+    @contextmanager
+    def pinned(self, pid, access=ProcessAccessRights.PROCESS_QUERY_INFORMATION, creation_time=None):
+        """Context manager for :meth:`acquire`, giving the pinned handle and releasing it at the end"""
+        handle = self.acquire(pid, access, creation_time)
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    def _store(self, entry):
+        """Put a newly opened entry in the cache, in place of any other for the process, and close what that
+        evicts
+        """
+        with self._lock:
+            old = self._entries.pop(entry.pid, None)
+            self._entries[entry.pid] = entry
+            self._handles[entry.handle] = entry
+            entry.cached = True
+            closing = self._evict()
+            if old is not None:
+                old.cached = False
+                if not old.pins:
+                    del self._handles[old.handle]
+                    closing.append(old.handle)
+        for handle in closing:
+            Kernel32.CloseHandle(handle)
+
+    def _evict(self):
+        """Take the least recently used entries that aren't pinned out of the cache until it's within budget, and
+        return their handles to close once the lock is released.  Must be called with the lock held.
+        """
+        excess = len(self._entries) - self.budget
+        if excess <= 0:
+            return []
+        closing = []
+        for entry in list(self._entries.values()):
+            if not entry.pins:
+                del self._entries[entry.pid]
+                del self._handles[entry.handle]
+                entry.cached = False
+                closing.append(entry.handle)
+                self._evictions += 1
+                excess -= 1
+                if not excess:
+                    break
+        return closing
+
+    def _check(self, entry, creation_time):
+        """Raise ProcessLookupError if the process of a pinned entry isn't the one created at `creation_time`"""
+        if creation_time is None:
+            return
+        if entry.created is None:
+            entry.created = self._creation_time(entry.handle)
+        if entry.created is not None and entry.created != creation_time:
+            # We hold the process that has the ID now, so the one asked for is gone
+            raise ProcessLookupError("Process {0} created at {1} has exited".format(entry.pid, creation_time))
+
+    def _open(self, pid, access, creation_time):
+        """Open a process, returning its entry, pinned"""
+        if creation_time is None:
+            handle = Kernel32.OpenProcess(pid, access)
+            return _CachedHandle(pid, handle, access, self._creation_time(handle))
+        access |= ProcessAccessRights.PROCESS_QUERY_LIMITED_INFORMATION
+        handle = Kernel32.OpenProcess(pid, access)
+        try:
+            created = Kernel32.GetProcessTimes(handle)[0]
+        except:
+            Kernel32.CloseHandle(handle)
+            raise
+        if created != creation_time:
+            Kernel32.CloseHandle(handle)
+            raise ProcessLookupError("Process {0} created at {1} has exited".format(pid, creation_time))
+        return _CachedHandle(pid, handle, access, created)
+
+    @staticmethod
+    def _creation_time(handle):
+        try:
+            return Kernel32.GetProcessTimes(handle)[0]
+        except OSError:
+            # The handle's access doesn't allow it.  Nothing is lost, since it's the process with this ID now.
+            return None
+
+    def creation_time(self, pid):
+        """The creation time of the cached process `pid`, or None if it isn't cached or isn't known"""
+        entry = self._entries.get(pid)
+        return entry.created if entry is not None else None
+
+    def discard(self, pid):
+        """Close the handle to the process `pid`, if there is one, once it isn't pinned"""
+        with self._lock:
+            entry = self._entries.pop(pid, None)
+            closing = self._retire([entry] if entry is not None else [])
+        for handle in closing:
+            Kernel32.CloseHandle(handle)
+
+    def clear(self):
+        """Close every handle, each once it isn't pinned"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            closing = self._retire(entries)
+        for handle in closing:
+            Kernel32.CloseHandle(handle)
+
+    def _retire(self, entries):
+        """Mark entries taken out of the cache, and return the handles of those that can be closed now"""
+        closing = []
+        for entry in entries:
+            entry.cached = False
+            if not entry.pins:
+                del self._handles[entry.handle]
+                closing.append(entry.handle)
+        return closing
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return a :class:`HandleCacheStats` snapshot of the counters"""
+        return HandleCacheStats(self._hits, self._misses, self._upgrades, self._evictions, len(self._entries))
+
+
+# The handles of every Process
+handle_cache = HandleCache()
 
 
 class Process:
-    def __init__(self, pid, name=None, parent_pid=0, flags=0):
+    def __init__(self, pid, name=None, parent_pid=0, flags=0, counters=None, creation_time=None, snapshot=None):
         self._pid = pid
         self._name = ""
         if name:
-            self._name = name.decode('utf-8')
+            self._name = name.decode('utf-8') if isinstance(name, bytes) else name
         self._parent_pid = parent_pid
         self._flags = flags
-        self._handle = None
+        self._counters = counters
+        self._creation_time = creation_time
+        self._snapshot = snapshot
 
     @property
     def name(self):
         if not self._name:
             try:
-                handle = self.open()
-                self._name = Kernel32.GetProcessImageFileNameW(handle)
+                with self.pinned() as handle:
+                    self._name = Kernel32.GetProcessImageFileNameW(handle)
             except:
                 self._name = ""
         return self._name
@@ -155,102 +466,569 @@ class Process:
     def pid(self):
         return self._pid
 
+    @property
+    def counters(self) -> ProcessCounters:
+        """The process's counters, if it was found by :func:`system_processes`, or None"""
+        return self._counters
+
     @property
     def parent_pid(self):
         if not self._parent_pid:
-            # Get the parent pid
-            pass
+            try:
+                with self.pinned() as handle:
+                    info = Ntdll.NtQueryInformationProcess(handle, ProcessInformationClass.ProcessBasicInformation)
+                self._parent_pid = info['InheritedFromUniqueProcessId'] or 0
+            except OSError:
+                pass
         return self._parent_pid
 
+    @property
+    def creation_time(self):
+        """When the process was created, in 100ns units since January 1, 1601, or None if it can't be told"""
+        if self._creation_time is None:
+            try:
+                with self.pinned():
+                    pass
+            except OSError:
+                pass
+        return self._creation_time
+
     def open(self, access=ProcessAccessRights.PROCESS_QUERY_INFORMATION):
+        """Return a handle to the process with at least `access`, from :data:`handle_cache`.  The handle belongs to
+        the cache, and mustn't be closed.  It isn't pinned, so the cache may close it once other processes are
+        opened; use :meth:`pinned` to keep it open while it's used, in particular from several threads.
+        """
+        with self.pinned(access) as handle:
+            return handle
+
+    @contextmanager
+    def pinned(self, access=ProcessAccessRights.PROCESS_QUERY_INFORMATION):
+        """Context manager giving a handle to the process with at least `access`, from :data:`handle_cache`, which
+        the cache doesn't close until the block ends
+        """
         # We can't open if we're pid 0 or 4
-        if not self._handle:
-            self._handle = Kernel32.OpenProcess(self._pid, access)
-        return self._handle
+        handle = handle_cache.acquire(self._pid, access, self._creation_time)
+        try:
+            if self._creation_time is None:
+                # Remember which process this is, so that a later open can't return another that reused the ID
+                self._creation_time = handle_cache.creation_time(self._pid)
+            yield handle
+        finally:
+            handle_cache.release(handle)
 
     def close(self):
-        if self._handle:
-            tmp = self._handle
-            self._handle = None
-            Kernel32.CloseHandle(tmp)
+        """Close the cached handle to the process"""
+        handle_cache.discard(self._pid)
 
     def __str__(self):
         proc = namedtuple('Process', ['pid', 'name', 'parent_pid'])
         return str(proc(self.pid, self.name, self.parent_pid))
 
     def get_token(self, access=TokenPrivileges.TOKEN_QUERY):
-        hProc = self.open()
-        hToken = Advapi32.OpenProcessToken(hProc, access)
+        # Other threads may be opening processes, which could evict an unpinned handle before it's used
+        with self.pinned() as hProc:
+            hToken = Advapi32.OpenProcessToken(hProc, access)
         return Token(hToken)
 
+    async def aget_token(self, access=TokenPrivileges.TOKEN_QUERY):
+        """Asynchronous :meth:`get_token`"""
+        return await _run(self.get_token, access)
+
+    def amodules(self):
+        """Asynchronous iterator over :attr:`modules`"""
+        # The lists are made when the properties are read, which must happen on the executor too
+        return _aiterate(lambda: self.modules)
+
+    def athreads(self):
+        """Asynchronous iterator over :attr:`threads`"""
+        return _aiterate(lambda: self.threads)
+
     @property
     def modules(self):
-        snap = Kernel32.CreateToolhelp32Snapshot(Toolhelp32Flags.TH32CS_SNAPMODULE, self._pid)
-        module = Kernel32.Module32First(snap)
-        yield Module(module['szModule'].decode('utf-8'),
-                     module['modBaseAddr'],
-                     module['modBaseSize'],
-                     module['th32ProcessID'],
-                     module['szExePath'].decode('utf-8'),
-                     module['hModule'])
-        while True:
-            try:
-                module = Kernel32.Module32Next(snap)
-                yield Module(module['szModule'].decode('utf-8'),
-                             module['modBaseAddr'],
-                             module['modBaseSize'],
-                             module['th32ProcessID'],
-                             module['szExePath'].decode('utf-8'),
-                             module['hModule'])
-            except OSError:
-                # TODO check for done
-                break
+        """The modules loaded in the process.  For processes from a :class:`Snapshot`, they're listed once and
+        kept by the snapshot.
+        """
+        if self._snapshot is not None:
+            return iter(self._snapshot.modules_of(self._pid))
+        return iter(_modules(self._pid))
 
     @property
     def threads(self):
+        """The threads of the process.  For processes from a :class:`Snapshot`, they're taken from its index of the
+        threads of every process, which is built with a single pass over the snapshot.
+        """
+        if self._snapshot is not None:
+            threads = self._snapshot.threads_of(self._pid)
+            if threads is not None:
+                return iter(threads)
         snap = Kernel32.CreateToolhelp32Snapshot(Toolhelp32Flags.TH32CS_SNAPTHREAD, self._pid)
-        thread = Kernel32.Thread32First(snap)
-        yield Thread(thread['th32ThreadID'],
-                     thread['th32OwnerProcessID'],
-                     thread['dwFlags'])
+        try:
+            # The snapshot has the threads of every process
+            return iter([t for t in _threads(snap) if t.pid == self._pid])
+        finally:
+            Kernel32.CloseHandle(snap)
+
+
+# What the Toolhelp32 functions fail with past the last entry
+ERROR_NO_MORE_FILES = 18
+
+
+def _toolhelp(first, next_, snap):
+    """Yield the entries of a Toolhelp32 snapshot, with the function for the first and the next entry.  They are
+    read-only mappings over each entry's buffer, as only a few fields of each are read.
+    """
+    try:
+        entry = first(snap, lazy=True)
         while True:
-            try:
-                thread = Kernel32.Thread32Next(snap)
-                yield Thread(thread['th32ThreadID'],
-                             thread['th32OwnerProcessID'],
-                             thread['dwFlags'])
-            except OSError:
-                # TODO check for done
-                break
+            yield entry
+            entry = next_(snap, lazy=True)
+    except OSError as e:
+        code = getattr(e, "winerror", None)
+        if (e.errno if code is None else code) != ERROR_NO_MORE_FILES:
+            raise
+
+
+def _threads(snap):
+    """Yield a :class:`Thread` for each thread in the snapshot"""
+    for thread in _toolhelp(Kernel32.Thread32First, Kernel32.Thread32Next, snap):
+        yield Thread(thread['th32ThreadID'], thread['th32OwnerProcessID'], thread['dwFlags'])
+
+
+def _modules(pid):
+    """The :class:`Module` of each module loaded in the process `pid`, from a snapshot of its own"""
+    snap = Kernel32.CreateToolhelp32Snapshot(Toolhelp32Flags.TH32CS_SNAPMODULE, pid)
+    try:
+        return [Module(module['szModule'].decode('utf-8'),
+                       module['modBaseAddr'],
+                       module['modBaseSize'],
+                       module['th32ProcessID'],
+                       module['szExePath'].decode('utf-8'),
+                       module['hModule'])
+                for module in _toolhelp(Kernel32.Module32First, Kernel32.Module32Next, snap)]
+    finally:
+        Kernel32.CloseHandle(snap)
 
 
 class Snapshot:
+    """A Toolhelp32 snapshot of every process and thread on the system.
+
+    The processes it yields share it: their threads come from an index of every thread by owner, built the first
+    time one is asked for, and their modules are kept once listed.  Toolhelp32 only lists modules of the process a
+    snapshot was taken for, so each process's modules still take a snapshot of their own.
+    """
     def __init__(self):
         self._hSnapshot = Kernel32.CreateToolhelp32Snapshot(Toolhelp32Flags.TH32CS_SNAPALL)
+        self._threads = None        # owner pid: [Thread]
+        self._modules = {}          # pid: [Module]
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        Kernel32.CloseHandle(self._hSnapshot)
+        self.close()
+
+    def close(self):
+        """Close the snapshot.  Threads that were indexed, and modules that were kept, can still be read."""
+        if self._hSnapshot is not None:
+            Kernel32.CloseHandle(self._hSnapshot)
+            self._hSnapshot = None
+
+    def threads_of(self, pid):
+        """The threads of the process `pid`, or None if the snapshot was closed before they were indexed"""
+        if self._threads is None:
+            if self._hSnapshot is None:
+                return None
+            threads = {}
+            for thread in _threads(self._hSnapshot):
+                owned = threads.get(thread.pid)
+                if owned is None:
+                    owned = threads[thread.pid] = []
+                owned.append(thread)
+            self._threads = threads
+        return self._threads.get(pid, [])
+
+    def modules_of(self, pid, keep=True):
+        """The modules of the process `pid`
+
+        :param keep: Keep the list for later calls.  A pass over every process that needs each list once can leave
+            this unset, so that they don't accumulate.
+        """
+        modules = self._modules.get(pid)
+        if modules is None:
+            modules = _modules(pid)
+            if keep:
+                self._modules[pid] = modules
+        return modules
+
+    @property
+    def threads(self):
+        """Every thread in the snapshot, read as it's iterated"""
+        return _threads(self._hSnapshot)
 
     @property
     def processes(self):
-        proc = Kernel32.Process32First(self._hSnapshot)
-        yield Process(proc['th32ProcessID'],
-                      name=proc['szExeFile'],
-                      parent_pid=proc['th32ParentProcessID'],
-                      flags=proc['dwFlags'])
+        for proc in _toolhelp(Kernel32.Process32First, Kernel32.Process32Next, self._hSnapshot):
+            yield Process(proc['th32ProcessID'],
+                          name=proc['szExeFile'],
+                          parent_pid=proc['th32ParentProcessID'],
+                          flags=proc['dwFlags'],
+                          snapshot=self)
+
+    def aprocesses(self):
+        """Asynchronous iterator over :attr:`processes`"""
+        return _aiterate(self.processes)
+
+    def table(self):
+        """Return a :class:`ProcessTable` of every process"""
+        return ProcessTable(self.rows())
+
+    def rows(self):
+        """Yield a :class:`ProcessRow` for each process, without making :class:`Process` objects.  The name is left
+        as bytes, and Toolhelp32 doesn't tell the creation time or counters.
+        """
+        for proc in _toolhelp(Kernel32.Process32First, Kernel32.Process32Next, self._hSnapshot):
+            yield ProcessRow(proc['th32ProcessID'], proc['th32ParentProcessID'], proc['szExeFile'],
+                             proc['cntThreads'], None, None)
+
+
+def _process(row):
+    """Make a :class:`Process` from a :class:`ProcessRow`"""
+    return Process(row.pid, name=row.name, parent_pid=row.parent_pid, counters=row.counters,
+                   creation_time=row.creation_time)
+
+
+def _unicode_string(name):
+    """The text of a UNICODE_STRING view.  It is counted, so it is read by its Length rather than up to a NUL."""
+    address = c_void_p.from_buffer_copy(name.buffer, UNICODE_STRING.Buffer.offset).value
+    if not address:
+        return None
+    return wstring_at(address, name['Length'] // sizeof(c_wchar))
+
+
+def system_process_rows():
+    """Yield a :class:`ProcessRow` for every process on the system, read with a single call"""
+    for info in Ntdll.NtQuerySystemProcessInformation():
+        yield ProcessRow(info['UniqueProcessId'] or 0,
+                         info['InheritedFromUniqueProcessId'] or 0,
+                         _unicode_string(info['ImageName']),
+                         info['NumberOfThreads'],
+                         info['CreateTime'] or None,
+                         ProcessCounters(info['HandleCount'],
+                                         info['NumberOfThreads'],
+                                         info['PeakPagefileUsage'],
+                                         info['PrivatePageCount']))
+
+
+def system_processes():
+    """Yield every process on the system, with its :class:`ProcessCounters`.  Unlike :attr:`Snapshot.processes`,
+    which makes a call per process, the whole list is read with a single call.
+    """
+    for row in system_process_rows():
+        yield _process(row)
+
+
+class ProcessTable:
+    """The processes of a snapshot, stored by column, for queries over many processes at once.
+
+    Each column is an :class:`array.array` with an entry per process: :attr:`pid`, :attr:`parent_pid`,
+    :attr:`thread_count`, :attr:`creation_time` (0 when it isn't known) and :attr:`name_id`, which indexes the
+    distinct image names in :attr:`names`.  Rows are numbered in the order they were added.  Indexes by pid, by
+    image name and from parent to children are built the first time they're needed, and are arrays of row numbers
+    too, rather than dictionaries holding an object per process.
+
+    :param rows: The :class:`ProcessRow` of each process, e.g. from :meth:`Snapshot.rows` or
+        :func:`system_process_rows`
+    """
+    def __init__(self, rows=()):
+        self.pid = array('I')
+        self.parent_pid = array('I')
+        self.thread_count = array('I')
+        self.creation_time = array('Q')
+        self.name_id = array('I')
+        self.names = []
+        name_ids = {}
+        for row in rows:
+            name_id = name_ids.get(row.name)
+            if name_id is None:
+                name_id = name_ids[row.name] = len(self.names)
+                name = row.name
+                self.names.append(name.decode('utf-8') if isinstance(name, bytes) else name or "")
+            self.pid.append(row.pid)
+            self.parent_pid.append(row.parent_pid)
+            self.thread_count.append(row.thread_count)
+            self.creation_time.append(row.creation_time or 0)
+            self.name_id.append(name_id)
+        self._pid_slots = None
+        self._by_name = None
+        self._parents = None
+        self._first_child = None
+        self._next_sibling = None
+
+    def __len__(self):
+        return len(self.pid)
+
+    def row(self, i) -> ProcessRow:
+        """The :class:`ProcessRow` of row `i`"""
+        return ProcessRow(self.pid[i], self.parent_pid[i], self.names[self.name_id[i]], self.thread_count[i],
+                          self.creation_time[i] or None, None)
+
+    def process(self, i) -> Process:
+        """A :class:`Process` for row `i`"""
+        return _process(self.row(i))
+
+    def _index_pids(self):
+        """Build the pid index: an open addressing hash table of rows, at most half full"""
+        size = 1 << max(3, (2 * len(self)).bit_length())
+        mask = size - 1
+        slots = array('i', [-1]) * size
+        for i, pid in enumerate(self.pid):
+            # Process IDs are multiples of 4
+            slot = (pid >> 2) & mask
+            while slots[slot] != -1:
+                slot = (slot + 1) & mask
+            slots[slot] = i
+        self._pid_slots = slots
+
+    def index(self, pid):
+        """The row of the process `pid`, or None if there is none"""
+        if self._pid_slots is None:
+            self._index_pids()
+        slots = self._pid_slots
+        mask = len(slots) - 1
+        slot = (pid >> 2) & mask
         while True:
-            try:
-                proc = Kernel32.Process32Next(self._hSnapshot)
-                yield Process(proc['th32ProcessID'],
-                              name=proc['szExeFile'],
-                              parent_pid=proc['th32ParentProcessID'],
-                              flags=proc['dwFlags'])
-            except OSError:
-                # TODO check for done
-                break
+            i = slots[slot]
+            if i == -1:
+                return None
+            if self.pid[i] == pid:
+                return i
+            slot = (slot + 1) & mask
+
+    def by_name(self, name):
+        """The rows of every process whose image is `name`, which isn't case sensitive"""
+        if self._by_name is None:
+            ids = {}
+            for i, name_id in enumerate(self.name_id):
+                rows = ids.get(name_id)
+                if rows is None:
+                    rows = ids[name_id] = array('I')
+                rows.append(i)
+            self._by_name = {}
+            for name_id, rows in ids.items():
+                key = self.names[name_id].lower()
+                if key in self._by_name:
+                    self._by_name[key] = array('I', sorted(self._by_name[key] + rows))
+                else:
+                    self._by_name[key] = rows
+        return list(self._by_name.get(name.lower(), ()))
+
+    def parent(self, i):
+        """The row of the parent of row `i`, or None if it isn't in the table.  A process whose ID was reused by one
+        that started after the child isn't its parent, and neither is a process whose own parents lead back to the
+        child, which happens when IDs are reused and the creation times aren't known.
+        """
+        if self._parents is None:
+            self._link()
+        p = self._parents[i]
+        return p if p != -1 else None
+
+    def _parent(self, i):
+        """The row of the process with the parent ID of row `i`, unless it was created after row `i`, or -1"""
+        if self.parent_pid[i] == self.pid[i]:
+            # The idle process is its own parent
+            return -1
+        p = self.index(self.parent_pid[i])
+        if p is None:
+            return -1
+        if self.creation_time[p] and self.creation_time[i] and self.creation_time[p] > self.creation_time[i]:
+            return -1
+        return p
+
+    def _link(self):
+        """Build the parent of each row, and the children of each row as linked lists, first child and next
+        sibling.  Rows in a cycle of parents are made roots.
+        """
+        n = len(self)
+        parents = array('i', (self._parent(i) for i in range(n)))
+        # Follow each row's parents until a root, or a row already seen: 1 while on the chain followed, then 2
+        state = bytearray(n)
+        for start in range(n):
+            chain = []
+            i = start
+            while i != -1 and not state[i]:
+                state[i] = 1
+                chain.append(i)
+                i = parents[i]
+            if i != -1 and state[i] == 1:
+                # The chain came back to a row on it, so each row from there on is its own ancestor
+                for j in chain[chain.index(i):]:
+                    parents[j] = -1
+            for j in chain:
+                state[j] = 2
+        first_child = array('i', [-1]) * n
+        next_sibling = array('i', [-1]) * n
+        for i in reversed(range(n)):
+            p = parents[i]
+            if p != -1:
+                next_sibling[i] = first_child[p]
+                first_child[p] = i
+        self._parents = parents
+        self._first_child = first_child
+        self._next_sibling = next_sibling
+
+    def children(self, i):
+        """The rows of the children of row `i`"""
+        if self._first_child is None:
+            self._link()
+        rows = []
+        child = self._first_child[i]
+        while child != -1:
+            rows.append(child)
+            child = self._next_sibling[child]
+        return rows
+
+    def roots(self):
+        """The rows whose parents aren't in the table"""
+        if self._parents is None:
+            self._link()
+        return [i for i, p in enumerate(self._parents) if p == -1]
+
+    def walk(self, i=None):
+        """Yield (depth, row) for each row of the process tree under row `i`, or of every tree if `i` is None,
+        depth first
+        """
+        if self._first_child is None:
+            self._link()
+        first_child = self._first_child
+        next_sibling = self._next_sibling
+        stack = [(0, i)] if i is not None else [(0, root) for root in reversed(self.roots())]
+        # The links have no cycles, but a row is never yielded twice all the same
+        seen = bytearray(len(self))
+        while stack:
+            depth, row = stack.pop()
+            if seen[row]:
+                continue
+            seen[row] = 1
+            yield depth, row
+            children = []
+            child = first_child[row]
+            while child != -1:
+                children.append((depth + 1, child))
+                child = next_sibling[child]
+            stack.extend(reversed(children))
+
+    def to_numpy(self):
+        """The columns as NumPy arrays sharing their memory, in a dictionary with the names as a further column.
+        Requires NumPy.
+        """
+        import numpy
+        columns = {name: numpy.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode)
+                   for name in ('pid', 'parent_pid', 'thread_count', 'creation_time', 'name_id')}
+        columns['names'] = numpy.array(self.names, dtype=object)
+        return columns
+
+
+def snapshot_rows():
+    """Return the :class:`ProcessRow` of every process, from a new :class:`Snapshot`"""
+    with Snapshot() as snap:
+        return list(snap.rows())
+
+
+class ProcessMonitor:
+    """Watch for processes starting, exiting and changing, by comparing each enumeration with the previous one.
+
+    Processes are told apart by (pid, creation time).  When the source doesn't tell the creation time, as with
+    Toolhelp32, a pid that comes back with another parent or image name is taken to be a new process.  The
+    :class:`Process` of each is made when it starts and kept until it exits, so an unchanged system costs only the
+    enumeration and a dictionary lookup per process.  A process has changed when its thread count or counters
+    have.
+
+    The first :meth:`poll` only records what is running.  Iterating over the monitor polls until :meth:`stop`,
+    yielding each non-empty :class:`ProcessDelta`.  The interval drops to `min_interval` when something happened,
+    and doubles after each quiet poll, up to `max_interval`.
+
+    :param source: Returns the current :class:`ProcessRow` list.  :func:`system_process_rows` is cheaper than the
+        default, and tells the creation times and counters.
+    :param on_start: Called with each :class:`Process` that started
+    :param on_exit: Called with each :class:`Process` that exited
+    :param on_change: Called with each :class:`Process` that changed
+    """
+    def __init__(self, source=snapshot_rows, min_interval=0.5, max_interval=8.0, on_start=None, on_exit=None,
+                 on_change=None):
+        self._source = source
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.on_start = on_start
+        self.on_exit = on_exit
+        self.on_change = on_change
+        self._generation = None         # key: [row, Process]
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _key(row):
+        if row.creation_time is None:
+            return row.pid, row.parent_pid, row.name
+        return row.pid, row.creation_time
+
+    @property
+    def processes(self):
+        """The processes running at the last poll"""
+        return [entry[1] for entry in (self._generation or {}).values()]
+
+    def poll(self):
+        """Enumerate the processes, and return the :class:`ProcessDelta` since the last poll"""
+        first = self._generation is None
+        previous = self._generation or {}
+        current = {}
+        started = []
+        changed = []
+        key = self._key
+        for row in self._source():
+            k = key(row)
+            entry = previous.get(k)
+            if entry is None:
+                entry = [row, _process(row)]
+                started.append(entry[1])
+            elif entry[0] != row:
+                entry[0] = row
+                entry[1]._counters = row.counters
+                changed.append(entry[1])
+            current[k] = entry
+        self._generation = current
+        if first:
+            return ProcessDelta([], [], [])
+
+        exited = []
+        # Everything still running was found in the previous generation, unless something exited
+        if len(current) - len(started) != len(previous):
+            exited = [entry[1] for k, entry in previous.items() if k not in current]
+        self._notify(self.on_start, started)
+        self._notify(self.on_exit, exited)
+        self._notify(self.on_change, changed)
+        return ProcessDelta(started, exited, changed)
+
+    @staticmethod
+    def _notify(callback, processes):
+        if callback is not None:
+            for proc in processes:
+                callback(proc)
+
+    def stop(self):
+        """Stop iterating, waking the iterator if it's waiting"""
+        self._stopped.set()
+
+    def __iter__(self):
+        self._stopped.clear()
+        if self._generation is None:
+            self.poll()
+        while not self._stopped.wait(self.interval):
+            delta = self.poll()
+            if delta.started or delta.exited or delta.changed:
+                self.interval = self.min_interval
+                yield delta
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
 
 
 def get_effective_token(access=TokenPrivileges.TOKEN_QUERY):
@@ -277,30 +1055,110 @@ def whoami():
     return token.user
 
 
-def find_user_processes(username):
-    user = whoami()
-    # Our token must have the SeDebug privilege
-    token = get_effective_token(TokenPrivileges.TOKEN_QUERY | TokenPrivileges.TOKEN_ADJUST_PRIVILEGES)
+# The idle process and System, which have no tokens to open
+_SYSTEM_PIDS = (0, 4)
+
 
-    user_is_self = username.lower() == user.name.lower()
+def is_system_pid(pid):
+    """Whether `pid` is the idle process or System, which can't be opened like other processes"""
+    return pid in _SYSTEM_PIDS
 
-    have_debug = False
+
+def _user_sid(username):
+    """The SID of the account `username`, as compared by :func:`_owner`"""
+    return security.sid_bytes(security.accounts.lookup_name(username)[0])
+
+
+def _check_access(sid):
+    """Raise RuntimeError if the processes of the user `sid` can't be inspected"""
+    # Our token must have the SeDebug privilege
+    token = get_effective_token(TokenPrivileges.TOKEN_QUERY | TokenPrivileges.TOKEN_ADJUST_PRIVILEGES)
+    if token.user.binary_sid == sid:
+        return
     for priv in token.privileges:
         if priv.name == 'SeDebugPrivilege':
-            have_debug = True
+            return
+    raise RuntimeError("Must have the SeDebugPrivilege")
 
-    if not have_debug and not user_is_self:
-        raise RuntimeError("Must have the SeDebugPrivilege")
 
-    with Snapshot() as snap:
-        for proc in snap.processes:
-            if proc.pid == 0 or proc.pid == 4:
-                continue
-            try:
-                token = proc.get_token()
-                if token.user.name.lower() == username.lower():
-                    yield proc
-            except:
-                continue
+def _owner(proc):
+    """(proc, SID of its user, None), or (proc, None, error) if the token can't be read"""
+    try:
+        return proc, proc.get_token().user.binary_sid, None
+    except OSError as e:
+        return proc, None, e
 
 
+def find_user_processes(username, concurrency=8, on_error=None):
+    """Yield the processes owned by `username`.  The tokens of up to `concurrency` processes are read at a time on
+    the executor of :mod:`maya.ctypeshelper`, and each process is yielded as soon as it's found to match, so not
+    necessarily in snapshot order.  Owners are compared by SID, so no account names are looked up.
+
+    :param username: The account name
+    :param concurrency: How many processes to inspect at once
+    :param on_error: Called with a :class:`ProcessFailure` for each process whose token couldn't be read.  By
+        default those processes are skipped.
+    :raises RuntimeError: We can't inspect the processes of other users
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+    sid = _user_sid(username)
+    _check_access(sid)
+    executor = get_executor()
+    pending = set()
+
+    def finished():
+        nonlocal pending
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            proc, owner, error = future.result()
+            if error is not None:
+                if on_error is not None:
+                    on_error(ProcessFailure(proc, error))
+            elif owner == sid:
+                yield proc
+
+    try:
+        with Snapshot() as snap:
+            for proc in snap.processes:
+                if is_system_pid(proc.pid):
+                    continue
+                if len(pending) >= concurrency:
+                    yield from finished()
+                pending.add(executor.submit(_owner, proc))
+        while pending:
+            yield from finished()
+    finally:
+        # The caller may stop early
+        for future in pending:
+            future.cancel()
+
+
+async def afind_user_processes(username, concurrency=8, on_error=None):
+    """Asynchronous :func:`find_user_processes`"""
+    import asyncio
+    sid = await _run(_user_sid, username)
+    await _run(_check_access, sid)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def check(proc):
+        async with limit:
+            return await _run(_owner, proc)
+
+    snap = await _run(Snapshot)
+    try:
+        procs = [proc async for proc in snap.aprocesses() if not is_system_pid(proc.pid)]
+    finally:
+        await _run(snap.close)
+    tasks = [asyncio.ensure_future(check(proc)) for proc in procs]
+    try:
+        for task in asyncio.as_completed(tasks):
+            proc, owner, error = await task
+            if error is not None:
+                if on_error is not None:
+                    on_error(ProcessFailure(proc, error))
+            elif owner == sid:
+                yield proc
+    finally:
+        # The caller may stop early
+        for task in tasks:
+            task.cancel()
@@ -1,6 +1,273 @@
+#!/usr/bin/env python3
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from ctypes import sizeof
+from maya.winapi.advapi32 import Advapi32
+from maya.winapi.ntdll import Ntdll
+from maya.winapi.types import LUID
 
+__all__ = ['AccountCache', 'AccountCacheStats', 'accounts', 'PrivilegeTable', 'privileges', 'boot_id',
+           'luid_to_int', 'int_to_luid', 'sid_bytes']
 
+# LookupAccountSid and LookupAccountName fail with this when there is no such account
+ERROR_NONE_MAPPED = 1332
 
 
+def sid_bytes(sid):
+    """The bytes of a binary SID, without whatever follows it in its buffer, so that equal SIDs compare equal"""
+    sid = bytes(sid)
+    # Revision, SubAuthorityCount, a 6 byte IdentifierAuthority, then the sub-authorities
+    return sid[:8 + 4 * sid[1]] if len(sid) > 1 else sid
 
 
+class AccountCacheStats(namedtuple('AccountCacheStats', ['hits', 'negative_hits', 'misses', 'coalesced',
+                                                         'evictions', 'size'])):
+    __slots__ = ()
+
+    @property
+    def hit_rate(self):
+        """The fraction of lookups answered without calling the resolver"""
+        total = self.hits + self.negative_hits + self.misses + self.coalesced
+        return (self.hits + self.negative_hits + self.coalesced) / total if total else 0.0
+
+
+class _Flight:
+    """A lookup in progress, which other threads asking for the same account wait on"""
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class AccountCache:
+    """A cache in front of :meth:`Advapi32.LookupAccountSidW` and :meth:`Advapi32.LookupAccountNameW`, which may have
+    to ask a domain controller.
+
+    Results are kept for `ttl` seconds, and at most `max_entries` of them, dropping the least recently used.
+    Accounts that don't exist are remembered for `negative_ttl` seconds, and the error is raised again without a
+    lookup; other errors aren't cached.  When several threads look up the same account at once, only one of them
+    calls the resolver, and the others get its result.
+    """
+    def __init__(self, ttl=600.0, negative_ttl=60.0, max_entries=4096, clock=time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()       # key: (expiry, value, error)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._hits = self._negative_hits = self._misses = self._coalesced = self._evictions = 0
+
+    def lookup_sid(self, sid, system=None):
+        """Cached :meth:`Advapi32.LookupAccountSidW`
+
+        :param sid: The binary SID
+        :param system: The system on which to search.  None is the local computer
+        :return: (name, domain, sid_name_use)
+        """
+        return self._lookup(('sid', system, sid_bytes(sid)), Advapi32.LookupAccountSidW, sid, system)
+
+    def lookup_name(self, name, system=None):
+        """Cached :meth:`Advapi32.LookupAccountNameW`.  Account names aren't case sensitive.
+
+        :param name: The account name
+        :param system: The system on which to search.  None is the local computer
+        :return: (sid, domain, sid_name_use)
+        """
+        return self._lookup(('name', system, name.lower()), Advapi32.LookupAccountNameW, name, system)
+
+    def _lookup(self, key, resolve, *args):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expiry, value, error = entry
+                if expiry > self._clock():
+                    self._entries.move_to_end(key)
+                    if error is None:
+                        self._hits += 1
+                        return value
+                    self._negative_hits += 1
+                    # Raised afresh each time, so the traceback doesn't grow
+                    raise error.with_traceback(None)
+                del self._entries[key]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._misses += 1
+            else:
+                self._coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error.with_traceback(None)
+            return flight.value
+
+        try:
+            flight.value = resolve(*args)
+        except BaseException as e:
+            # Whatever happens, the threads waiting on the lookup must be let go
+            flight.error = e
+        with self._lock:
+            del self._flights[key]
+            if flight.error is None:
+                self._store(key, self.ttl, flight.value, None)
+            elif isinstance(flight.error, OSError) and _code(flight.error) == ERROR_NONE_MAPPED:
+                self._store(key, self.negative_ttl, None, flight.error)
+        flight.done.set()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _store(self, key, ttl, value, error):
+        self._entries[key] = (self._clock() + ttl, value, error)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self):
+        """Forget every account"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return an :class:`AccountCacheStats` snapshot of the counters"""
+        return AccountCacheStats(self._hits, self._negative_hits, self._misses, self._coalesced, self._evictions,
+                                 len(self._entries))
+
+
+def _code(e):
+    code = getattr(e, "winerror", None)
+    return e.errno if code is None else code
+
+
+# The accounts looked up by maya.winutils.osinfo
+accounts = AccountCache()
+
+
+# The privileges defined in winnt.h
+PRIVILEGE_NAMES = (
+    "SeCreateTokenPrivilege", "SeAssignPrimaryTokenPrivilege", "SeLockMemoryPrivilege",
+    "SeIncreaseQuotaPrivilege", "SeMachineAccountPrivilege", "SeTcbPrivilege", "SeSecurityPrivilege",
+    "SeTakeOwnershipPrivilege", "SeLoadDriverPrivilege", "SeSystemProfilePrivilege", "SeSystemtimePrivilege",
+    "SeProfileSingleProcessPrivilege", "SeIncreaseBasePriorityPrivilege", "SeCreatePagefilePrivilege",
+    "SeCreatePermanentPrivilege", "SeBackupPrivilege", "SeRestorePrivilege", "SeShutdownPrivilege",
+    "SeDebugPrivilege", "SeAuditPrivilege", "SeSystemEnvironmentPrivilege", "SeChangeNotifyPrivilege",
+    "SeRemoteShutdownPrivilege", "SeUndockPrivilege", "SeSyncAgentPrivilege", "SeEnableDelegationPrivilege",
+    "SeManageVolumePrivilege", "SeImpersonatePrivilege", "SeCreateGlobalPrivilege",
+    "SeTrustedCredManAccessPrivilege", "SeRelabelPrivilege", "SeIncreaseWorkingSetPrivilege",
+    "SeTimeZonePrivilege", "SeCreateSymbolicLinkPrivilege", "SeDelegateSessionUserImpersonatePrivilege",
+)
+
+
+def luid_to_int(luid):
+    """Convert a LUID, as the bytes of the structure, to an integer"""
+    return int.from_bytes(luid, 'little')
+
+
+def int_to_luid(value):
+    """Convert an integer to a LUID, as the bytes of the structure"""
+    return value.to_bytes(sizeof(LUID), 'little')
+
+
+def boot_id():
+    """Identify the current boot of the system, by the time it started"""
+    return Ntdll.NtQuerySystemTimeOfDayInformation()['BootTime']
+
+
+class PrivilegeTable:
+    """Privilege names and their LUIDs, which are fixed until the system restarts.
+
+    Mappings are looked up the first time they're needed, and kept.  :meth:`warm_up` looks up every known privilege
+    at once, and can persist the table to a file, from which later processes load it for as long as the system
+    hasn't restarted.  LUIDs are integers; the LUID bytes that the API returns are accepted too.
+    """
+    def __init__(self, names=PRIVILEGE_NAMES):
+        self.names = names
+        self._names = {}        # LUID: name
+        self._luids = {}        # lower case name: LUID
+        self.lookups = 0
+
+    def _add(self, name, luid):
+        self._names[luid] = name
+        self._luids[name.lower()] = luid
+
+    def name(self, luid):
+        """The name of the privilege with `luid`"""
+        if not isinstance(luid, int):
+            luid = luid_to_int(luid)
+        try:
+            return self._names[luid]
+        except KeyError:
+            pass
+        self.lookups += 1
+        name = Advapi32.LookupPrivilegeNameW(int_to_luid(luid))
+        self._add(name, luid)
+        return name
+
+    def luid(self, name):
+        """The LUID of the privilege `name`, as an integer.  Privilege names aren't case sensitive."""
+        try:
+            return self._luids[name.lower()]
+        except KeyError:
+            pass
+        self.lookups += 1
+        luid = luid_to_int(Advapi32.LookupPrivilegeValueW(name))
+        self._add(name, luid)
+        return luid
+
+    def warm_up(self, path=None):
+        """Fill the table with every privilege in :attr:`names`.  If `path` is given, the table is loaded from that
+        file when it was saved during this boot, and saved there otherwise.
+        """
+        if path is not None and self.load(path):
+            return
+        for name in self.names:
+            if name.lower() in self._luids:
+                continue
+            self.lookups += 1
+            try:
+                self._add(name, luid_to_int(Advapi32.LookupPrivilegeValueW(name)))
+            except OSError:
+                # Not a privilege on this version of Windows
+                continue
+        if path is not None:
+            self.save(path)
+
+    def load(self, path):
+        """Add the privileges saved in `path` by :meth:`save`, returning False if the file is missing, malformed or
+        from an earlier boot
+        """
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(saved, dict) or saved.get("boot_id") != boot_id():
+            return False
+        entries = saved.get("privileges")
+        if not isinstance(entries, dict) or not all(isinstance(luid, int) for luid in entries.values()):
+            return False
+        for name, luid in entries.items():
+            self._add(name, luid)
+        return True
+
+    def save(self, path):
+        """Save the table to `path`, marked with the current boot"""
+        with open(path, "w") as f:
+            json.dump({"boot_id": boot_id(), "privileges": {name: luid for luid, name in self._names.items()}}, f)
+
+    def __len__(self):
+        return len(self._names)
+
+
+# The privileges looked up by maya.winutils.osinfo
+privileges = PrivilegeTable()
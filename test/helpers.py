@@ -0,0 +1,533 @@
+"""What the tests share: a few libc stand-ins for foreign functions, and a simulated Windows.
+
+:class:`SimulatedWindows` implements the functions of kernel32, psapi, advapi32 and ntdll that maya declares, as ctypes
+callbacks over a model of processes, accounts and tokens.  :func:`simulate` loads the DLLs from it through
+:func:`maya.winapi.functions.set_loader`, so the tests go through the real declarations, with their marshalling,
+sized buffers and error checking.
+"""
+import gc
+import threading
+import time
+from collections import Counter, namedtuple
+from ctypes import *
+from types import SimpleNamespace
+from unittest import mock
+
+from maya.ctypeshelper import HelperFunc, var_sizeof
+from maya.winapi import functions
+from maya.winapi.functions import STATUS_INFO_LENGTH_MISMATCH
+from maya.winapi.ntdll import PROCESS_BASIC_INFORMATION, SYSTEM_TIMEOFDAY_INFORMATION, ProcessInformationClass, \
+    SystemInformationClass
+from maya.winapi.types import BOOL, DWORD, HANDLE, LUID, LUID_AND_ATTRIBUTES, MODULEENTRY32, PROCESSENTRY32, PSID, \
+    SID_AND_ATTRIBUTES, THREADENTRY32, TOKEN_GROUPS, TOKEN_PRIVILEGES, TOKEN_USER, ULONG, PrivilegeAttributes, \
+    ProcessAccessRights, TokenInformationClass, Toolhelp32Flags
+from maya.winutils import osinfo, security
+
+
+libc = CDLL(None)
+
+
+class timeval(Structure):
+    _fields_ = [
+        ("tv_sec", c_long),
+        ("tv_usec", c_long)
+    ]
+
+
+class PositiveFunc(HelperFunc):
+    """A libc function that fails by returning a negative number"""
+    @staticmethod
+    def errcheck(result, func, args):
+        if result < 0:
+            raise ValueError(result)
+        return HelperFunc.errcheck(result, func, args)
+
+
+# Error codes of the simulated functions
+ERROR_ACCESS_DENIED = 5
+ERROR_INVALID_HANDLE = 6
+ERROR_NO_MORE_FILES = 18
+ERROR_INVALID_PARAMETER = 87
+ERROR_INSUFFICIENT_BUFFER = 122
+ERROR_NO_TOKEN = 1008
+ERROR_NO_SUCH_PRIVILEGE = 1313
+ERROR_NONE_MAPPED = 1332
+STATUS_INVALID_INFO_CLASS = 0xC0000003
+STATUS_INVALID_HANDLE = 0xC0000008
+
+# The pseudo-handles of the current process and thread, as HANDLE parameters receive them
+CURRENT_PROCESS = c_void_p(-1).value
+CURRENT_THREAD = c_void_p(-2).value
+
+# The LUIDs every Windows version since Vista gives its privileges
+LUIDS = dict((name, i + 2) for i, name in enumerate(security.PRIVILEGE_NAMES))
+
+
+def sid(rid):
+    """The binary SID S-1-5-21-1-2-3-`rid`, of an account in a domain"""
+    return bytes([1, 5]) + (5).to_bytes(6, 'big') + b"".join(x.to_bytes(4, 'little') for x in (21, 1, 2, 3, rid))
+
+
+def string_sid(value):
+    """The string form of a binary SID"""
+    subs = [int.from_bytes(value[8 + 4 * i:12 + 4 * i], 'little') for i in range(value[1])]
+    return "S-{0}-{1}-{2}".format(value[0], int.from_bytes(value[2:8], 'big'), "-".join(map(str, subs)))
+
+
+def patch(test, target, name, value):
+    """Replace the attribute `name` of `target` by `value` until the test case `test` ends"""
+    patcher = mock.patch.object(target, name, value)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+def simulate(test, system):
+    """Load the DLLs from `system` until the test case `test` ends.  The caches maya keeps across calls are
+    replaced by empty ones meanwhile.
+    """
+    functions.set_loader(lambda name: system)
+    test.addCleanup(functions.set_loader, None)
+    # osinfo calls these through ctypes.windll, which only exists on Windows
+    windll = SimpleNamespace(kernel32=SimpleNamespace(GetCurrentProcess=lambda: CURRENT_PROCESS,
+                                                      GetCurrentThread=lambda: CURRENT_THREAD))
+    patcher = mock.patch.object(osinfo, "windll", windll, create=True)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    for target, name, value in ((osinfo, "handle_cache", osinfo.HandleCache()),
+                                (security, "accounts", security.AccountCache()),
+                                (security, "privileges", security.PrivilegeTable())):
+        patch(test, target, name, value)
+    # Tokens close their handles when collected, which must happen while the DLLs are simulated
+    test.addCleanup(gc.collect)
+
+
+class SimulatedProcess:
+    """A process of :class:`SimulatedWindows`.
+
+    :param owner: The account its token belongs to.  None if the process can't be opened.
+    :param created: Its creation time, by default ten times its ID
+    :param threads: The thread count Toolhelp32 reports
+    :param modules: The names of the modules loaded in it, or None if they can't be listed
+    """
+    def __init__(self, pid, name, owner=None, parent=0, created=None, threads=1, modules=(), session=1):
+        self.pid = pid
+        self.name = name
+        self.owner = owner
+        self.parent = parent
+        self.created = pid * 10 if created is None else created
+        self.threads = threads
+        self.modules = modules
+        self.session = session
+
+
+ProcessHandle = namedtuple('ProcessHandle', ['process', 'access'])
+TokenHandle = namedtuple('TokenHandle', ['account', 'session'])
+
+
+class SnapshotHandle:
+    """A Toolhelp32 snapshot: the entries of each kind, and how far each has been read"""
+    def __init__(self, **entries):
+        self.entries = entries
+        self.positions = {}
+
+
+class SimulatedWindows:
+    """Processes, accounts and tokens, behind the functions maya declares for them.
+
+    Handles are small multiples of 4, and the value of a closed handle is given to the next object opened, as
+    Windows does.  Every call is recorded in :attr:`calls`.  A function can be slowed down with :attr:`delays`, which
+    also shows how many calls overlap in :attr:`most`, and made to fail with :attr:`failures`.  The functions are
+    implemented by the lower case methods named in :data:`_FUNCTIONS`, which tests may replace on an instance.
+
+    :param processes: The :class:`SimulatedProcess` of each process, in snapshot order
+    :param accounts: The account names, whose SIDs are :func:`sid` of 1000, 1001, ...
+    :param current: The account of the current process's token
+    :param privileges: The privileges every token has, disabled unless named in :attr:`enabled`
+    :param boot_time: When the system started, as ZwQuerySystemInformation(SystemTimeInformation) tells
+    """
+    def __init__(self, processes=(), accounts=("alice", "bob", "carol"), current="alice",
+                 privileges=("SeDebugPrivilege",), boot_time=132000000000000000):
+        self.processes = dict((p.pid, p) for p in processes)
+        self.threads = []                   # (thread ID, process ID), in snapshot order
+        self.accounts = {}                  # lower case name: (name, SID, domain)
+        for i, name in enumerate(accounts):
+            self.add_account(name, 1000 + i)
+        self.current = current
+        self.privileges = list(privileges)
+        self.enabled = set()                # The privileges enabled
+        self.defaults = set()               # The privileges enabled by default
+        self.boot_time = boot_time
+        self.groups = {}                    # account: [(group account, attributes)]
+        self.handles = {}
+        self.calls = []                     # (function, arguments, thread ID)
+        self.delays = {}                    # function: seconds
+        self.failures = {}                  # function: error code
+        self.active = Counter()
+        self.most = Counter()
+        self.account_lookups = []           # The SIDs and names given to LookupAccountSid and LookupAccountName
+        self.privilege_lookups = []         # The LUIDs and names given to LookupPrivilegeName and LookupPrivilegeValue
+        self.token_queries = []             # The information classes GetTokenInformation answered, or refused
+        self.lock = threading.RLock()
+        self._strings = []                  # Strings returned by pointer, which are never freed
+        for name, method, restype, argtypes in _FUNCTIONS:
+            setattr(self, name, CFUNCTYPE(restype, *argtypes)(self._callback(name, method)))
+
+    def add_account(self, name, rid, domain="DOMAIN"):
+        self.accounts[name.lower()] = (name, sid(rid), domain)
+
+    def sid_of(self, account):
+        return self.accounts[account.lower()][1]
+
+    def called(self, function):
+        """The arguments of each call made to `function`"""
+        return [args for name, args, thread in self.calls if name == function]
+
+    def open_handles(self, kind=ProcessHandle):
+        """The handles open to objects of `kind`"""
+        return dict((h, obj) for h, obj in self.handles.items() if isinstance(obj, kind))
+
+    def open_token(self, account, session=1):
+        """A handle to a token of `account`, as if it had been opened"""
+        return self._allocate(TokenHandle(account, session))
+
+    def _callback(self, name, method):
+        def call(*args):
+            with self.lock:
+                self.calls.append((name, args, threading.get_ident()))
+                self.active[name] += 1
+                self.most[name] = max(self.most[name], self.active[name])
+            try:
+                if name in self.delays:
+                    time.sleep(self.delays[name])
+                if name in self.failures:
+                    raise OSError(self.failures[name], "Simulated failure")
+                result = getattr(self, method)(*args)
+                return 1 if result is None else result
+            except OSError as e:
+                # Read back by WinError
+                set_errno(e.errno)
+                return 0
+            finally:
+                with self.lock:
+                    self.active[name] -= 1
+        return call
+
+    def _allocate(self, obj):
+        with self.lock:
+            handle = 4
+            while handle in self.handles:
+                handle += 4
+            self.handles[handle] = obj
+        return handle
+
+    def _get(self, handle, kind):
+        obj = self.handles.get(handle)
+        if not isinstance(obj, kind):
+            raise OSError(ERROR_INVALID_HANDLE, "The handle is invalid")
+        return obj
+
+    def _account(self, name):
+        return self.accounts[name.lower()]
+
+    @staticmethod
+    def _write_string(text, buffer, size):
+        """Copy `text` to a buffer of `size` characters, or fail with the size it needs"""
+        if size[0] < len(text) + 1:
+            size[0] = len(text) + 1
+            raise OSError(ERROR_INSUFFICIENT_BUFFER, "The data area passed to a system call is too small")
+        value = create_unicode_buffer(text)
+        memmove(buffer, value, sizeof(value))
+        size[0] = len(text)
+
+    @staticmethod
+    def _read_sid(address):
+        return string_at(address, 8 + 4 * c_ubyte.from_address(address + 1).value)
+
+    #
+    # kernel32 and psapi
+    #
+    def close_handle(self, handle):
+        with self.lock:
+            if self.handles.pop(handle, None) is None:
+                raise OSError(ERROR_INVALID_HANDLE, "The handle is invalid")
+
+    def open_process(self, access, inherit, pid):
+        process = self.processes.get(pid)
+        if process is None:
+            raise OSError(ERROR_INVALID_PARAMETER, "The parameter is incorrect")
+        if process.owner is None:
+            raise OSError(ERROR_ACCESS_DENIED, "Access is denied")
+        return self._allocate(ProcessHandle(process, access))
+
+    def get_process_times(self, handle, creation, exit_, kernel, user):
+        process, access = self._get(handle, ProcessHandle)
+        if not access & (ProcessAccessRights.PROCESS_QUERY_INFORMATION |
+                         ProcessAccessRights.PROCESS_QUERY_LIMITED_INFORMATION):
+            raise OSError(ERROR_ACCESS_DENIED, "Access is denied")
+        creation[0] = process.created
+        exit_[0] = kernel[0] = user[0] = 0
+
+    def get_process_image_file_name(self, handle, buffer, size):
+        process = self._get(handle, ProcessHandle).process
+        text = "\\Device\\HarddiskVolume2\\" + process.name
+        self._write_string(text, buffer, pointer(DWORD(size)))
+        return len(text)
+
+    def create_toolhelp32_snapshot(self, flags, pid):
+        entries = {}
+        if flags & Toolhelp32Flags.TH32CS_SNAPPROCESS:
+            entries['process'] = [PROCESSENTRY32(dwSize=sizeof(PROCESSENTRY32), th32ProcessID=p.pid,
+                                                 th32ParentProcessID=p.parent, cntThreads=p.threads,
+                                                 szExeFile=p.name.encode())
+                                  for p in self.processes.values()]
+        if flags & Toolhelp32Flags.TH32CS_SNAPTHREAD:
+            entries['thread'] = [THREADENTRY32(dwSize=sizeof(THREADENTRY32), th32ThreadID=tid, th32OwnerProcessID=pid)
+                                 for tid, pid in self.threads]
+        if flags & Toolhelp32Flags.TH32CS_SNAPMODULE and pid:
+            process = self.processes.get(pid)
+            if process is None or process.modules is None:
+                raise OSError(ERROR_ACCESS_DENIED, "Access is denied")
+            entries['module'] = [MODULEENTRY32(dwSize=sizeof(MODULEENTRY32), th32ProcessID=pid,
+                                               modBaseAddr=0x10000 * (i + 1), modBaseSize=0x1000,
+                                               hModule=0x10000 * (i + 1), szModule=name.encode(),
+                                               szExePath=b"C:\\Windows\\" + name.encode())
+                                 for i, name in enumerate(process.modules)]
+        return self._allocate(SnapshotHandle(**entries))
+
+    def _first(kind):
+        def first(self, handle, entry):
+            self._get(handle, SnapshotHandle).positions[kind] = 0
+            return self._next(handle, entry, kind)
+        return first
+
+    def _next(self, handle, entry, kind):
+        snapshot = self._get(handle, SnapshotHandle)
+        entries = snapshot.entries.get(kind, [])
+        position = snapshot.positions.get(kind, 0)
+        if position == len(entries):
+            raise OSError(ERROR_NO_MORE_FILES, "There are no more files")
+        memmove(entry, byref(entries[position]), sizeof(entries[position]))
+        snapshot.positions[kind] = position + 1
+
+    def _reader(kind):
+        def next_(self, handle, entry):
+            return self._next(handle, entry, kind)
+        return next_
+
+    process32_first, process32_next = _first("process"), _reader("process")
+    thread32_first, thread32_next = _first("thread"), _reader("thread")
+    module32_first, module32_next = _first("module"), _reader("module")
+
+    #
+    # advapi32
+    #
+    def open_process_token(self, handle, access, token):
+        if handle == CURRENT_PROCESS:
+            token[0] = self.open_token(self.current)
+            return
+        process = self._get(handle, ProcessHandle).process
+        token[0] = self.open_token(process.owner, process.session)
+
+    def open_thread_token(self, handle, access, as_self, token):
+        raise OSError(ERROR_NO_TOKEN, "An attempt was made to reference a token that does not exist")
+
+    def _token_information(self, token, info_class):
+        """(size, fill(address)) for the information class of a token, or None if it isn't simulated"""
+        if info_class == TokenInformationClass.TokenUser:
+            user = self.sid_of(token.account)
+
+            def fill(address):
+                info = TOKEN_USER.from_address(address)
+                memmove(address + sizeof(TOKEN_USER), user, len(user))
+                info.User.Sid = cast(c_void_p(address + sizeof(TOKEN_USER)), PSID)
+            return sizeof(TOKEN_USER) + len(user), fill
+        if info_class == TokenInformationClass.TokenGroups:
+            groups = [(self.sid_of(name), attributes) for name, attributes in self.groups.get(token.account, [])]
+            header = var_sizeof(TOKEN_GROUPS, len(groups))
+
+            def fill(address):
+                TOKEN_GROUPS.from_address(address).GroupCount = len(groups)
+                entries = (SID_AND_ATTRIBUTES * len(groups)).from_address(address + TOKEN_GROUPS.Groups.offset)
+                offset = header
+                for entry, (group, attributes) in zip(entries, groups):
+                    memmove(address + offset, group, len(group))
+                    entry.Sid = cast(c_void_p(address + offset), PSID)
+                    entry.Attributes = attributes
+                    offset += len(group)
+            return header + sum(len(group) for group, attributes in groups), fill
+        if info_class == TokenInformationClass.TokenPrivileges:
+            return var_sizeof(TOKEN_PRIVILEGES, len(self.privileges)), self._fill_privileges(
+                [(LUIDS[name], self.attributes(name)) for name in self.privileges])
+        if info_class == TokenInformationClass.TokenSessionId:
+            def fill(address):
+                DWORD.from_address(address).value = token.session
+            return sizeof(DWORD), fill
+        return None
+
+    def attributes(self, name):
+        """The attributes of the privilege `name` in every token"""
+        attributes = PrivilegeAttributes.SE_PRIVILEGE_ENABLED if name in self.enabled else 0
+        if name in self.defaults:
+            attributes |= PrivilegeAttributes.SE_PRIVILEGE_ENABLED_BY_DEFAULT
+        return attributes
+
+    @staticmethod
+    def _fill_privileges(privileges):
+        """fill(address) writing TOKEN_PRIVILEGES for [(LUID, attributes)]"""
+        def fill(address):
+            TOKEN_PRIVILEGES.from_address(address).PrivilegeCount = len(privileges)
+            entries = (LUID_AND_ATTRIBUTES * len(privileges)).from_address(address + TOKEN_PRIVILEGES.Privileges.offset)
+            for entry, (luid, attributes) in zip(entries, privileges):
+                entry.Luid = LUID(*security.int_to_luid(luid))
+                entry.Attributes = attributes
+        return fill
+
+    def get_token_information(self, handle, info_class, buffer, length, needed):
+        token = self._get(handle, TokenHandle)
+        info = self._token_information(token, info_class)
+        if info is None:
+            self.token_queries.append(info_class)
+            raise OSError(ERROR_INVALID_PARAMETER, "The parameter is incorrect")
+        size, fill = info
+        needed[0] = size
+        if length < size:
+            raise OSError(ERROR_INSUFFICIENT_BUFFER, "The data area passed to a system call is too small")
+        fill(buffer)
+        self.token_queries.append(info_class)
+
+    def adjust_token_privileges(self, handle, disable_all, state, length, previous, needed):
+        self._get(handle, TokenHandle)
+        count = state.contents.PrivilegeCount
+        entries = (LUID_AND_ATTRIBUTES * count).from_address(addressof(state.contents) +
+                                                             TOKEN_PRIVILEGES.Privileges.offset)
+        names = dict((luid, name) for name, luid in LUIDS.items())
+        changes = [(names.get(security.luid_to_int(bytes(e.Luid))), e.Attributes) for e in entries]
+        changes = [(name, attributes) for name, attributes in changes if name in self.privileges]
+        size = var_sizeof(TOKEN_PRIVILEGES, len(changes))
+        needed[0] = size
+        if previous and length < size:
+            raise OSError(ERROR_INSUFFICIENT_BUFFER, "The data area passed to a system call is too small")
+        if previous:
+            self._fill_privileges([(LUIDS[name], self.attributes(name)) for name, attributes in changes])(previous)
+        for name, attributes in changes:
+            if attributes & PrivilegeAttributes.SE_PRIVILEGE_ENABLED:
+                self.enabled.add(name)
+            else:
+                self.enabled.discard(name)
+
+    def convert_sid_to_string_sid(self, address, string):
+        text = create_unicode_buffer(string_sid(self._read_sid(address)))
+        with self.lock:
+            self._strings.append(text)
+        string[0] = addressof(text)
+
+    def lookup_account_sid(self, system, address, name, name_size, domain, domain_size, use):
+        value = self._read_sid(address)
+        with self.lock:
+            self.account_lookups.append(value)
+        for account, account_sid, account_domain in self.accounts.values():
+            if account_sid == value:
+                break
+        else:
+            raise OSError(ERROR_NONE_MAPPED, "No mapping between account names and security IDs was done")
+        self._write_string(account, name, name_size)
+        self._write_string(account_domain, domain, domain_size)
+        use[0] = 1
+
+    def lookup_account_name(self, system, name, address, sid_size, domain, domain_size, use):
+        with self.lock:
+            self.account_lookups.append(name)
+        if name.lower() not in self.accounts:
+            raise OSError(ERROR_NONE_MAPPED, "No mapping between account names and security IDs was done")
+        account, value, account_domain = self.accounts[name.lower()]
+        if sid_size[0] < len(value):
+            sid_size[0] = len(value)
+            raise OSError(ERROR_INSUFFICIENT_BUFFER, "The data area passed to a system call is too small")
+        memmove(address, value, len(value))
+        sid_size[0] = len(value)
+        self._write_string(account_domain, domain, domain_size)
+        use[0] = 1
+
+    def lookup_privilege_name(self, system, address, name, size):
+        luid = security.luid_to_int(string_at(address, sizeof(LUID)))
+        with self.lock:
+            self.privilege_lookups.append(luid)
+        for known, value in LUIDS.items():
+            if value == luid:
+                return self._write_string(known, name, size)
+        raise OSError(ERROR_NO_SUCH_PRIVILEGE, "A specified privilege does not exist")
+
+    def lookup_privilege_value(self, system, name, luid):
+        with self.lock:
+            self.privilege_lookups.append(name)
+        for known, value in LUIDS.items():
+            if known.lower() == name.lower():
+                memmove(luid, security.int_to_luid(value), sizeof(LUID))
+                return
+        raise OSError(ERROR_NO_SUCH_PRIVILEGE, "A specified privilege does not exist")
+
+    #
+    # ntdll
+    #
+    def query_information_process(self, handle, info_class, buffer, length, needed):
+        """Only ProcessBasicInformation, which NT answers for the exact size of the structure alone"""
+        if info_class != ProcessInformationClass.ProcessBasicInformation:
+            return c_long(STATUS_INVALID_INFO_CLASS).value
+        obj = self.handles.get(handle)
+        if not isinstance(obj, ProcessHandle):
+            return c_long(STATUS_INVALID_HANDLE).value
+        if needed:
+            needed[0] = sizeof(PROCESS_BASIC_INFORMATION)
+        if length != sizeof(PROCESS_BASIC_INFORMATION):
+            return c_long(STATUS_INFO_LENGTH_MISMATCH).value
+        info = PROCESS_BASIC_INFORMATION.from_address(buffer)
+        info.UniqueProcessId = obj.process.pid
+        info.InheritedFromUniqueProcessId = obj.process.parent
+        return 0
+
+    def query_system_information(self, info_class, buffer, length, needed):
+        """Only SystemTimeInformation, which NT answers for the exact size of the structure alone"""
+        if info_class != SystemInformationClass.SystemTimeInformation:
+            return c_long(STATUS_INVALID_INFO_CLASS).value
+        if needed:
+            needed[0] = sizeof(SYSTEM_TIMEOFDAY_INFORMATION)
+        if length != sizeof(SYSTEM_TIMEOFDAY_INFORMATION):
+            return c_long(STATUS_INFO_LENGTH_MISMATCH).value
+        SYSTEM_TIMEOFDAY_INFORMATION.from_address(buffer).BootTime = self.boot_time
+        return 0
+
+    del _first, _reader
+
+
+PDWORD = POINTER(DWORD)
+PULONGLONG = POINTER(c_ulonglong)
+
+# (function, method implementing it, return type, argument types)
+_FUNCTIONS = [
+    ("CloseHandle", "close_handle", BOOL, (HANDLE,)),
+    ("OpenProcess", "open_process", HANDLE, (DWORD, BOOL, DWORD)),
+    ("GetProcessTimes", "get_process_times", BOOL, (HANDLE, PULONGLONG, PULONGLONG, PULONGLONG, PULONGLONG)),
+    ("GetProcessImageFileNameW", "get_process_image_file_name", DWORD, (HANDLE, c_void_p, DWORD)),
+    ("CreateToolhelp32Snapshot", "create_toolhelp32_snapshot", HANDLE, (DWORD, DWORD)),
+    ("Process32First", "process32_first", BOOL, (HANDLE, c_void_p)),
+    ("Process32Next", "process32_next", BOOL, (HANDLE, c_void_p)),
+    ("Thread32First", "thread32_first", BOOL, (HANDLE, c_void_p)),
+    ("Thread32Next", "thread32_next", BOOL, (HANDLE, c_void_p)),
+    ("Module32First", "module32_first", BOOL, (HANDLE, c_void_p)),
+    ("Module32Next", "module32_next", BOOL, (HANDLE, c_void_p)),
+    ("OpenProcessToken", "open_process_token", BOOL, (HANDLE, DWORD, POINTER(HANDLE))),
+    ("OpenThreadToken", "open_thread_token", BOOL, (HANDLE, DWORD, BOOL, POINTER(HANDLE))),
+    ("GetTokenInformation", "get_token_information", BOOL, (HANDLE, DWORD, c_void_p, DWORD, PDWORD)),
+    ("AdjustTokenPrivileges", "adjust_token_privileges", BOOL,
+     (HANDLE, BOOL, POINTER(TOKEN_PRIVILEGES), DWORD, c_void_p, PDWORD)),
+    ("ConvertSidToStringSidW", "convert_sid_to_string_sid", BOOL, (c_void_p, POINTER(c_void_p))),
+    ("LookupAccountSidW", "lookup_account_sid", BOOL,
+     (c_void_p, c_void_p, c_void_p, PDWORD, c_void_p, PDWORD, PDWORD)),
+    ("LookupAccountNameW", "lookup_account_name", BOOL,
+     (c_void_p, c_wchar_p, c_void_p, PDWORD, c_void_p, PDWORD, PDWORD)),
+    ("LookupPrivilegeNameW", "lookup_privilege_name", BOOL, (c_wchar_p, c_void_p, c_void_p, PDWORD)),
+    ("LookupPrivilegeValueW", "lookup_privilege_value", BOOL, (c_void_p, c_wchar_p, c_void_p)),
+    ("ZwQueryInformationProcess", "query_information_process", c_long,
+     (HANDLE, DWORD, c_void_p, DWORD, POINTER(ULONG))),
+    ("ZwQuerySystemInformation", "query_system_information", c_long, (DWORD, c_void_p, ULONG, POINTER(ULONG))),
+]
@@ -0,0 +1,121 @@
+import threading
+from unittest import TestCase, mock
+
+from maya.winutils import security
+from maya.winutils.security import AccountCache, ERROR_NONE_MAPPED
+from test.helpers import SimulatedWindows, sid, simulate, string_sid
+
+
+ALICE, BOB, UNKNOWN = sid(1000), sid(1001), sid(9)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAccountCache(TestCase):
+    def setUp(self):
+        self.system = SimulatedWindows(accounts=())
+        self.system.add_account("alice", 1000, "CORP")
+        self.system.add_account("bob", 1001, "CORP")
+        # Lookups answer after a delay, so that concurrent ones overlap
+        self.system.delays["LookupAccountSidW"] = 0.05
+        simulate(self, self.system)
+        self.clock = Clock()
+        self.cache = AccountCache(ttl=60, negative_ttl=5, max_entries=3, clock=self.clock)
+
+    def test_hit(self):
+        self.assertEqual(self.cache.lookup_sid(ALICE), ["alice", "CORP", 1])
+        self.assertEqual(self.cache.lookup_sid(bytearray(ALICE)), ["alice", "CORP", 1])
+        self.assertEqual(len(self.system.account_lookups), 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats.hits, stats.misses), (1, 1))
+        self.assertEqual(stats.hit_rate, 0.5)
+
+    def test_ttl(self):
+        self.cache.lookup_sid(ALICE)
+        self.clock.now = 59
+        self.cache.lookup_sid(ALICE)
+        self.assertEqual(len(self.system.account_lookups), 1)
+        self.clock.now = 61
+        self.cache.lookup_sid(ALICE)
+        self.assertEqual(len(self.system.account_lookups), 2)
+
+    def test_negative(self):
+        for _ in range(3):
+            with self.assertRaises(OSError) as cm:
+                self.cache.lookup_sid(UNKNOWN)
+            self.assertEqual(cm.exception.errno, ERROR_NONE_MAPPED)
+        self.assertEqual(len(self.system.account_lookups), 1)
+        self.assertEqual(self.cache.stats().negative_hits, 2)
+        # Unresolvable accounts are forgotten sooner, in case they are created
+        self.clock.now = 6
+        self.system.add_account("carol", 9, "CORP")
+        self.assertEqual(self.cache.lookup_sid(UNKNOWN)[0], "carol")
+
+    def test_other_errors_not_cached(self):
+        # The RPC server is unavailable
+        self.system.failures["LookupAccountSidW"] = 1722
+        self.assertRaises(OSError, self.cache.lookup_sid, ALICE)
+        self.assertRaises(OSError, self.cache.lookup_sid, ALICE)
+        self.assertEqual(len(self.system.called("LookupAccountSidW")), 2)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru(self):
+        del self.system.delays["LookupAccountSidW"]
+        self.cache.lookup_sid(ALICE)
+        self.cache.lookup_sid(BOB)
+        self.assertRaises(OSError, self.cache.lookup_sid, sid(3))
+        self.cache.lookup_sid(ALICE)
+        self.cache.lookup_name("Alice")
+        # Bob was the least recently used
+        self.assertEqual(self.cache.stats().evictions, 1)
+        self.cache.lookup_sid(ALICE)
+        self.cache.lookup_sid(BOB)
+        self.assertEqual(self.system.account_lookups.count(BOB), 2)
+        self.assertEqual(self.system.account_lookups.count(ALICE), 1)
+
+    def test_names(self):
+        value, domain, use = self.cache.lookup_name("ALICE")
+        self.assertEqual((string_sid(value), domain, use), (string_sid(ALICE), "CORP", 1))
+        self.assertEqual(self.cache.lookup_name("alice"), [value, domain, use])
+        self.assertEqual(self.system.account_lookups, ["ALICE"])
+
+    def test_coalescing(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.lookup_sid(BOB)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [["bob", "CORP", 1]] * 8)
+        self.assertEqual(self.system.account_lookups, [BOB])
+        stats = self.cache.stats()
+        self.assertEqual(stats.misses + stats.coalesced + stats.hits, 8)
+        self.assertEqual(stats.misses, 1)
+
+    def test_coalesced_errors(self):
+        errors = []
+
+        def lookup():
+            try:
+                self.cache.lookup_sid(UNKNOWN)
+            except OSError as e:
+                errors.append(e.errno)
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [ERROR_NONE_MAPPED] * 4)
+        self.assertEqual(len(self.system.account_lookups), 1)
+
+    def test_failed_leader_releases_waiters(self):
+        with mock.patch.object(security.Advapi32, "LookupAccountSidW", side_effect=ValueError("bad SID")):
+            self.assertRaises(ValueError, self.cache.lookup_sid, ALICE)
+        self.assertEqual(self.cache.lookup_sid(ALICE)[0], "alice")
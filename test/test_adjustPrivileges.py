@@ -0,0 +1,80 @@
+from unittest import TestCase, mock
+
+from maya.ctypeshelper import resolve
+from maya.winapi.types import TOKEN_PRIVILEGES, PrivilegeAttributes
+from maya.winutils import osinfo
+from maya.winutils.security import int_to_luid
+from test.helpers import LUIDS, SimulatedWindows, simulate
+
+
+ENABLED = PrivilegeAttributes.SE_PRIVILEGE_ENABLED
+BY_DEFAULT = PrivilegeAttributes.SE_PRIVILEGE_ENABLED_BY_DEFAULT
+NAMES = ["SeShutdownPrivilege", "SeDebugPrivilege", "SeChangeNotifyPrivilege", "SeUndockPrivilege",
+         "SeTimeZonePrivilege"]
+
+
+class TestAdjustPrivileges(TestCase):
+    def setUp(self):
+        # The token holds 20, 23 and 25, but not 19 or 34
+        self.system = SimulatedWindows(privileges=("SeDebugPrivilege", "SeChangeNotifyPrivilege",
+                                                   "SeUndockPrivilege"))
+        self.system.enabled = {"SeChangeNotifyPrivilege"}
+        self.system.defaults = {"SeChangeNotifyPrivilege"}
+        simulate(self, self.system)
+
+    @property
+    def privileges(self):
+        """LUID: attributes of each privilege the token holds"""
+        return dict((LUIDS[name], self.system.attributes(name)) for name in self.system.privileges)
+
+    @property
+    def calls(self):
+        return len(self.system.called("AdjustTokenPrivileges"))
+
+    def token(self):
+        return osinfo.Token(self.system.open_token("alice"))
+
+    def test_one_call(self):
+        previous = self.token().adjust_privileges(enable=["SeDebugPrivilege", "SeUndockPrivilege"],
+                                                  disable=[osinfo.Privilege("SeChangeNotifyPrivilege", 23, 0)])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.privileges, {20: ENABLED, 23: BY_DEFAULT, 25: ENABLED})
+        self.assertEqual(previous, [osinfo.Privilege("SeDebugPrivilege", 20, 0),
+                                    osinfo.Privilege("SeUndockPrivilege", 25, 0),
+                                    osinfo.Privilege("SeChangeNotifyPrivilege", 23, 3)])
+
+    def test_not_held(self):
+        previous = self.token().adjust_privileges(enable=["SeShutdownPrivilege", "SeDebugPrivilege"])
+        self.assertEqual([p.name for p in previous], ["SeDebugPrivilege"])
+        self.assertNotIn(19, self.privileges)
+
+    def test_previous_state_restores(self):
+        token = self.token()
+        before = self.privileges
+        previous = token.adjust_privileges(enable=NAMES)
+        token.adjust_privileges(enable=[p for p in previous if p.attributes & ENABLED],
+                                disable=[p for p in previous if not p.attributes & ENABLED])
+        self.assertEqual(self.privileges, before)
+
+    def test_nothing(self):
+        self.assertEqual(self.token().adjust_privileges(), [])
+        self.assertEqual(self.calls, 0)
+
+    def test_single(self):
+        token = self.token()
+        token.enable_privilege("SeUndockPrivilege")
+        token.disable_privilege("SeDebugPrivilege")
+        self.assertEqual(self.privileges[25], ENABLED)
+        self.assertEqual(self.calls, 2)
+
+    def test_new_state_sized(self):
+        with mock.patch.object(osinfo.Advapi32, "AdjustTokenPrivileges",
+                               wraps=osinfo.Advapi32.AdjustTokenPrivileges) as adjust:
+            self.token().adjust_privileges(enable=["SeDebugPrivilege"] * 2, disable=["SeUndockPrivilege"] * 3)
+        state = adjust.call_args.args[1]
+        self.assertIsInstance(state, TOKEN_PRIVILEGES)
+        self.assertEqual(resolve(state), {
+            'PrivilegeCount': 5,
+            'Privileges': [{'Luid': int_to_luid(20), 'Attributes': ENABLED}] * 2 +
+                          [{'Luid': int_to_luid(25), 'Attributes': 0}] * 3
+        })
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase
+
+from maya.winutils import osinfo
+from test.helpers import SimulatedProcess, SimulatedWindows, simulate
+
+
+def process(pid, name, owner=None):
+    """A simulated process, whose only module is its executable"""
+    return SimulatedProcess(pid, name, owner, modules=[name])
+
+
+PROCESSES = [
+    process(0, "[System Process]"),
+    process(4, "System"),
+    process(100, "explorer.exe", "alice"),
+    process(101, "cmd.exe", "bob"),
+    process(102, "python.exe", "alice"),
+    process(103, "denied.exe"),
+] + [process(pid, "worker.exe", "alice") for pid in range(200, 216)]
+
+
+class TestAsyncOsinfo(TestCase):
+    def setUp(self):
+        # Every process has two threads.  Opening a token takes a while.
+        self.system = SimulatedWindows(PROCESSES)
+        self.system.threads = [(p.pid * 10 + i, p.pid) for p in PROCESSES for i in range(2)]
+        self.system.delays["OpenProcessToken"] = 0.01
+        simulate(self, self.system)
+
+    def run_loop(self, coro):
+        """Run a coroutine, checking that no simulated function is called on the event loop's thread"""
+        del self.system.calls[:]
+        result = asyncio.run(coro)
+        loop_thread = threading.get_ident()
+        self.assertEqual([name for name, args, thread in self.system.calls if thread == loop_thread], [])
+        return result
+
+    def collect(self, agen):
+        async def main():
+            return [x async for x in agen]
+        return self.run_loop(main())
+
+    def test_aprocesses(self):
+        with osinfo.Snapshot() as snap:
+            procs = self.collect(snap.aprocesses())
+        self.assertEqual([p.pid for p in procs], [p.pid for p in PROCESSES])
+        self.assertEqual(procs[2].name, "explorer.exe")
+
+    def test_amodules_athreads(self):
+        loop_thread = threading.get_ident()
+        with osinfo.Snapshot() as snap:
+            del self.system.calls[:]
+            for proc in (osinfo.Process(100, snapshot=snap), osinfo.Process(101)):
+                modules = self.collect(proc.amodules())
+                threads = self.collect(proc.athreads())
+                self.assertEqual([m.pid for m in modules], [proc.pid])
+                self.assertEqual([t.tid for t in threads], [proc.pid * 10, proc.pid * 10 + 1])
+        toolhelp = [(name, thread) for name, args, thread in self.system.calls if name != "CloseHandle"]
+        self.assertGreater(len(toolhelp), 0)
+        self.assertNotIn(loop_thread, [thread for name, thread in toolhelp])
+
+    def test_aget_token(self):
+        async def main():
+            return await osinfo.Process(101).aget_token()
+        token = self.run_loop(main())
+        self.assertEqual(token.user.name, "bob")
+        self.assertNotIn(threading.get_ident(), [thread for name, args, thread in self.system.calls
+                                                 if name == "OpenProcessToken"])
+
+    def test_afind_user_processes(self):
+        found = self.collect(osinfo.afind_user_processes("Alice", concurrency=4))
+        expected = [p.pid for p in PROCESSES if p.owner == "alice"]
+        self.assertEqual(sorted(p.pid for p in found), expected)
+        self.assertEqual(sorted(p.pid for p in osinfo.find_user_processes("alice")), expected)
+
+    def test_bounded_concurrency(self):
+        self.collect(osinfo.afind_user_processes("alice", concurrency=3))
+        self.assertGreater(self.system.most["OpenProcessToken"], 1)
+        self.assertLessEqual(self.system.most["OpenProcessToken"], 3)
+
+    def test_loop_not_blocked(self):
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.005)
+
+        async def main():
+            tick = asyncio.ensure_future(ticker())
+            found = [p async for p in osinfo.afind_user_processes("bob", concurrency=1)]
+            tick.cancel()
+            return found
+
+        self.assertEqual([p.pid for p in self.run_loop(main())], [101])
+        # 21 tokens are opened one at a time, 10ms each
+        self.assertGreater(len(ticks), 10)
+
+    def test_stop_early(self):
+        async def main():
+            async for proc in osinfo.afind_user_processes("alice"):
+                return proc
+        self.assertEqual(self.system.processes[self.run_loop(main()).pid].owner, "alice")
+
+    def test_access_denied(self):
+        self.system.privileges = ["SeShutdownPrivilege"]
+        with self.assertRaises(RuntimeError):
+            self.collect(osinfo.afind_user_processes("bob"))
@@ -0,0 +1,64 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from ctypes import *
+
+from maya.ctypeshelper import HelperFunc, InParam, ReturnOutParam, set_executor
+from test.helpers import PositiveFunc, libc
+
+
+class TestCallMany(TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        set_executor(self.executor)
+        self.usleep = HelperFunc(CFUNCTYPE, "usleep", libc, c_int)
+        self.usleep.params = [
+            InParam(c_uint, "usec")
+        ]
+        self.threads = {}
+
+        def endptr():
+            # Record which thread made each buffer
+            p = pointer(c_char_p())
+            self.threads[id(p)] = (p, threading.get_ident())
+            return p
+
+        self.strtol = PositiveFunc(CFUNCTYPE, "strtol", libc, c_long)
+        self.strtol.params = [
+            InParam(c_char_p, "nptr"),
+            ReturnOutParam(POINTER(c_char_p), "endptr", endptr),
+            InParam(c_int, "base", lambda: 10)
+        ]
+
+    def tearDown(self):
+        set_executor(None)
+        self.executor.shutdown()
+
+    def test_concurrent(self):
+        # 8 calls sleeping 100ms each take about 100ms together, not 800ms
+        start = time.perf_counter()
+        self.usleep.call_many([(100000,)] * 8)
+        self.assertLess(time.perf_counter() - start, 0.4)
+
+    def test_submit(self):
+        futures = [self.strtol.submit(b"12ab"), self.strtol.submit(b"ffz", base=16)]
+        self.assertEqual([f.result() for f in futures], [b"ab", b"z"])
+
+    def test_order(self):
+        numbers = [(str(i).encode() + b"x" * i,) for i in range(20)]
+        self.assertEqual(self.strtol.call_many(numbers), [b"x" * i for i in range(20)])
+
+    def test_buffers_not_shared(self):
+        self.strtol.call_many([(b"1a",)] * 32)
+        self.assertEqual(len(self.threads), 32)
+
+    def test_exceptions(self):
+        with self.assertRaises(ValueError):
+            self.strtol.call_many([(b"1a",), (b"-1b",), (b"2c",)])
+
+    def test_return_exceptions(self):
+        ret = self.strtol.call_many([(b"1a",), (b"-1b",), (b"2c",)], return_exceptions=True)
+        self.assertEqual(ret[0], b"a")
+        self.assertIsInstance(ret[1], ValueError)
+        self.assertEqual(ret[2], b"c")
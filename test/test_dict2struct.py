@@ -1,6 +1,6 @@
 from unittest import TestCase
 from ctypes import *
-from maya.ctypeshelper import dict2struct
+from maya.ctypeshelper import dict2struct, _fillers
 
 
 class SubStructure(Structure):
@@ -18,6 +18,32 @@ class TestStructure(Structure):
     ]
 
 
+class ArrayStructure(Structure):
+    _fields_ = [
+        ("count", c_ulong),
+        ("items", SubStructure * 4)
+    ]
+
+
+class NameStructure(Structure):
+    _fields_ = [
+        ("name", c_char * 8)
+    ]
+
+
+class PointerStructure(Structure):
+    _fields_ = [
+        ("ptr", POINTER(SubStructure))
+    ]
+
+
+class SubUnion(Union):
+    _fields_ = [
+        ("one", c_ulong),
+        ("two", c_ubyte)
+    ]
+
+
 class TestDict2struct(TestCase):
     def test_dict2struct(self):
         arr = [1, 2, 3, 4, 5, 6, 7, 8]
@@ -33,3 +59,32 @@ class TestDict2struct(TestCase):
         self.assertEqual(y.num, 1)
         self.assertTrue(all(map(lambda x: x[0] == x[1], zip(arr, y.array))))
         self.assertEqual(y.struct.one, 1)
+
+    def test_array_of_structures(self):
+        d = {
+            'count': 2,
+            'items': [{'one': 1, 'two': 2}, {'one': 3, 'two': 4}]
+        }
+        y = dict2struct(d, ArrayStructure)
+        self.assertEqual(y.count, 2)
+        self.assertEqual((y.items[1].one, y.items[1].two), (3, 4))
+        self.assertEqual(y.items[2].one, 0)
+
+    def test_char_array(self):
+        y = dict2struct({'name': b'foo'}, NameStructure)
+        self.assertEqual(y.name, b'foo')
+
+    def test_pointer(self):
+        y = dict2struct({'ptr': {'one': 5, 'two': 6}}, PointerStructure)
+        self.assertEqual(y.ptr.contents.two, 6)
+
+    def test_union(self):
+        y = dict2struct({'one': 7}, SubUnion)
+        self.assertEqual(y.one, 7)
+
+    def test_plan_is_cached(self):
+        dict2struct({'count': 0, 'items': []}, ArrayStructure)
+        fill = _fillers[ArrayStructure]
+        dict2struct({'count': 0, 'items': []}, ArrayStructure)
+        self.assertIs(fill, _fillers[ArrayStructure])
+        self.assertIn(SubStructure, _fillers)
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from maya.winutils import export, osinfo
+from test.helpers import SimulatedProcess, SimulatedWindows, TokenHandle, simulate, string_sid
+
+
+PROCESSES = [
+    SimulatedProcess(0, "[System Process]"),
+    SimulatedProcess(4, "System"),
+    SimulatedProcess(100, "explorer.exe", "alice", parent=4, modules=["explorer.exe", "ntdll.dll"]),
+    SimulatedProcess(200, "lsass.exe", parent=4, modules=["lsass.exe"]),
+    SimulatedProcess(300, "cmd.exe", "bob", parent=4, modules=None),
+]
+THREADS = [(8, 4), (104, 100), (204, 200), (304, 300), (108, 100)]
+
+
+class RecordingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def write(self, s):
+        self.writes.append(s)
+        return super().write(s)
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.system = SimulatedWindows(PROCESSES)
+        self.system.threads = THREADS
+        simulate(self, self.system)
+
+    def test_ndjson(self):
+        stream = io.StringIO()
+        count = export.export(stream)
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(count, len(records))
+        self.assertEqual([(r['type'], r['pid']) for r in records],
+                         [('process', 0), ('process', 4), ('process', 100), ('module', 100), ('module', 100),
+                          ('process', 200), ('module', 200), ('process', 300)] +
+                         [('thread', pid) for tid, pid in THREADS])
+        self.assertEqual(records[2], {'type': 'process', 'pid': 100, 'parent_pid': 4, 'name': 'explorer.exe',
+                                      'owner_sid': string_sid(self.system.sid_of("alice")), 'session_id': 1,
+                                      'owner': 'alice'})
+        self.assertEqual(records[4]['path'], "C:\\Windows\\ntdll.dll")
+        self.assertTrue(records[5]['error'].startswith("owner: "))
+        self.assertTrue(records[7]['error'].startswith("modules: "))
+        self.assertEqual(records[7]['owner'], "bob")
+
+    def test_tokens_closed(self):
+        # Without relying on tokens being collected
+        with mock.patch.object(osinfo.Token, "__del__", lambda token: None):
+            export.export(io.StringIO(), modules=False, threads=False)
+        self.assertEqual(self.system.open_handles(TokenHandle), {})
+
+    def test_csv(self):
+        stream = io.StringIO(newline="")
+        count = export.export(stream, format="csv", owners=False, threads=False)
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue(), newline="")))
+        self.assertEqual(len(rows), count)
+        self.assertEqual(tuple(rows[0]), export.FIELDS)
+        self.assertEqual(rows[3], dict(dict.fromkeys(export.FIELDS, ""), type="module", pid="100",
+                                       module="explorer.exe", path="C:\\Windows\\explorer.exe", base="65536",
+                                       size="4096"))
+        self.assertNotIn("owner: ", "".join(r['error'] for r in rows))
+
+    def test_flush_rows(self):
+        stream = RecordingStream()
+        count = export.export(stream, flush_rows=3)
+        self.assertEqual(count, 13)
+        self.assertEqual([len(w.splitlines()) for w in stream.writes], [3, 3, 3, 3, 1])
+
+    def test_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "inventory.csv")
+            count = export.export(path, format="csv", modules=False)
+            with open(path, newline="") as f:
+                self.assertEqual(len(list(csv.DictReader(f))), count)
+
+    def test_streamed(self):
+        # Nothing is kept by the snapshot as the records go by
+        with osinfo.Snapshot() as snap:
+            records = export.inventory(snap)
+            next(records)
+            list(records)
+            self.assertEqual(snap._modules, {})
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export.export(io.StringIO(), format="xml")
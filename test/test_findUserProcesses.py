@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from maya.ctypeshelper import set_executor
+from maya.winutils import osinfo
+from test.helpers import ERROR_ACCESS_DENIED, SimulatedProcess, SimulatedWindows, patch, simulate
+
+
+USERS = ["alice", "bob", "carol"]
+
+
+def owner(pid):
+    """The owner of a simulated process, or None if it can't be opened"""
+    if pid % 7 == 0:
+        return None
+    return USERS[pid % len(USERS)]
+
+
+class TestFindUserProcesses(TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        set_executor(self.executor)
+        self.addCleanup(self.executor.shutdown)
+        self.addCleanup(set_executor, None)
+        self.simulate(1000)
+
+    def simulate(self, count, delay=0.0, privileges=("SeDebugPrivilege",)):
+        """Simulate `count` processes besides the idle process and System.  Opening a token takes `delay` seconds."""
+        self.pids = list(range(8, 8 + count))
+        processes = [SimulatedProcess(0, "[System Process]"), SimulatedProcess(4, "System")]
+        processes += [SimulatedProcess(pid, "app.exe", owner(pid)) for pid in self.pids]
+        self.system = SimulatedWindows(processes, accounts=USERS, privileges=privileges)
+        if delay:
+            self.system.delays["OpenProcessToken"] = delay
+        simulate(self, self.system)
+
+    def test_matches(self):
+        failures = []
+        found = list(osinfo.find_user_processes("Bob", on_error=failures.append))
+        self.assertEqual(sorted(p.pid for p in found), [pid for pid in self.pids if owner(pid) == "bob"])
+        self.assertEqual(sorted(f.process.pid for f in failures), [pid for pid in self.pids if owner(pid) is None])
+        self.assertTrue(all(f.error.errno == ERROR_ACCESS_DENIED for f in failures))
+        # Owners are compared by SID
+        self.assertEqual(self.system.account_lookups, ["Bob"])
+        self.assertEqual(self.system.called("LookupAccountSidW"), [])
+
+    def test_large(self):
+        self.simulate(10000)
+        failures = []
+        found = list(osinfo.find_user_processes("carol", on_error=failures.append))
+        self.assertEqual(sorted(p.pid for p in found), [pid for pid in self.pids if owner(pid) == "carol"])
+        self.assertEqual(len(failures), len([pid for pid in self.pids if owner(pid) is None]))
+        # Every token was opened once, besides our own for the access check, and no account was looked up but the
+        # one asked for
+        self.assertEqual(len(self.system.called("OpenProcessToken")), len(self.pids) - len(failures) + 1)
+        self.assertEqual(self.system.account_lookups, ["carol"])
+
+    def test_failures_skipped(self):
+        found = list(osinfo.find_user_processes("carol"))
+        self.assertEqual(len(found), len([pid for pid in self.pids if owner(pid) == "carol"]))
+
+    def test_bounded_concurrency(self):
+        self.simulate(60, delay=0.005)
+        list(osinfo.find_user_processes("alice", concurrency=3))
+        self.assertGreater(self.system.most["OpenProcessToken"], 1)
+        self.assertLessEqual(self.system.most["OpenProcessToken"], 3)
+
+    def test_streams(self):
+        self.simulate(200, delay=0.005)
+        matches = osinfo.find_user_processes("alice", concurrency=4)
+        self.assertEqual(owner(next(matches).pid), "alice")
+        matches.close()
+        self.executor.shutdown()
+        # Only the processes in flight when the first match arrived were looked at
+        self.assertLess(len(self.system.called("OpenProcessToken")), 20)
+
+    def test_self_without_debug(self):
+        self.simulate(100, privileges=())
+        self.assertTrue(list(osinfo.find_user_processes("alice")))
+        with self.assertRaises(RuntimeError):
+            list(osinfo.find_user_processes("bob"))
+
+    def test_handles_in_use_not_evicted(self):
+        # Far more processes are opened at once than the cache keeps, so handles are evicted and their values reused
+        self.simulate(60, delay=0.002)
+        patch(self, osinfo, "handle_cache", osinfo.HandleCache(budget=2))
+        failures = []
+        found = list(osinfo.find_user_processes("bob", concurrency=8, on_error=failures.append))
+        self.assertEqual(sorted(p.pid for p in found), [pid for pid in self.pids if owner(pid) == "bob"])
+        self.assertEqual(sorted(f.process.pid for f in failures), [pid for pid in self.pids if owner(pid) is None])
+        self.assertLessEqual(len(self.system.open_handles()), 2)
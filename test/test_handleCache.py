@@ -0,0 +1,161 @@
+import threading
+from unittest import TestCase
+
+from maya.winapi.types import ProcessAccessRights
+from maya.winutils import osinfo
+from test.helpers import ERROR_ACCESS_DENIED, SimulatedProcess, SimulatedWindows, patch, simulate
+
+
+QUERY = ProcessAccessRights.PROCESS_QUERY_INFORMATION
+LIMITED = ProcessAccessRights.PROCESS_QUERY_LIMITED_INFORMATION
+READ = ProcessAccessRights.PROCESS_VM_READ
+
+
+class TestHandleCache(TestCase):
+    def setUp(self):
+        # Created at ten times their ID
+        self.system = SimulatedWindows([SimulatedProcess(pid, "app.exe", "alice") for pid in (100, 200, 300, 400)])
+        simulate(self, self.system)
+        self.cache = osinfo.HandleCache(budget=2)
+
+    @property
+    def handles(self):
+        return self.system.open_handles()
+
+    def get(self, *args):
+        """A handle from the cache, released straight away"""
+        with self.cache.pinned(*args) as handle:
+            return handle
+
+    def test_reuse(self):
+        h = self.get(100)
+        self.assertEqual(self.get(100), h)
+        self.assertEqual(len(self.system.called("OpenProcess")), 1)
+        self.assertEqual(self.cache.stats(), osinfo.HandleCacheStats(1, 1, 0, 0, 1))
+        self.assertEqual(self.cache.creation_time(100), 1000)
+
+    def test_lru_eviction(self):
+        h100 = self.get(100)
+        self.get(200)
+        self.get(100)
+        self.get(300)
+        # 200 was the least recently used
+        self.assertEqual(sorted(h.process.pid for h in self.handles.values()), [100, 300])
+        self.assertIn(h100, self.handles)
+        self.assertEqual(self.cache.stats().evictions, 1)
+        self.get(200)
+        self.assertEqual(len(self.handles), 2)
+
+    def test_upgrade(self):
+        h = self.get(100, QUERY)
+        upgraded = self.get(100, READ)
+        self.assertNotEqual(h, upgraded)
+        self.assertNotIn(h, self.handles)
+        self.assertEqual(self.handles[upgraded].access, QUERY | READ)
+        # Narrower access is served by the wider handle
+        self.assertEqual(self.get(100, QUERY), upgraded)
+        self.assertEqual(self.cache.stats().upgrades, 1)
+
+    def test_failed_upgrade(self):
+        h = self.get(100)
+        self.system.failures["OpenProcess"] = ERROR_ACCESS_DENIED
+        self.assertRaises(OSError, self.cache.acquire, 100, READ)
+        self.assertEqual(self.get(100), h)
+
+    def test_pid_reuse(self):
+        self.get(100)
+        self.cache.discard(100)
+        # Process 100 exits, and its ID is given to a new process
+        self.system.processes[100] = SimulatedProcess(100, "app.exe", "alice", created=1500)
+        self.assertRaises(ProcessLookupError, self.cache.acquire, 100, QUERY, 1000)
+        self.assertEqual(self.handles, {})
+        h = self.get(100, QUERY, 1500)
+        self.assertEqual(self.handles[h].process.created, 1500)
+
+    def test_held_process_is_current(self):
+        self.get(100)
+        self.assertRaises(ProcessLookupError, self.cache.acquire, 100, QUERY, 999)
+        self.assertEqual(len(self.system.called("OpenProcess")), 1)
+
+    def test_verifies_without_query_access(self):
+        h = self.get(100, READ, 1000)
+        self.assertEqual(self.handles[h].access, READ | LIMITED)
+
+    def test_unknown_creation_time(self):
+        h = self.get(100, READ)
+        self.assertIsNone(self.cache.creation_time(100))
+        self.assertEqual(self.get(100, READ, 1000), h)
+
+    def test_clear(self):
+        self.get(100)
+        self.get(200)
+        self.cache.clear()
+        self.assertEqual(self.handles, {})
+        self.assertEqual(len(self.cache), 0)
+
+    def test_pinned_not_evicted(self):
+        h100 = self.cache.acquire(100)
+        self.get(200)
+        self.get(300)
+        self.assertIn(h100, self.handles)
+        self.assertEqual(self.cache.creation_time(200), None)
+        self.cache.release(h100)
+        # Back within budget once it's released
+        self.get(400)
+        self.assertEqual(len(self.handles), 2)
+
+    def test_over_budget_while_pinned(self):
+        handles = [self.cache.acquire(pid) for pid in (100, 200, 300)]
+        self.assertEqual(len(self.handles), 3)
+        for h in handles:
+            self.cache.release(h)
+        self.assertEqual(len(self.handles), 2)
+        self.assertEqual(self.cache.stats().evictions, 1)
+
+    def test_replaced_while_pinned(self):
+        h = self.cache.acquire(100, QUERY)
+        upgraded = self.get(100, READ)
+        self.assertIn(h, self.handles)
+        self.cache.release(h)
+        self.assertNotIn(h, self.handles)
+        self.assertIn(upgraded, self.handles)
+
+    def test_discarded_while_pinned(self):
+        with self.cache.pinned(100) as h:
+            self.cache.discard(100)
+            self.cache.clear()
+            self.assertIn(h, self.handles)
+        self.assertEqual(self.handles, {})
+
+    def test_opens_without_lock(self):
+        opening = threading.Event()
+        proceed = threading.Event()
+
+        def slow_open(access, inherit, pid):
+            if pid == 100:
+                opening.set()
+                proceed.wait(5)
+            return SimulatedWindows.open_process(self.system, access, inherit, pid)
+
+        self.system.open_process = slow_open
+        thread = threading.Thread(target=self.get, args=(100,))
+        thread.start()
+        self.assertTrue(opening.wait(5))
+        # Another process is opened while 100 is still being opened
+        self.get(200)
+        self.assertEqual(len(self.handles), 1)
+        proceed.set()
+        thread.join()
+        self.assertEqual(sorted(h.process.pid for h in self.handles.values()), [100, 200])
+
+    def test_process(self):
+        patch(self, osinfo, "handle_cache", self.cache)
+        proc = osinfo.Process(200)
+        h = proc.open()
+        self.assertEqual(osinfo.Process(200).open(), h)
+        self.assertEqual(proc.creation_time, 2000)
+        proc.close()
+        self.assertEqual(self.handles, {})
+        # The process was pinned by its creation time
+        self.system.processes[200] = SimulatedProcess(200, "app.exe", "alice", created=2500)
+        self.assertRaises(ProcessLookupError, proc.open)
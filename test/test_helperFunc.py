@@ -0,0 +1,209 @@
+from types import SimpleNamespace
+from unittest import TestCase
+from ctypes import *
+
+from maya.ctypeshelper import HelperFunc, InParam, LazyLibrary, OutParam, ReturnOutParam, StructView
+from test.helpers import PositiveFunc, libc, timeval
+
+
+class TestHelperFunc(TestCase):
+    def setUp(self):
+        self.func = HelperFunc(CFUNCTYPE, "gettimeofday", libc, c_int)
+        self.func.params = [
+            ReturnOutParam(POINTER(timeval), "tv", lambda: pointer(timeval())),
+            InParam(c_void_p, "tz", lambda: None)
+        ]
+
+    def test_call(self):
+        tv = self.func()
+        self.assertGreater(tv['tv_sec'], 0)
+        self.assertIn('tv_usec', tv)
+
+    def test_function_is_cached(self):
+        self.func()
+        fn = self.func._fn
+        self.func()
+        self.assertIs(fn, self.func._fn)
+
+    def test_params_invalidates_cache(self):
+        self.func()
+        fn = self.func._fn
+        self.func.params = self.func.params
+        self.assertIsNone(self.func._fn)
+        self.func()
+        self.assertIsNot(fn, self.func._fn)
+
+    def test_fresh_output_buffers(self):
+        seen = []
+
+        def generate():
+            p = pointer(timeval())
+            seen.append(p)
+            return p
+
+        self.func.params = [
+            ReturnOutParam(POINTER(timeval), "tv", generate),
+            InParam(c_void_p, "tz", lambda: None)
+        ]
+        self.func()
+        self.func()
+        self.assertEqual(len(seen), 2)
+        self.assertIsNot(seen[0].contents, seen[1].contents)
+
+    def test_args_and_kwargs(self):
+        strtol = HelperFunc(CFUNCTYPE, "strtol", libc, c_long)
+        strtol.params = [
+            InParam(c_char_p, "nptr"),
+            ReturnOutParam(POINTER(c_char_p), "endptr", lambda: pointer(c_char_p())),
+            InParam(c_int, "base", lambda: 10)
+        ]
+        self.assertEqual(strtol(b"42abc"), b"abc")
+        self.assertEqual(strtol(b"ffzz", base=16), b"zz")
+        self.assertRaises(TypeError, strtol)
+        self.assertRaises(TypeError, strtol, b"1", 10, 3)
+
+    def test_bad_kwargs(self):
+        strtol = HelperFunc(CFUNCTYPE, "strtol", libc, c_long)
+        strtol.params = [
+            InParam(c_char_p, "nptr"),
+            ReturnOutParam(POINTER(c_char_p), "endptr", lambda: pointer(c_char_p())),
+            InParam(c_int, "base", lambda: 10)
+        ]
+        with self.assertRaisesRegex(TypeError, "unexpected keyword argument 'bogus'"):
+            strtol(b"5", bogus=3)
+        with self.assertRaisesRegex(TypeError, "multiple values for argument 'base'"):
+            strtol(b"5", 10, base=16)
+        with self.assertRaisesRegex(TypeError, "multiple values for argument 'nptr'"):
+            strtol(b"5", nptr=b"6")
+        # Output parameters are never taken from the caller
+        with self.assertRaisesRegex(TypeError, "unexpected keyword argument 'endptr'"):
+            strtol(b"5", endptr=None)
+
+    def test_lazy(self):
+        self.func.lazy = True
+        tv = self.func()
+        self.assertIsInstance(tv, StructView)
+        self.assertGreater(tv['tv_sec'], 0)
+        self.assertEqual(tv.materialize()['tv_sec'], tv['tv_sec'])
+
+
+class TestLazyLibrary(TestCase):
+    def setUp(self):
+        self.loads = []
+
+        def loader(name):
+            self.loads.append(name)
+            return libc
+
+        self.lib = LazyLibrary("c", loader)
+
+    def test_loaded_on_first_call(self):
+        func = HelperFunc(CFUNCTYPE, "gettimeofday", self.lib, c_int)
+        func.params = [
+            ReturnOutParam(POINTER(timeval), "tv", lambda: pointer(timeval())),
+            InParam(c_void_p, "tz", lambda: None)
+        ]
+        self.assertEqual(self.loads, [])
+        func()
+        func()
+        self.assertEqual(self.loads, ["c"])
+
+    def test_unload(self):
+        func = HelperFunc(CFUNCTYPE, "gettimeofday", self.lib, c_int)
+        func.params = [
+            ReturnOutParam(POINTER(timeval), "tv", lambda: pointer(timeval())),
+            InParam(c_void_p, "tz", lambda: None)
+        ]
+        func()
+        self.lib.unload()
+        self.assertIsNone(func._fn)
+        func()
+        self.assertEqual(self.loads, ["c", "c"])
+
+    def test_missing_function(self):
+        with self.assertRaises(AttributeError):
+            self.lib.no_such_function_in_libc
+
+
+class Info(Union):
+    _map_ = {
+        1: "number",
+        2: "time"
+    }
+
+    _fields_ = [
+        ("number", c_long),
+        ("time", timeval)
+    ]
+
+
+class TestHelperFuncReturns(TestCase):
+    def setUp(self):
+        def query(which, info, length):
+            # Fill in the member of the union selected by `which`
+            if which == 1:
+                info.contents.number = 42
+            else:
+                info.contents.time.tv_sec = 7
+            length.contents.value = sizeof(Info)
+            return 0
+
+        self.lib = SimpleNamespace(query=CFUNCTYPE(c_int, c_int, POINTER(Info), POINTER(c_int))(query))
+        self.func = HelperFunc(CFUNCTYPE, "query", self.lib, c_int)
+        self.func.params = [
+            InParam(c_int, "which"),
+            ReturnOutParam(POINTER(Info), "info", lambda: pointer(Info()), switch_is="which"),
+            OutParam(POINTER(c_int), "length", lambda: pointer(c_int()))
+        ]
+
+    def test_returned_parameters(self):
+        self.func(1)
+        self.assertEqual(self.func._returns, ((1, 0),))
+
+    def test_union_switch(self):
+        self.assertEqual(self.func(1), 42)
+        self.assertEqual(self.func(2), {'tv_sec': 7, 'tv_usec': 0})
+
+    def test_union_switch_lazy(self):
+        self.func.lazy = True
+        self.assertEqual(self.func(2)['tv_sec'], 7)
+
+
+class TestHelperFuncMap(TestCase):
+    def setUp(self):
+        self.generated = 0
+
+        def endptr():
+            self.generated += 1
+            return pointer(c_char_p())
+
+        self.strtol = PositiveFunc(CFUNCTYPE, "strtol", libc, c_long)
+        self.strtol.params = [
+            InParam(c_char_p, "nptr"),
+            ReturnOutParam(POINTER(c_char_p), "endptr", endptr),
+            InParam(c_int, "base", lambda: 10)
+        ]
+
+    def test_starmap(self):
+        ret = list(self.strtol.starmap([(b"1a",), (b"ffz", 16), (b"7c",)]))
+        self.assertEqual(ret, [b"a", b"z", b"c"])
+
+    def test_map(self):
+        ret = list(self.strtol.map([b"1a", b"ffz"], [10, 16]))
+        self.assertEqual(ret, [b"a", b"z"])
+
+    def test_buffers_per_call(self):
+        ret = list(self.strtol.map([b"1a", b"2b", b"3c"]))
+        self.assertEqual(self.generated, 3)
+        self.assertEqual(ret, [b"a", b"b", b"c"])
+
+    def test_exceptions(self):
+        ret = self.strtol.map([b"1a", b"-2b", b"3c"])
+        self.assertEqual(next(ret), b"a")
+        self.assertRaises(ValueError, next, ret)
+
+    def test_return_exceptions(self):
+        ret = list(self.strtol.map([b"1a", b"-2b", b"3c"], return_exceptions=True))
+        self.assertEqual(ret[0], b"a")
+        self.assertIsInstance(ret[1], ValueError)
+        self.assertEqual(ret[2], b"c")
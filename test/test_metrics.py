@@ -0,0 +1,108 @@
+import errno
+import sys
+import threading
+from unittest import TestCase
+from ctypes import *
+
+from maya.ctypeshelper import HelperFunc, Histogram, InParam, Metrics, ReturnOutParam, disable_metrics, \
+    enable_metrics
+from test.helpers import libc
+
+
+class CheckedFunc(HelperFunc):
+    @staticmethod
+    def errcheck(result, func, args):
+        if result < 0:
+            raise OSError(errno.EINVAL, "negative")
+        return HelperFunc.errcheck(result, func, args)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.strtol = CheckedFunc(CFUNCTYPE, "strtol", libc, c_long)
+        self.strtol.params = [
+            InParam(c_char_p, "nptr"),
+            ReturnOutParam(POINTER(c_char_p), "endptr", lambda: pointer(c_char_p())),
+            InParam(c_int, "base", lambda: 10)
+        ]
+        self.metrics = enable_metrics()
+
+    def tearDown(self):
+        disable_metrics()
+
+    def test_counts(self):
+        self.strtol(b"1x")
+        self.strtol(b"2y")
+        m = self.metrics["strtol"]
+        self.assertEqual(m.calls, 2)
+        self.assertEqual(m.errors, {})
+        for h in (m.marshal, m.native, m.resolve):
+            self.assertEqual(h.count, 2)
+            self.assertGreater(h.total, 0)
+
+    def test_errors(self):
+        self.assertRaises(OSError, self.strtol, b"-1")
+        self.assertRaises(OSError, self.strtol, b"-2")
+        m = self.metrics["strtol"]
+        self.assertEqual(m.calls, 2)
+        self.assertEqual(m.errors, {errno.EINVAL: 2})
+
+    def test_map(self):
+        list(self.strtol.map([b"1a", b"2b", b"3c"]))
+        self.assertEqual(self.metrics["strtol"].calls, 3)
+        self.assertEqual(self.metrics["strtol"].native.count, 3)
+
+    def test_concurrent(self):
+        # Switch threads as often as possible, so that unguarded updates would be lost
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+        threads = [threading.Thread(target=lambda: [self.strtol(b"1x") for _ in range(500)]) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        m = self.metrics["strtol"]
+        self.assertEqual(m.calls, 4000)
+        self.assertEqual([h.count for h in (m.marshal, m.native, m.resolve)], [4000] * 3)
+        self.assertEqual(sum(m.native.buckets), 4000)
+
+    def test_results_unchanged(self):
+        self.assertEqual(self.strtol(b"12ab"), b"ab")
+
+    def test_disabled(self):
+        disable_metrics()
+        self.strtol(b"1x")
+        self.assertEqual(list(self.metrics), [])
+
+    def test_table(self):
+        self.strtol(b"1x")
+        table = self.metrics.table().splitlines()
+        self.assertEqual(len(table), 2)
+        self.assertTrue(table[1].startswith("strtol"))
+
+    def test_reset(self):
+        self.strtol(b"1x")
+        self.metrics.reset()
+        self.assertRaises(KeyError, self.metrics.__getitem__, "strtol")
+
+    def test_own_metrics(self):
+        mine = Metrics()
+        self.assertIs(enable_metrics(mine), mine)
+        self.strtol(b"1x")
+        self.assertEqual(mine["strtol"].calls, 1)
+
+
+class TestHistogram(TestCase):
+    def test_percentile(self):
+        h = Histogram()
+        for _ in range(99):
+            h.add(1e-6)
+        h.add(1e-3)
+        self.assertLessEqual(h.percentile(50), 2e-6)
+        self.assertGreaterEqual(h.percentile(50), 1e-6)
+        self.assertEqual(h.percentile(100), 1e-3)
+        self.assertAlmostEqual(h.mean, (99e-6 + 1e-3) / 100)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().percentile(99), 0.0)
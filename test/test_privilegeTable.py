@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+from ctypes import sizeof
+from unittest import TestCase
+
+from maya.winapi.ntdll import Ntdll, SYSTEM_TIMEOFDAY_INFORMATION
+from maya.winutils import osinfo, security
+from maya.winutils.security import PrivilegeTable, int_to_luid
+from test.helpers import LUIDS, SimulatedWindows, patch, simulate
+
+
+class TestBootId(TestCase):
+    def setUp(self):
+        self.system = SimulatedWindows()
+        simulate(self, self.system)
+
+    def test_exact_length(self):
+        self.assertEqual(Ntdll.NtQuerySystemTimeOfDayInformation()['BootTime'], 132000000000000000)
+        self.assertEqual(security.boot_id(), 132000000000000000)
+        lengths = [args[2] for args in self.system.called("ZwQuerySystemInformation")]
+        self.assertEqual(lengths, [sizeof(SYSTEM_TIMEOFDAY_INFORMATION)] * 2)
+
+
+class TestPrivilegeTable(TestCase):
+    def setUp(self):
+        self.system = SimulatedWindows()
+        simulate(self, self.system)
+        self.table = PrivilegeTable()
+
+    def test_lazy(self):
+        self.assertEqual(self.table.luid("SeDebugPrivilege"), 20)
+        self.assertEqual(self.table.luid("sedebugprivilege"), 20)
+        self.assertEqual(self.table.name(20), "SeDebugPrivilege")
+        self.assertEqual(self.table.name(int_to_luid(20)), "SeDebugPrivilege")
+        self.assertEqual(self.system.privilege_lookups, ["SeDebugPrivilege"])
+        self.assertEqual(self.table.name(23), "SeChangeNotifyPrivilege")
+        self.assertEqual(self.table.lookups, 2)
+
+    def test_unknown(self):
+        self.assertRaises(OSError, self.table.luid, "SeNoSuchPrivilege")
+        self.assertRaises(OSError, self.table.name, 1000)
+
+    def test_warm_up(self):
+        self.table.names = security.PRIVILEGE_NAMES + ("SeFuturePrivilege",)
+        self.table.warm_up()
+        self.assertEqual(len(self.table), len(LUIDS))
+        del self.system.privilege_lookups[:]
+        for name, luid in LUIDS.items():
+            self.assertEqual(self.table.name(luid), name)
+            self.assertEqual(self.table.luid(name.upper()), luid)
+        self.assertEqual(self.system.privilege_lookups, [])
+
+    def test_tokens_after_warm_up(self):
+        patch(self, security, "privileges", self.table)
+        self.table.warm_up()
+        del self.system.privilege_lookups[:]
+        names = list(LUIDS)
+        for i in range(100):
+            self.system.privileges = names[i % 7:i % 7 + 5]
+            token = osinfo.Token(self.system.open_token("alice"))
+            privileges = list(token.privileges)
+            self.assertEqual([p.name for p in privileges], names[i % 7:i % 7 + 5])
+            self.assertEqual([p.luid for p in privileges], [LUIDS[p.name] for p in privileges])
+        self.assertEqual(self.system.privilege_lookups, [])
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "privileges.json")
+            self.table.warm_up(path)
+            looked_up = len(self.system.privilege_lookups)
+            self.assertEqual(looked_up, len(LUIDS))
+
+            # Another process, during the same boot
+            table = PrivilegeTable()
+            table.warm_up(path)
+            self.assertEqual(len(self.system.privilege_lookups), looked_up)
+            self.assertEqual(table.name(20), "SeDebugPrivilege")
+
+            # After a restart, the saved table is stale
+            self.system.boot_time = 132000000100000000
+            table = PrivilegeTable()
+            self.assertFalse(table.load(path))
+            table.warm_up(path)
+            self.assertEqual(len(self.system.privilege_lookups), 2 * looked_up)
+
+    def test_corrupt_file(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "privileges.json")
+            with open(path, "w") as f:
+                f.write("{")
+            self.assertFalse(self.table.load(path))
+            self.table.warm_up(path)
+            self.assertEqual(len(self.table), len(LUIDS))
+
+    def test_malformed_file(self):
+        boot = security.boot_id()
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "privileges.json")
+            for saved in ([], {"boot_id": boot}, {"boot_id": boot, "privileges": []},
+                          {"boot_id": boot, "privileges": {"SeDebugPrivilege": "20"}}):
+                with open(path, "w") as f:
+                    json.dump(saved, f)
+                self.assertFalse(self.table.load(path))
+                self.assertEqual(len(self.table), 0)
+            # It's rebuilt, and saved over
+            self.table.warm_up(path)
+            self.assertTrue(PrivilegeTable().load(path))
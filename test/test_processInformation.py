@@ -0,0 +1,217 @@
+from unittest import TestCase
+from ctypes import *
+
+from maya.winapi import functions, ntdll
+from maya.winapi.functions import STATUS_INFO_LENGTH_MISMATCH
+from maya.winapi.ntdll import (PROCESS_BASIC_INFORMATION, SYSTEM_PROCESS_INFORMATION, ProcessInformationClass,
+                               walk_process_information)
+from maya.winapi.types import DWORD, HANDLE, ULONG, UNICODE_STRING
+from maya.winutils import osinfo
+from test.helpers import SimulatedWindows, simulate
+
+
+# (pid, name, parent pid, handles, threads, peak pagefile usage, private pages)
+PROCESSES = [
+    (0, None, 0, 0, 8, 0, 60),
+    (4, "System", 0, 3000, 150, 200, 100),
+    (1234, "explorer.exe", 900, 2500, 60, 1 << 30, 1 << 29),
+    (4321, "a very long process name.exe", 1234, 7, 1, 4096, 4096),
+]
+
+
+def entry_size(name):
+    # Each entry is followed by its name, and aligned for the next
+    size = sizeof(SYSTEM_PROCESS_INFORMATION)
+    if name:
+        size += (len(name) + 1) * sizeof(c_wchar)
+    return (size + 7) & ~7
+
+
+def list_size(processes):
+    return sum(entry_size(p[1]) for p in processes)
+
+
+def fill(address, processes):
+    """Write processes as the list NtQuerySystemInformation(SystemProcessInformation) fills in at address"""
+    offset = 0
+    for i, (pid, name, parent, handles, threads, peak, private) in enumerate(processes):
+        info = SYSTEM_PROCESS_INFORMATION.from_address(address + offset)
+        memset(addressof(info), 0, sizeof(info))
+        size = entry_size(name)
+        info.NextEntryOffset = size if i < len(processes) - 1 else 0
+        info.NumberOfThreads = threads
+        info.UniqueProcessId = pid
+        info.InheritedFromUniqueProcessId = parent
+        info.HandleCount = handles
+        info.PeakPagefileUsage = peak
+        info.PrivatePageCount = private
+        if name:
+            text = address + offset + sizeof(info)
+            memmove(text, create_unicode_buffer(name), (len(name) + 1) * sizeof(c_wchar))
+            info.ImageName.Length = len(name) * sizeof(c_wchar)
+            info.ImageName.MaximumLength = (len(name) + 1) * sizeof(c_wchar)
+            c_void_p.from_address(addressof(info.ImageName) + type(info.ImageName).Buffer.offset).value = text
+        offset += size
+
+
+class TestWalkProcessInformation(TestCase):
+    def test_walk(self):
+        buf = (c_ubyte * list_size(PROCESSES))()
+        fill(addressof(buf), PROCESSES)
+        entries = list(walk_process_information(SYSTEM_PROCESS_INFORMATION.from_buffer(buf), sizeof(buf)))
+        self.assertEqual([(e.UniqueProcessId or 0, e.ImageName.Buffer, e.InheritedFromUniqueProcessId or 0,
+                           e.HandleCount, e.NumberOfThreads, e.PeakPagefileUsage, e.PrivatePageCount)
+                          for e in entries], PROCESSES)
+
+    def test_in_place(self):
+        buf = (c_ubyte * list_size(PROCESSES))()
+        fill(addressof(buf), PROCESSES)
+        entries = list(walk_process_information(SYSTEM_PROCESS_INFORMATION.from_buffer(buf), sizeof(buf)))
+        self.assertEqual(addressof(entries[2]), addressof(buf) + entry_size(None) + entry_size("System"))
+        entries[1].HandleCount = 1
+        self.assertEqual(SYSTEM_PROCESS_INFORMATION.from_buffer(buf, entry_size(None)).HandleCount, 1)
+
+    def test_single(self):
+        buf = (c_ubyte * list_size(PROCESSES[:1]))()
+        fill(addressof(buf), PROCESSES[:1])
+        entries = walk_process_information(SYSTEM_PROCESS_INFORMATION.from_buffer(buf), sizeof(buf))
+        self.assertEqual(len(list(entries)), 1)
+
+    def test_truncated(self):
+        buf = (c_ubyte * list_size(PROCESSES))()
+        fill(addressof(buf), PROCESSES)
+        # The last entry starts inside the size given, but doesn't fit in it
+        size = list_size(PROCESSES[:3]) + sizeof(SYSTEM_PROCESS_INFORMATION) // 2
+        entries = walk_process_information(SYSTEM_PROCESS_INFORMATION.from_buffer(buf), size)
+        self.assertEqual(len([next(entries) for _ in range(3)]), 3)
+        with self.assertRaises(ValueError):
+            next(entries)
+
+    def test_offset_past_end(self):
+        buf = (c_ubyte * list_size(PROCESSES))()
+        fill(addressof(buf), PROCESSES)
+        SYSTEM_PROCESS_INFORMATION.from_buffer(buf).NextEntryOffset = sizeof(buf)
+        with self.assertRaises(ValueError):
+            list(walk_process_information(SYSTEM_PROCESS_INFORMATION.from_buffer(buf), sizeof(buf)))
+
+
+class SimulatedNtdll(SimulatedWindows):
+    """A simulated Windows whose ZwQuerySystemInformation lists processes, reporting the size it needs as Windows
+    does.  None of them can be opened.
+    """
+    def __init__(self, processes):
+        super().__init__()
+        self.process_list = processes
+        self.lengths = []
+        # Called with the address of the list once it is filled in
+        self.edit = None
+        # The length reported once the list is filled in, if not its size
+        self.reported = None
+        proto = CFUNCTYPE(c_long, c_ulong, c_void_p, c_ulong, POINTER(c_ulong))
+        self.ZwQuerySystemInformation = proto(self.query)
+
+    def query(self, info_class, buffer, length, needed):
+        self.lengths.append(length)
+        size = list_size(self.process_list)
+        needed[0] = size
+        if length < size:
+            return c_long(STATUS_INFO_LENGTH_MISMATCH).value
+        fill(buffer, self.process_list)
+        if self.edit:
+            self.edit(buffer)
+        if self.reported is not None:
+            needed[0] = self.reported
+        return 0
+
+
+class TestSystemProcesses(TestCase):
+    def setUp(self):
+        self.ntdll = SimulatedNtdll(PROCESSES)
+        simulate(self, self.ntdll)
+
+    def test_negotiates_size(self):
+        # More processes than the declaration has made room for in other tests
+        self.ntdll.process_list = PROCESSES * 4
+        size = list_size(self.ntdll.process_list)
+        ntdll.Ntdll.NtQuerySystemProcessInformation()
+        self.assertLess(self.ntdll.lengths[0], size)
+        self.assertEqual(self.ntdll.lengths[1:], [size])
+        ntdll.Ntdll.NtQuerySystemProcessInformation()
+        self.assertEqual(self.ntdll.lengths[2:], [size])
+
+    def test_processes(self):
+        procs = list(osinfo.system_processes())
+        self.assertEqual([(p.pid, p.name if p.pid else None, p.parent_pid) for p in procs],
+                         [p[:3] for p in PROCESSES])
+        self.assertEqual(procs[2].counters, osinfo.ProcessCounters(2500, 60, 1 << 30, 1 << 29))
+        self.assertEqual(procs[3].counters.handle_count, 7)
+
+    def test_counted_names(self):
+        # Names are counted strings: the text past Length isn't part of the name, and needn't end in NUL
+        self.ntdll.process_list = PROCESSES[:3]
+
+        def truncate(address):
+            entry = SYSTEM_PROCESS_INFORMATION.from_address(address + list_size(PROCESSES[:2]))
+            entry.ImageName.Length = len("explorer") * sizeof(c_wchar)
+        self.ntdll.edit = truncate
+        self.assertEqual([row.name for row in osinfo.system_process_rows()], [None, "System", "explorer"])
+
+    def test_truncated_list(self):
+        # A list that claims to continue past the bytes filled in is refused rather than read out of bounds
+        self.ntdll.reported = list_size(PROCESSES[:3])
+        with self.assertRaises(ValueError):
+            ntdll.Ntdll.NtQuerySystemProcessInformation()
+
+    def test_grows(self):
+        ntdll.Ntdll.NtQuerySystemProcessInformation()
+        self.ntdll.process_list = PROCESSES + [(5000, "new.exe", 4, 1, 1, 1, 1)]
+        self.assertEqual(len(ntdll.Ntdll.NtQuerySystemProcessInformation()), 5)
+
+
+class SimulatedProcessNtdll:
+    """ZwQueryInformationProcess for one process, which only takes PROCESS_BASIC_INFORMATION at its exact size"""
+    def __init__(self, image, parent):
+        self.image = image
+        self.parent = parent
+        self.lengths = []
+        proto = CFUNCTYPE(c_long, HANDLE, DWORD, c_void_p, DWORD, POINTER(ULONG))
+        self.ZwQueryInformationProcess = proto(self.query)
+
+    def query(self, handle, info_class, buffer, length, needed):
+        self.lengths.append((info_class, length))
+        if info_class == ProcessInformationClass.ProcessBasicInformation:
+            needed[0] = sizeof(PROCESS_BASIC_INFORMATION)
+            if length != needed[0]:
+                return c_long(STATUS_INFO_LENGTH_MISMATCH).value
+            PROCESS_BASIC_INFORMATION.from_address(buffer).InheritedFromUniqueProcessId = self.parent
+            return 0
+        text = create_unicode_buffer(self.image)
+        needed[0] = sizeof(UNICODE_STRING) + sizeof(text)
+        if length < needed[0]:
+            return c_long(STATUS_INFO_LENGTH_MISMATCH).value
+        memmove(buffer + sizeof(UNICODE_STRING), text, sizeof(text))
+        name = UNICODE_STRING.from_address(buffer)
+        name.Length = sizeof(text) - sizeof(c_wchar)
+        name.MaximumLength = sizeof(text)
+        c_void_p.from_address(buffer + UNICODE_STRING.Buffer.offset).value = buffer + sizeof(UNICODE_STRING)
+        return 0
+
+
+class TestProcessInformation(TestCase):
+    def setUp(self):
+        self.ntdll = SimulatedProcessNtdll("\\Device\\HarddiskVolume2\\" + "x" * 300 + ".exe", 1234)
+        functions.set_loader(lambda name: self.ntdll)
+        self.addCleanup(functions.set_loader, None)
+
+    def test_mixed_classes(self):
+        image = ntdll.Ntdll.NtQueryInformationProcess(1, ProcessInformationClass.ProcessImageFileName)
+        self.assertEqual(image['Buffer'], self.ntdll.image)
+        # The image name's size doesn't carry over to the basic information, which is always asked for exactly
+        for _ in range(2):
+            info = ntdll.Ntdll.NtQueryInformationProcess(1, ProcessInformationClass.ProcessBasicInformation)
+            self.assertEqual(info['InheritedFromUniqueProcessId'], 1234)
+        basic = [length for info_class, length in self.ntdll.lengths
+                 if info_class == ProcessInformationClass.ProcessBasicInformation]
+        self.assertEqual(basic, [sizeof(PROCESS_BASIC_INFORMATION)] * 2)
+        image = ntdll.Ntdll.NtQueryInformationProcess(1, ProcessInformationClass.ProcessImageFileName)
+        self.assertEqual(self.ntdll.lengths[-1], self.ntdll.lengths[1])
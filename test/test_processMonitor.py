@@ -0,0 +1,137 @@
+import threading
+from unittest import TestCase, mock
+
+from maya.winutils.osinfo import ProcessCounters, ProcessMonitor, ProcessRow
+from test.helpers import SimulatedProcess, SimulatedWindows, simulate
+
+
+def row(pid, name="app.exe", parent=4, threads=1, created=None, handles=None):
+    counters = ProcessCounters(handles, threads, 0, 0) if handles is not None else None
+    return ProcessRow(pid, parent, name, threads, created, counters)
+
+
+class Source:
+    """An enumeration that returns whatever rows it was last given"""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __call__(self):
+        return list(self.rows)
+
+
+class TestProcessMonitor(TestCase):
+    def test_baseline(self):
+        monitor = ProcessMonitor(Source([row(8), row(12)]))
+        self.assertEqual(monitor.poll(), ([], [], []))
+        self.assertEqual(sorted(p.pid for p in monitor.processes), [8, 12])
+        self.assertEqual(monitor.poll(), ([], [], []))
+
+    def test_started_exited(self):
+        source = Source([row(8), row(12)])
+        monitor = ProcessMonitor(source)
+        monitor.poll()
+        source.rows = [row(8), row(16, "new.exe")]
+        started, exited, changed = monitor.poll()
+        self.assertEqual([(p.pid, p.name) for p in started], [(16, "new.exe")])
+        self.assertEqual([p.pid for p in exited], [12])
+        self.assertEqual(changed, [])
+
+    def test_same_count(self):
+        # As many processes started as exited
+        source = Source([row(8), row(12)])
+        monitor = ProcessMonitor(source)
+        monitor.poll()
+        source.rows = [row(12), row(20)]
+        started, exited, changed = monitor.poll()
+        self.assertEqual(([p.pid for p in started], [p.pid for p in exited]), ([20], [8]))
+
+    def test_processes_kept(self):
+        source = Source([row(8, created=1, handles=10)])
+        monitor = ProcessMonitor(source)
+        monitor.poll()
+        proc = monitor.processes[0]
+        source.rows = [row(8, created=1, handles=11)]
+        self.assertEqual(monitor.poll().changed, [proc])
+        self.assertIs(monitor.processes[0], proc)
+        self.assertEqual(proc.counters.handle_count, 11)
+
+    def test_pid_reused(self):
+        source = Source([row(8, created=1)])
+        monitor = ProcessMonitor(source)
+        monitor.poll()
+        source.rows = [row(8, created=2)]
+        started, exited, changed = monitor.poll()
+        self.assertEqual([p.creation_time for p in started], [2])
+        self.assertEqual([p.creation_time for p in exited], [1])
+
+    def test_pid_reused_without_creation_time(self):
+        source = Source([row(8, "a.exe")])
+        monitor = ProcessMonitor(source)
+        monitor.poll()
+        source.rows = [row(8, "b.exe")]
+        started, exited, changed = monitor.poll()
+        self.assertEqual(([p.name for p in started], [p.name for p in exited]), (["b.exe"], ["a.exe"]))
+
+    def test_callbacks(self):
+        events = []
+        source = Source([row(8, created=1, handles=1), row(12, created=1)])
+        monitor = ProcessMonitor(source, on_start=lambda p: events.append(("start", p.pid)),
+                                 on_exit=lambda p: events.append(("exit", p.pid)),
+                                 on_change=lambda p: events.append(("change", p.pid)))
+        monitor.poll()
+        source.rows = [row(8, created=1, handles=2), row(16, created=1)]
+        monitor.poll()
+        self.assertEqual(events, [("start", 16), ("exit", 12), ("change", 8)])
+
+
+class TestAdaptiveInterval(TestCase):
+    def test_iterate(self):
+        ticks = [[row(8)], [row(8)], [row(8)], [row(8), row(12)], [row(12)]]
+
+        def rows():
+            return ticks.pop(0) if ticks else [row(12)]
+
+        monitor = ProcessMonitor(rows, min_interval=1, max_interval=4)
+        intervals = []
+
+        def wait(timeout):
+            intervals.append(timeout)
+            return len(intervals) > 6
+
+        with mock.patch.object(monitor._stopped, "wait", wait):
+            deltas = list(monitor)
+        self.assertEqual([([p.pid for p in d.started], [p.pid for p in d.exited]) for d in deltas],
+                         [([12], []), ([], [8])])
+        # Quiet polls back off, and a change brings the interval back down
+        self.assertEqual(intervals, [1, 2, 4, 1, 1, 2, 4])
+
+    def test_stop(self):
+        monitor = ProcessMonitor(Source([row(8)]), min_interval=10)
+        thread = threading.Thread(target=lambda: list(monitor))
+        thread.start()
+        monitor.stop()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+
+
+class TestSnapshotRows(TestCase):
+    def setUp(self):
+        self.system = SimulatedWindows([SimulatedProcess(0, "[System Process]", threads=8),
+                                        SimulatedProcess(4, "System", threads=150),
+                                        SimulatedProcess(8, "app.exe", parent=4, threads=3)])
+        simulate(self, self.system)
+
+    def test_rows(self):
+        monitor = ProcessMonitor()
+        monitor.poll()
+        del self.system.processes[8]
+        self.system.processes[12] = SimulatedProcess(12, "other.exe", parent=4)
+        started, exited, changed = monitor.poll()
+        self.assertEqual([(p.pid, p.name) for p in started], [(12, "other.exe")])
+        self.assertEqual([(p.pid, p.name) for p in exited], [(8, "app.exe")])
+
+    def test_thread_count_changed(self):
+        monitor = ProcessMonitor()
+        monitor.poll()
+        self.system.processes[8].threads = 4
+        self.assertEqual([p.pid for p in monitor.poll().changed], [8])
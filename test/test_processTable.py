@@ -0,0 +1,142 @@
+from unittest import TestCase, skipUnless
+
+from maya.winutils import osinfo
+from maya.winutils.osinfo import ProcessRow, ProcessTable
+from test.helpers import SimulatedProcess, SimulatedWindows, simulate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def row(pid, parent, name, created=None, threads=1):
+    return ProcessRow(pid, parent, name, threads, created, None)
+
+
+ROWS = [
+    row(0, 0, b"[System Process]"),
+    row(4, 0, b"System", threads=150),
+    row(500, 4, b"smss.exe"),
+    row(600, 8888, b"wininit.exe"),         # Its parent has exited
+    row(700, 600, b"services.exe"),
+    row(800, 700, b"svchost.exe"),
+    row(804, 700, b"SVCHOST.EXE"),
+    row(900, 800, b"child.exe"),
+    row(808, 700, b"svchost.exe"),
+]
+
+
+class TestProcessTable(TestCase):
+    def setUp(self):
+        self.table = ProcessTable(ROWS)
+
+    def pids(self, rows):
+        return [self.table.pid[i] for i in rows]
+
+    def test_columns(self):
+        self.assertEqual(len(self.table), len(ROWS))
+        self.assertEqual(list(self.table.pid), [r.pid for r in ROWS])
+        self.assertEqual(self.table.pid.itemsize, 4)
+        # Distinct names are stored once
+        self.assertEqual(len(self.table.names), len(ROWS) - 1)
+        self.assertEqual(self.table.row(1), ProcessRow(4, 0, "System", 150, None, None))
+
+    def test_index(self):
+        self.assertEqual(self.table.index(700), 4)
+        self.assertIsNone(self.table.index(12345))
+        proc = self.table.process(self.table.index(900))
+        self.assertEqual((proc.pid, proc.name, proc.parent_pid), (900, "child.exe", 800))
+
+    def test_by_name(self):
+        self.assertEqual(self.pids(self.table.by_name("svchost.exe")), [800, 804, 808])
+        self.assertEqual(self.pids(self.table.by_name("Child.exe")), [900])
+        self.assertEqual(self.table.by_name("missing.exe"), [])
+
+    def test_children(self):
+        self.assertEqual(self.pids(self.table.children(self.table.index(700))), [800, 804, 808])
+        self.assertEqual(self.table.children(self.table.index(900)), [])
+
+    def test_roots(self):
+        # The idle process is its own parent
+        self.assertEqual(self.pids(self.table.roots()), [0, 600])
+
+    def test_walk(self):
+        self.assertEqual([(depth, self.table.pid[i]) for depth, i in self.table.walk()],
+                         [(0, 0), (1, 4), (2, 500), (0, 600), (1, 700), (2, 800), (3, 900), (2, 804), (2, 808)])
+        self.assertEqual([(depth, self.table.pid[i]) for depth, i in self.table.walk(self.table.index(800))],
+                         [(0, 800), (1, 900)])
+
+    def test_reused_parent_pid(self):
+        # 200 exited, and its ID went to a process that started after its child
+        table = ProcessTable([row(200, 4, b"new.exe", created=50), row(300, 200, b"orphan.exe", created=10),
+                              row(400, 200, b"child.exe", created=60)])
+        self.assertIsNone(table.parent(1))
+        self.assertEqual(table.children(0), [2])
+
+    def test_parent_cycle(self):
+        # 100 and 200 each have the ID of the other's exited parent, and Toolhelp32 doesn't tell creation times
+        table = ProcessTable([row(100, 200, b"a.exe"), row(200, 100, b"b.exe"), row(300, 200, b"c.exe"),
+                              row(400, 400, b"self.exe")])
+        self.assertEqual(table.roots(), [0, 1, 3])
+        self.assertIsNone(table.parent(0))
+        self.assertIsNone(table.parent(1))
+        self.assertEqual(table.parent(2), 1)
+        self.assertEqual(list(table.walk(0)), [(0, 0)])
+        self.assertEqual(list(table.walk()), [(0, 0), (0, 1), (1, 2), (0, 3)])
+
+    def test_longer_cycle(self):
+        table = ProcessTable([row(4 * i, 4 * ((i + 1) % 50), b"p.exe") for i in range(50)] +
+                             [row(1000, 8, b"child.exe")])
+        self.assertEqual(len(table.roots()), 50)
+        self.assertEqual(sum(1 for _ in table.walk()), 51)
+
+    def test_large(self):
+        table = ProcessTable(row(i * 4, (i // 2) * 4, b"p%d.exe" % (i % 100)) for i in range(1, 20001))
+        self.assertEqual(len(table.names), 100)
+        self.assertEqual(sum(1 for _ in table.walk()), 20000)
+        self.assertEqual(len(table.by_name("p7.exe")), 200)
+
+    @skipUnless(numpy, "NumPy isn't installed")
+    def test_numpy(self):
+        columns = self.table.to_numpy()
+        self.assertEqual(columns['pid'].tolist(), [r.pid for r in ROWS])
+        self.assertEqual(columns['names'][columns['name_id'][1]], "System")
+
+
+class TestSnapshotTable(TestCase):
+    def setUp(self):
+        self.system = SimulatedWindows([SimulatedProcess(r.pid, r.name.decode(), parent=r.parent_pid,
+                                                         threads=r.thread_count) for r in ROWS])
+        simulate(self, self.system)
+
+    def test_table(self):
+        with osinfo.Snapshot() as snap:
+            table = snap.table()
+        self.assertEqual(list(table.parent_pid), [r.parent_pid for r in ROWS])
+
+    def test_failed_read(self):
+        # Only running out of entries ends the list
+        read = self.system.process32_next
+
+        def process32_next(handle, entry):
+            try:
+                return read(handle, entry)
+            except OSError:
+                raise OSError(24, "The program issued a command but the command length is incorrect")
+
+        self.system.process32_next = process32_next
+        with osinfo.Snapshot() as snap:
+            with self.assertRaises(OSError):
+                snap.table()
+
+
+class TestParentPid(TestCase):
+    def test_queried(self):
+        simulate(self, SimulatedWindows([SimulatedProcess(800, "svchost.exe", "alice", parent=700)]))
+        self.assertEqual(osinfo.Process(800).parent_pid, 700)
+
+
+class TestSystemPid(TestCase):
+    def test_system_pids(self):
+        self.assertEqual([pid for pid in (0, 4, 8, 800) if osinfo.is_system_pid(pid)], [0, 4])
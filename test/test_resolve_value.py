@@ -1,61 +1,8 @@
 from unittest import TestCase
 from ctypes import *
-# from ctypeshelper import resolve
 import logging
 
-
-def struct2dict(cval):
-    if not isinstance(cval, Structure):
-        raise ValueError("Must be a structure")
-    d = {}
-    if hasattr(cval, '_unions_'):
-        d['_unions_'] = cval._unions_
-    for name, typ in cval._fields_:
-        d[name] = getattr(cval, name)
-    return d
-
-
-def resolve(cval):
-    logging.debug("resolve {0}".format(cval))
-
-    def resolve_union(cval, switch):
-        logging.debug(switch)
-        if hasattr(cval.__class__, "_map_"):
-            which = cval._map_[switch]
-            return resolve(getattr(cval, which))
-        else:
-            return cval
-
-    if hasattr(cval, "value"):             # basic type
-        logging.debug("value: {0}".format(cval.value))
-        return cval.value
-    elif hasattr(cval, "contents"):        # pointer type
-        logging.debug("contents: {0}".format(cval.contents))
-        ret = resolve(cval.contents)
-        return ret
-    elif isinstance(cval, Array):
-        logging.debug("Byte array")
-        return bytes(cval[:])
-    elif isinstance(cval, dict) or isinstance(cval, Structure):
-        # If it's a dict, we got this from an errcheck call using parameters instead of a structure
-        if isinstance(cval, Structure):
-            # Map structure to dict just to ease maintenance
-            cval = struct2dict(cval)
-        f = {}
-        for name, value in cval.items():
-            if name == '_unions_':
-                continue
-            if isinstance(value, Union):
-                if '_unions_' in cval:
-                    f[cval['_unions_'][name]] = resolve(cval[cval['_unions_'][name]])
-                    f[name] = resolve_union(cval[name], f[cval['_unions_'][name]])
-                else:
-                    f[name] = cval[name]
-            else:
-                f[name] = resolve(cval[name])
-        return f
-    else:
-        return cval
+from maya.ctypeshelper import resolve, get_resolver, get_union_resolver
 
 
 class TestSubUnion(Union):
@@ -109,6 +56,21 @@ class TestStructure(Structure):
     ]
 
 
+class ArrayStructure(Structure):
+    _fields_ = [
+        ("bytes", c_ubyte * 4),
+        ("longs", c_ulong * 2),
+        ("items", TestSubStructure * 3),
+        ("name", c_char * 8)
+    ]
+
+
+class UnmappedStructure(Structure):
+    _fields_ = [
+        ("field", TestSubUnion)
+    ]
+
+
 class TestResolve_value(TestCase):
     def setUp(self):
         # Create the structure
@@ -124,8 +86,44 @@ class TestResolve_value(TestCase):
         self.assertEqual(y['field']['field'], 42)
 
     def test_resolve_parameters(self):
-        # Create a bunch of parameters
         # Create a dict of {name: cval} for all parameters
         # If there's a union, add the _unions_ field to the dict
-        # Resolve it!
-        self.fail()
\ No newline at end of file
+        union = TestUnion()
+        union.two = 7
+        d = {
+            'switch': 2,
+            'union': pointer(union),
+            'count': pointer(c_ulong(3)),
+            '_unions_': {'union': 'switch'}
+        }
+        y = resolve(d)
+        self.assertEqual(y, {'switch': 2, 'union': 7, 'count': 3})
+
+    def test_resolve_arrays(self):
+        x = ArrayStructure()
+        x.bytes[0] = 1
+        x.longs[1] = 2
+        x.items[2].switch = 1
+        x.items[2].field.one = 3
+        x.name = b"abc"
+        y = resolve(x)
+        self.assertEqual(y['bytes'], b"\x01\x00\x00\x00")
+        self.assertEqual(y['longs'], [0, 2])
+        self.assertEqual(y['items'][2], {'switch': 1, 'field': 3})
+        self.assertEqual(y['name'], b"abc")
+
+    def test_resolve_strings(self):
+        self.assertEqual(resolve(create_unicode_buffer("abc", 16)), "abc")
+        self.assertEqual(resolve(pointer(create_string_buffer(b"abc", 16))), b"abc")
+
+    def test_resolve_null_pointer(self):
+        self.assertIsNone(resolve(POINTER(TestStructure)()))
+
+    def test_resolver_is_cached(self):
+        r = get_resolver(TestStructure)
+        self.assertIs(r, get_resolver(TestStructure))
+        self.assertIs(get_union_resolver(POINTER(TestUnion)), get_union_resolver(POINTER(TestUnion)))
+
+    def test_unmapped_union(self):
+        x = UnmappedStructure()
+        self.assertIsInstance(resolve(x)['field'], TestSubUnion)
\ No newline at end of file
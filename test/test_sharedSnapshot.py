@@ -0,0 +1,88 @@
+from unittest import TestCase
+
+from maya.ctypeshelper import StructView
+from maya.winapi.kernel32 import Kernel32
+from maya.winapi.types import Toolhelp32Flags
+from maya.winutils import osinfo
+from test.helpers import SimulatedProcess, SimulatedWindows, SnapshotHandle, simulate
+
+
+PROCESSES = [
+    SimulatedProcess(4, "System"),
+    SimulatedProcess(100, "explorer.exe", modules=["explorer.exe", "ntdll.dll"]),
+    SimulatedProcess(200, "cmd.exe", modules=["cmd.exe"]),
+    SimulatedProcess(300, "idle.exe"),
+]
+# (tid, owner pid)
+THREADS = [(8, 4), (12, 4), (104, 100), (16, 4), (204, 200), (108, 100), (208, 200), (212, 200)]
+
+
+class TestSharedSnapshot(TestCase):
+    def setUp(self):
+        self.system = SimulatedWindows(PROCESSES)
+        self.system.threads = THREADS
+        simulate(self, self.system)
+
+    @property
+    def snapshots(self):
+        """The (flags, pid) of each snapshot taken"""
+        return self.system.called("CreateToolhelp32Snapshot")
+
+    @property
+    def open_snapshots(self):
+        return self.system.open_handles(SnapshotHandle)
+
+    def test_threads_bucketed(self):
+        with osinfo.Snapshot() as snap:
+            threads = {p.pid: [t.tid for t in p.threads] for p in snap.processes}
+        self.assertEqual(threads, {4: [8, 12, 16], 100: [104, 108], 200: [204, 208, 212], 300: []})
+        # One snapshot, and every thread read once, each list ending with a read that fails
+        self.assertEqual(len(self.snapshots), 1)
+        reads = sum(len(self.system.called(function)) for function in ("Process32First", "Process32Next",
+                                                                       "Thread32First", "Thread32Next"))
+        self.assertEqual(reads, len(PROCESSES) + len(THREADS) + 2)
+
+    def test_inventory(self):
+        with osinfo.Snapshot() as snap:
+            inventory = {p.pid: ([t.tid for t in p.threads], [m.name for m in p.modules])
+                         for p in snap.processes if p.pid != 4}
+            again = [m.name for m in snap.modules_of(100)]
+        self.assertEqual(inventory[100], ([104, 108], ["explorer.exe", "ntdll.dll"]))
+        self.assertEqual(again, ["explorer.exe", "ntdll.dll"])
+        # Toolhelp32 only lists the modules of the process a snapshot is for
+        self.assertEqual(self.snapshots, [(Toolhelp32Flags.TH32CS_SNAPALL, 0)] +
+                         [(Toolhelp32Flags.TH32CS_SNAPMODULE, pid) for pid in (100, 200, 300)])
+        self.assertEqual(self.open_snapshots, {})
+
+    def test_indexed_before_close(self):
+        with osinfo.Snapshot() as snap:
+            procs = list(snap.processes)
+            list(procs[0].threads)
+        self.assertEqual([t.tid for t in procs[1].threads], [104, 108])
+        self.assertEqual(len(self.snapshots), 1)
+
+    def test_closed_before_index(self):
+        with osinfo.Snapshot() as snap:
+            procs = list(snap.processes)
+        self.assertEqual([t.tid for t in procs[2].threads], [204, 208, 212])
+        self.assertEqual(self.snapshots[1], (Toolhelp32Flags.TH32CS_SNAPTHREAD, 200))
+        self.assertEqual(self.open_snapshots, {})
+
+    def test_standalone(self):
+        proc = osinfo.Process(100)
+        self.assertEqual([t.tid for t in proc.threads], [104, 108])
+        self.assertEqual([m.path for m in proc.modules], ["C:\\Windows\\explorer.exe", "C:\\Windows\\ntdll.dll"])
+        self.assertEqual(self.open_snapshots, {})
+
+    def test_entries_are_dictionaries(self):
+        # Only osinfo asks for views; other callers of the wrappers get dictionaries they can keep and change
+        snap = Kernel32.CreateToolhelp32Snapshot(Toolhelp32Flags.TH32CS_SNAPPROCESS, 0)
+        try:
+            first = Kernel32.Process32First(snap)
+            second = Kernel32.Process32Next(snap, lazy=True)
+        finally:
+            Kernel32.CloseHandle(snap)
+        self.assertIsInstance(first, dict)
+        self.assertEqual(first['th32ProcessID'], 4)
+        self.assertIsInstance(second, StructView)
+        self.assertEqual(second['th32ProcessID'], 100)
@@ -0,0 +1,166 @@
+import errno
+from types import SimpleNamespace
+from unittest import TestCase
+from ctypes import *
+
+from maya.ctypeshelper import HelperFunc, InParam, InOutParam, OutParam, ReturnOutParam
+
+
+DATA = b"a string longer than the first buffer"
+
+# Stand-ins for foreign functions, in the style of the Win32 API:
+#   int report(char *buffer, unsigned *size)  - in/out size, set to the size needed when too small
+#   int needed(char *buffer, unsigned size, unsigned *needed)  - separate output for the size needed
+#   int silent(char *buffer, unsigned size)  - fails without saying how much it wants
+report_proto = CFUNCTYPE(c_int, c_void_p, POINTER(c_uint))
+needed_proto = CFUNCTYPE(c_int, c_void_p, c_uint, POINTER(c_uint))
+silent_proto = CFUNCTYPE(c_int, c_void_p, c_uint)
+#   int classed(int cls, char *buffer, unsigned size, unsigned *needed)  - class 1 wants exactly 4 bytes,
+#                                                                         class 2 at least 64
+classed_proto = CFUNCTYPE(c_int, c_int, c_void_p, c_uint, POINTER(c_uint))
+CLASS_SIZES = {1: 4, 2: 64}
+
+
+class ERangeFunc(HelperFunc):
+    insufficient_buffer = frozenset([errno.ERANGE])
+
+    def __init__(self, name, module):
+        super(ERangeFunc, self).__init__(CFUNCTYPE, name, module, c_int)
+
+    @staticmethod
+    def errcheck(result, func, args):
+        if result != 0:
+            raise OSError(result, "buffer too small")
+        return HelperFunc.errcheck(result, func, args)
+
+
+class TestSizedBuffer(TestCase):
+    def setUp(self):
+        self.sizes = []
+
+        def copy(buffer, size):
+            self.sizes.append(size)
+            if buffer is None or size < len(DATA) + 1:
+                return False
+            memmove(buffer, DATA, len(DATA) + 1)
+            return True
+
+        def report(buffer, size):
+            if copy(buffer, size.contents.value):
+                return 0
+            size.contents.value = len(DATA) + 1
+            return errno.ERANGE
+
+        def needed(buffer, size, out):
+            out.contents.value = len(DATA) + 1
+            return 0 if copy(buffer, size) else errno.ERANGE
+
+        def silent(buffer, size):
+            return 0 if copy(buffer, size) else errno.ERANGE
+
+        def classed(cls, buffer, size, out):
+            self.sizes.append((cls, size))
+            out.contents.value = CLASS_SIZES[cls]
+            if size == CLASS_SIZES[cls] or (cls == 2 and size > CLASS_SIZES[cls]):
+                return 0
+            return errno.ERANGE
+
+        # The callbacks must live as long as the functions bound to them
+        self.lib = SimpleNamespace(report=report_proto(report), needed=needed_proto(needed),
+                                   silent=silent_proto(silent), classed=classed_proto(classed))
+
+    def report_func(self, **kwargs):
+        func = ERangeFunc("report", self.lib)
+        func.params = [
+            ReturnOutParam(c_char_p, "buffer"),
+            InOutParam(POINTER(c_uint), "size")
+        ]
+        func.sized_buffer("buffer", "size", **kwargs)
+        return func
+
+    def test_retry_with_reported_size(self):
+        func = self.report_func(initial=8)
+        self.assertEqual(func(), DATA)
+        self.assertEqual(self.sizes, [8, len(DATA) + 1])
+
+    def test_remembers_size(self):
+        func = self.report_func(initial=8)
+        func()
+        del self.sizes[:]
+        self.assertEqual(func(), DATA)
+        self.assertEqual(self.sizes, [len(DATA) + 1])
+
+    def test_probe(self):
+        func = self.report_func(initial=0)
+        self.assertEqual(func(), DATA)
+        self.assertEqual(self.sizes, [0, len(DATA) + 1])
+
+    def test_needed_parameter(self):
+        func = ERangeFunc("needed", self.lib)
+        func.params = [
+            ReturnOutParam(c_char_p, "buffer"),
+            InParam(c_uint, "size"),
+            OutParam(POINTER(c_uint), "needed", lambda: pointer(c_uint(0)))
+        ]
+        func.sized_buffer("buffer", "size", "needed", initial=4)
+        self.assertEqual(func(), DATA)
+        self.assertEqual(self.sizes, [4, len(DATA) + 1])
+
+    def test_doubles_without_reported_size(self):
+        func = ERangeFunc("silent", self.lib)
+        func.params = [
+            ReturnOutParam(c_char_p, "buffer"),
+            InParam(c_uint, "size")
+        ]
+        func.sized_buffer("buffer", "size", initial=8)
+        self.assertEqual(func(), DATA)
+        self.assertEqual(self.sizes, [8, 16, 32, 64])
+
+    def test_gives_up(self):
+        func = ERangeFunc("silent", self.lib)
+        func.params = [
+            ReturnOutParam(c_char_p, "buffer"),
+            InParam(c_uint, "size")
+        ]
+        func.sized_buffer("buffer", "size", initial=1)
+        func.max_resizes = 2
+        with self.assertRaises(OSError):
+            func()
+        self.assertEqual(self.sizes, [1, 2, 4])
+
+    def test_starmap(self):
+        func = self.report_func(initial=8)
+        self.assertEqual(list(func.starmap([()] * 3)), [DATA] * 3)
+        self.assertEqual(self.sizes, [8] + [len(DATA) + 1] * 3)
+
+    def classed_func(self, **kwargs):
+        func = ERangeFunc("classed", self.lib)
+        func.params = [
+            InParam(c_int, "cls"),
+            OutParam(c_void_p, "buffer"),
+            InParam(c_uint, "size"),
+            OutParam(POINTER(c_uint), "needed", lambda: pointer(c_uint(0)))
+        ]
+        func.sized_buffer("buffer", "size", "needed", initial=16, key="cls", **kwargs)
+        return func
+
+    def test_size_per_key(self):
+        func = self.classed_func()
+        func(2)
+        func(1)
+        func(1)
+        func(2)
+        # Class 1 is retried with the smaller size it asked for, and keeps it apart from class 2
+        self.assertEqual(self.sizes, [(2, 16), (2, 64), (1, 16), (1, 4), (1, 4), (2, 64)])
+
+    def test_fixed(self):
+        func = self.classed_func(fixed={1: 4})
+        func(2)
+        func(1)
+        self.assertEqual(self.sizes, [(2, 16), (2, 64), (1, 4)])
+
+    def test_fixed_not_retried(self):
+        func = self.classed_func(fixed={1: 8})
+        with self.assertRaises(OSError):
+            func(1)
+        self.assertEqual(self.sizes, [(1, 8)])
@@ -0,0 +1,74 @@
+from unittest import TestCase
+from collections.abc import Mapping
+from ctypes import *
+
+from maya.ctypeshelper import StructView, ArrayView, view, resolve
+
+
+class Entry(Structure):
+    _fields_ = [
+        ("id", c_ulong),
+        ("name", c_char * 16)
+    ]
+
+
+class Table(Structure):
+    _fields_ = [
+        ("count", c_ulong),
+        ("entries", Entry * 4),
+        ("first", POINTER(Entry)),
+        ("raw", c_ubyte * 4)
+    ]
+
+
+class TestStructView(TestCase):
+    def setUp(self):
+        self.table = Table()
+        self.table.count = 2
+        self.table.entries[1].id = 5
+        self.table.entries[1].name = b"five"
+        self.table.first = pointer(self.table.entries[1])
+        self.table.raw[2] = 9
+
+    def test_mapping(self):
+        v = view(self.table)
+        self.assertIsInstance(v, StructView)
+        self.assertIsInstance(v, Mapping)
+        self.assertEqual(list(v), ["count", "entries", "first", "raw"])
+        self.assertEqual(len(v), 4)
+        self.assertEqual(v['count'], 2)
+        self.assertEqual(v['raw'], b"\x00\x00\x09\x00")
+        self.assertRaises(KeyError, v.__getitem__, "missing")
+
+    def test_nested_views(self):
+        v = view(self.table)
+        entries = v['entries']
+        self.assertIsInstance(entries, ArrayView)
+        self.assertEqual(len(entries), 4)
+        self.assertIsInstance(entries[1], StructView)
+        self.assertEqual(entries[1]['name'], b"five")
+        self.assertEqual(entries[-3]['id'], 5)
+        self.assertEqual(v['first']['id'], 5)
+
+    def test_decodes_lazily_and_caches(self):
+        v = view(self.table)
+        self.table.count = 3
+        self.assertEqual(v['count'], 3)
+        self.table.count = 4
+        self.assertEqual(v['count'], 3)
+
+    def test_read_only(self):
+        v = view(self.table)
+        with self.assertRaises(TypeError):
+            v['count'] = 1
+        self.assertTrue(v.buffer.readonly)
+        self.assertEqual(len(v.buffer), sizeof(Table))
+
+    def test_materialize(self):
+        v = view(self.table)
+        self.assertEqual(v.materialize(), resolve(self.table))
+        self.assertEqual(v['entries'].materialize(), resolve(self.table.entries))
+
+    def test_keeps_buffer_alive(self):
+        v = view(pointer(Table(count=7)))
+        self.assertEqual(v['count'], 7)
@@ -0,0 +1,78 @@
+from collections import Counter
+from unittest import TestCase, mock
+
+from maya.winapi.advapi32 import Advapi32
+from maya.winapi.types import TokenInformationClass
+from maya.winutils import osinfo
+from test.helpers import SimulatedWindows, simulate
+
+
+class TestTokenCache(TestCase):
+    def setUp(self):
+        self.system = SimulatedWindows(accounts=("alice", "users"))
+        self.system.groups["alice"] = [("users", 7)]
+        simulate(self, self.system)
+        batch = mock.patch.object(osinfo.Advapi32, "GetTokenInformationBatch",
+                                  wraps=osinfo.Advapi32.GetTokenInformationBatch)
+        self.batch = batch.start()
+        self.addCleanup(batch.stop)
+        self.token = osinfo.Token(self.system.open_token("alice", session=0))
+        self.addCleanup(delattr, self, "token")
+
+    @property
+    def calls(self):
+        """How many times each information class was read"""
+        return Counter(self.system.token_queries)
+
+    def test_fetched_once(self):
+        for _ in range(3):
+            self.assertEqual(self.token.user.name, "alice")
+            self.assertEqual([p.name for p in self.token.privileges], ["SeDebugPrivilege"])
+            self.assertEqual(self.token.groups[0].attributes, 7)
+        self.assertIs(self.token.user, self.token.user)
+        self.assertEqual(self.calls, {TokenInformationClass.TokenUser: 1, TokenInformationClass.TokenPrivileges: 1,
+                                      TokenInformationClass.TokenGroups: 1})
+
+    def test_session_zero(self):
+        self.assertEqual(self.token.session_id, 0)
+        self.assertEqual(self.token.session_id, 0)
+        self.assertEqual(self.calls[TokenInformationClass.TokenSessionId], 1)
+
+    def test_str_batched(self):
+        self.token.user
+        str(self.token)
+        str(self.token)
+        self.assertEqual([list(c.args[1]) for c in self.batch.call_args_list],
+                         [[TokenInformationClass.TokenSessionId, TokenInformationClass.TokenGroups,
+                           TokenInformationClass.TokenPrivileges]])
+        self.assertEqual(sum(self.calls.values()), 4)
+
+    def test_refresh(self):
+        self.token.prefetch(TokenInformationClass.TokenUser, TokenInformationClass.TokenPrivileges)
+        self.token.refresh(TokenInformationClass.TokenPrivileges)
+        self.token.user
+        self.token.privileges
+        self.assertEqual(self.calls[TokenInformationClass.TokenUser], 1)
+        self.assertEqual(self.calls[TokenInformationClass.TokenPrivileges], 2)
+        self.token.refresh()
+        self.token.user
+        self.assertEqual(self.calls[TokenInformationClass.TokenUser], 2)
+
+    def test_adjust_invalidates(self):
+        self.assertEqual(self.token.privileges[0].attributes, 0)
+        self.token.enable_privilege("SeDebugPrivilege")
+        self.assertEqual(self.token.privileges[0].attributes, 2)
+
+    def test_other_classes(self):
+        with self.assertRaises(OSError):
+            self.token.information(TokenInformationClass.TokenOwner)
+        # Failures aren't kept
+        with self.assertRaises(OSError):
+            self.token.information(TokenInformationClass.TokenOwner)
+        self.assertEqual(self.calls[TokenInformationClass.TokenOwner], 2)
+
+    def test_wrapper_returns_dictionaries(self):
+        user = Advapi32.GetTokenInformation(self.token._hToken, TokenInformationClass.TokenUser)
+        self.assertIsInstance(user, dict)
+        batch = Advapi32.GetTokenInformationBatch(self.token._hToken, [TokenInformationClass.TokenUser])
+        self.assertIsInstance(batch[0], dict)
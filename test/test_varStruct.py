@@ -0,0 +1,115 @@
+from unittest import TestCase
+from ctypes import *
+
+from maya.ctypeshelper import StructView, dict2struct, get_union_resolver, resolve, var_sizeof, view
+from maya.winapi.types import DWORD, LUID, LUID_AND_ATTRIBUTES, PSID, SECURITY_MAX_SID_SIZE, SID_AND_ATTRIBUTES, \
+    TOKEN_GROUPS, TOKEN_PRIVILEGES, TokenInformation, TokenInformationClass
+
+
+def blob(cls, entries):
+    """A variable-length structure as a function would return it: the count, then the entries packed after it"""
+    count, array = cls._fields_
+    data = bytes(DWORD(len(entries))).ljust(getattr(cls, array[0]).offset, b'\0')
+    data += b''.join(bytes(x) for x in entries)
+    return bytearray(data.ljust(sizeof(cls), b'\0'))
+
+
+def luid(n):
+    return LUID(*n.to_bytes(sizeof(LUID), 'little'))
+
+
+def privileges_blob(count):
+    return blob(TOKEN_PRIVILEGES, [LUID_AND_ATTRIBUTES(luid(100 + i), i) for i in range(count)])
+
+
+class TestVarStruct(TestCase):
+    def test_sizeof(self):
+        self.assertEqual(var_sizeof(TOKEN_PRIVILEGES, 3),
+                         TOKEN_PRIVILEGES.Privileges.offset + 3 * sizeof(LUID_AND_ATTRIBUTES))
+        self.assertEqual(var_sizeof(TOKEN_PRIVILEGES, 0), sizeof(TOKEN_PRIVILEGES))
+
+    def test_not_variable_length(self):
+        class Fixed(Structure):
+            _fields_ = [("a", c_int)]
+
+        with self.assertRaises(ValueError):
+            var_sizeof(Fixed, 1)
+
+    def test_resolve_reads_count_entries(self):
+        blob = privileges_blob(3)
+        p = resolve(TOKEN_PRIVILEGES.from_buffer(blob))
+        self.assertEqual(p['PrivilegeCount'], 3)
+        self.assertEqual(len(p['Privileges']), 3)
+        self.assertEqual(p['Privileges'][2]['Luid'], bytes(luid(102)))
+        self.assertEqual([x['Attributes'] for x in p['Privileges']], [0, 1, 2])
+
+    def test_resolve_empty(self):
+        p = resolve(TOKEN_PRIVILEGES.from_buffer(privileges_blob(0)))
+        self.assertEqual(p['Privileges'], [])
+
+    def test_view(self):
+        v = view(TOKEN_PRIVILEGES.from_buffer(privileges_blob(5)))
+        self.assertIsInstance(v, StructView)
+        self.assertEqual(len(v['Privileges']), 5)
+        self.assertEqual(v['Privileges'][-1]['Attributes'], 4)
+
+    def test_view_keeps_buffer_alive(self):
+        v = view(TOKEN_PRIVILEGES.from_buffer(privileges_blob(4)))
+        privileges = v['Privileges']
+        del v
+        self.assertEqual(privileges[3]['Attributes'], 3)
+
+    def test_union_member(self):
+        blob = privileges_blob(2)
+        blob += bytes(sizeof(TokenInformation))
+        u = TokenInformation.from_buffer(blob)
+        p = get_union_resolver(TokenInformation)(u, TokenInformationClass.TokenPrivileges)
+        self.assertEqual(len(p['Privileges']), 2)
+
+    def test_groups(self):
+        sids = [(c_ubyte * SECURITY_MAX_SID_SIZE)(*([1, i] + [0] * 66)) for i in range(3)]
+        data = blob(TOKEN_GROUPS, [SID_AND_ATTRIBUTES(pointer(sid), 0x10 + i) for i, sid in enumerate(sids)])
+        g = resolve(TOKEN_GROUPS.from_buffer(data))
+        self.assertEqual(len(g['Groups']), 3)
+        self.assertEqual(g['Groups'][1]['Sid'][:2], b'\x01\x01')
+        self.assertEqual(g['Groups'][2]['Attributes'], 0x12)
+
+    def test_sid_length(self):
+        # S-1-5-21-1000, ending its buffer: only the bytes of the SID are read
+        data = (c_ubyte * 16).from_buffer_copy(bytes([1, 2, 0, 0, 0, 0, 0, 5, 21, 0, 0, 0, 0xe8, 3, 0, 0]))
+        entry = SID_AND_ATTRIBUTES(cast(data, PSID), 7)
+        self.assertEqual(resolve(entry)['Sid'], bytes(data))
+        self.assertEqual(view(entry)['Sid'], bytes(data))
+        self.assertIsNone(resolve(SID_AND_ATTRIBUTES())['Sid'])
+
+    def test_dict2struct(self):
+        d = {
+            'Privileges': [{'Luid': list(bytes(luid(i))), 'Attributes': i} for i in range(5)]
+        }
+        p = dict2struct(d, TOKEN_PRIVILEGES)
+        # The count is filled in from the entries, which are stored past the declared end of the structure
+        self.assertEqual(p.PrivilegeCount, 5)
+        last = TOKEN_PRIVILEGES.Privileges.offset + 4 * sizeof(LUID_AND_ATTRIBUTES)
+        self.assertEqual(string_at(addressof(p) + last, sizeof(LUID_AND_ATTRIBUTES)),
+                         bytes(LUID_AND_ATTRIBUTES(luid(4), 4)))
+        self.assertEqual(resolve(p)['Privileges'][4]['Attributes'], 4)
+
+    def test_dict2struct_explicit_count(self):
+        d = {
+            'PrivilegeCount': 1,
+            'Privileges': [{'Luid': [0] * sizeof(LUID), 'Attributes': 2}]
+        }
+        p = dict2struct(d, TOKEN_PRIVILEGES)
+        self.assertEqual(resolve(p), {
+            'PrivilegeCount': 1,
+            'Privileges': [{'Luid': bytes(sizeof(LUID)), 'Attributes': 2}]
+        })
+
+    def test_dict2struct_wrong_count(self):
+        # Native code would read past the entries given
+        for count in (0, 3):
+            d = {
+                'PrivilegeCount': count,
+                'Privileges': [{'Luid': [0] * sizeof(LUID), 'Attributes': 2}]
+            }
+            self.assertRaises(ValueError, dict2struct, d, TOKEN_PRIVILEGES)